@@ -14,14 +14,17 @@ for license details.
 '''
 
 from warnings import warn
+from collections import OrderedDict
+from weakref import WeakValueDictionary
 from . import Component, Components
-from .utils import load_data, get_stoichiometric_coeff
+from .utils import load_data, get_stoichiometric_coeff, cache_path
 from thermosteam.utils import chemicals_user, read_only
 from thermosteam import settings
-from sympy import symbols, Matrix, simplify, lambdify
+from sympy import symbols, sympify, Matrix, simplify, lambdify, Basic
 from sympy.parsing.sympy_parser import parse_expr
 import numpy as np
 import pandas as pd
+from numba import njit
 
 __all__ = ('DynamicParameter', 'Kinetics', 'MultiKinetics',
            'Process', 'Processes', 'CompiledProcesses', )
@@ -33,6 +36,236 @@ class UndefinedProcess(AttributeError):
     def __init__(self, ID):
         super().__init__(repr(ID))
 
+#%%
+@njit(cache=True)
+def _csr_rmatvec(data, indices, indptr, x, out):
+    '''Compute `M.T @ x` for a CSR matrix `M`, writing to and returning `out`.'''
+    out[:] = 0.
+    for j in range(len(indptr)-1):
+        xj = x[j]
+        for k in range(indptr[j], indptr[j+1]):
+            out[indices[k]] += data[k] * xj
+    return out
+
+def _production_rates_kernel_source(stoichio, rate_eqs, state_sbs, param_sbs):
+    '''
+    Generate the source code of a `numba`-compiled function that returns
+    the rates of production given the array of state variables
+    and the array of parameter values.
+    '''
+    from sympy import Symbol, cse, numbered_symbols
+    from sympy.printing.pycode import PythonCodePrinter
+    printer = PythonCodePrinter({'fully_qualified_modules': True})
+    ys = [Symbol(f'_y{i}') for i in range(len(state_sbs))]
+    ps = [Symbol(f'_p{i}') for i in range(len(param_sbs))]
+    rhos = [Symbol(f'_rho{j}') for j in range(len(rate_eqs))]
+    sub = dict(zip([*state_sbs, *param_sbs], [*ys, *ps]))
+    rate_eqs = [sympify(eq).xreplace(sub) for eq in rate_eqs]
+    n_cmps = len(state_sbs) - 1
+    rates = [0]*n_cmps
+    for rho, row in zip(rhos, stoichio):
+        for i, v in enumerate(row):
+            if v != 0: rates[i] += sympify(v).xreplace(sub) * rho
+
+    x_defs, rate_eqs = cse(rate_eqs, symbols=numbered_symbols('_x'))
+    z_defs, rates = cse(rates, symbols=numbered_symbols('_z'))
+    used = set().union(*[sympify(i).free_symbols for i in
+                         [*rate_eqs, *rates, *[d[1] for d in x_defs+z_defs]]])
+    lines = ['import math', 'import numpy as np', 'from numba import njit', '',
+             '@njit(cache=True)', 'def production_rates(y, p):']
+    add = lines.append
+    for i, y in enumerate(ys):
+        if y in used: add(f'    {y} = y[{i}]')
+    for i, p in enumerate(ps):
+        if p in used: add(f'    {p} = p[{i}]')
+    for sb, expr in x_defs: add(f'    {sb} = {printer.doprint(expr)}')
+    for rho, eq in zip(rhos, rate_eqs): add(f'    {rho} = {printer.doprint(eq)}')
+    for sb, expr in z_defs: add(f'    {sb} = {printer.doprint(expr)}')
+    add(f'    r = np.zeros({n_cmps})')
+    for i, r in enumerate(rates):
+        if r != 0: add(f'    r[{i}] = {printer.doprint(r)}')
+    add('    return r')
+    return '\n'.join(lines) + '\n'
+
+def _load_kernel(src, name):
+    '''
+    Write the source code of generated `numba` functions to a file named by its
+    hash under `qsdsan.utils.cache_path` (so that compiled functions are cached
+    on disk) and return the function of the given name.
+    '''
+    import os, sys, hashlib, importlib.util
+    module_name = f'_{name}_{hashlib.sha1(src.encode()).hexdigest()[:16]}'
+    dir_path = os.path.join(cache_path, 'kernels')
+    file_path = os.path.join(dir_path, module_name+'.py')
+    try:
+        if not os.path.isfile(file_path):
+            os.makedirs(dir_path, exist_ok=True)
+            tmp_path = f'{file_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as file: file.write(src)
+            os.replace(tmp_path, file_path)
+        spec = importlib.util.spec_from_file_location(module_name, file_path)
+        module = importlib.util.module_from_spec(spec)
+        # needs to be importable for `numba` to rebuild cached functions
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+        return getattr(module, name)
+    except OSError: # cache path not writable, compile without caching
+        namespace = {}
+        exec(src.replace('@njit(cache=True)', '@njit'), namespace)
+        return namespace[name]
+
+def _parsed_processes_key(data, cmps, conserved_for, parameters):
+    '''
+    Return the content hash identifying the parsed and solved processes
+    from the given table, component conversion factors, and conservation rules.
+    '''
+    import hashlib, sympy
+    h = hashlib.sha1()
+    update = lambda x: h.update(str(x).encode())
+    update((_parsed_processes_format, sympy.__version__))
+    update(data.to_csv(sep='\t'))
+    update(cmps.IDs)
+    update(tuple(conserved_for))
+    update(tuple(parameters))
+    getfield = getattr
+    for mat in conserved_for:
+        h.update(np.asarray(getfield(cmps, f'i_{mat}'), dtype=float).tobytes())
+    return h.hexdigest()
+
+# bump when the format of the cached parsed processes changes
+_parsed_processes_format = 2
+
+def _load_parsed_processes(key):
+    '''Return cached parsed processes of the given key, None if not available or invalid.'''
+    import os, pickle
+    file_path = os.path.join(cache_path, 'processes', f'{key}.pckl')
+    if not os.path.isfile(file_path): return None
+    try:
+        with open(file_path, 'rb') as file: payload = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError) as e:
+        warn(f'discarded the corrupted cache of parsed processes at {file_path} ({e!r}).')
+        try: os.remove(file_path)
+        except OSError: pass
+        return None
+    # stale caches (e.g., of an older format) will be overwritten
+    if not isinstance(payload, dict) \
+        or payload.get('format') != _parsed_processes_format \
+        or payload.get('key') != key: return None
+    return payload['parsed']
+
+def _dump_parsed_processes(key, parsed):
+    '''Cache parsed processes to disk, ignored if the cache path is not writable.'''
+    import os, pickle
+    dir_path = os.path.join(cache_path, 'processes')
+    file_path = os.path.join(dir_path, f'{key}.pckl')
+    tmp_path = f'{file_path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(dir_path, exist_ok=True)
+        with open(tmp_path, 'wb') as file:
+            payload = {'format': _parsed_processes_format, 'key': key, 'parsed': parsed}
+            pickle.dump(payload, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, file_path)
+    except (OSError, pickle.PicklingError): pass
+
+class _Parameters(dict):
+    '''
+    Parameters shared by compiled processes. Values set through this
+    mapping are also written to the indexed numerical array that compiled
+    functions read from (if indexed), so that setting a parameter
+    (from either the processes or the individual process) costs O(1).
+    '''
+    __slots__ = ('_index', '_arr', '_stale')
+
+    def __init__(self, *args, **kwargs):
+        self._index = {}
+        self._arr = None
+        self._stale = True # whether values changed since last read
+        super().__init__(*args, **kwargs)
+
+    def __setitem__(self, k, v):
+        dict.__setitem__(self, k, v)
+        self._stale = True
+        if self._arr is not None and k in self._index:
+            try: self._arr[self._index[k]] = v
+            except TypeError: self._arr[self._index[k]] = np.nan # not yet defined
+
+    def update(self, *args, **kwargs):
+        setitem = self.__setitem__
+        for k, v in dict(*args, **kwargs).items(): setitem(k, v)
+
+class _CompiledProcessesCache:
+    '''
+    Least-recently-used cache of :class:`CompiledProcesses` objects keyed by
+    the identities of their processes. Only the `maxsize` most recently used
+    entries are strongly referenced, evicted entries are kept as weak
+    references so that they can still be reused while alive elsewhere
+    (e.g., held by a unit), but are not kept alive by the cache.
+    '''
+
+    def __init__(self, maxsize=32):
+        self._maxsize = maxsize
+        self._lru = OrderedDict()
+        self._weak = WeakValueDictionary()
+        self.hits = self.misses = self.evictions = 0
+
+    @staticmethod
+    def _key(processes):
+        # Entries (strong or weak) keep their processes alive,
+        # so the identities cannot be reused while an entry exists
+        return tuple(id(i) for i in processes)
+
+    def get(self, processes):
+        key = self._key(processes)
+        obj = self._lru.get(key)
+        if obj is None: obj = self._weak.get(key)
+        if obj is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._put(key, obj)
+        return obj
+
+    def put(self, processes, obj):
+        self._put(self._key(processes), obj)
+
+    def _put(self, key, obj):
+        lru = self._lru
+        lru[key] = obj
+        lru.move_to_end(key)
+        self._weak[key] = obj
+        while len(lru) > self._maxsize:
+            lru.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._lru.clear()
+        self._weak.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def maxsize(self):
+        '''[int] Maximum number of strongly referenced entries.'''
+        return self._maxsize
+    @maxsize.setter
+    def maxsize(self, i):
+        i = int(i)
+        if i < 0: raise ValueError(f'`maxsize` must be non-negative, not {i}.')
+        self._maxsize = i
+        lru = self._lru
+        while len(lru) > i:
+            lru.popitem(last=False)
+            self.evictions += 1
+
+    @property
+    def info(self):
+        '''[dict] Hits, misses, evictions, and sizes of the cache.'''
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'maxsize': self._maxsize,
+                'size': len(self._lru),
+                'alive': len(self._weak)}
+
 #%%
 class DynamicParameter:
     """
@@ -420,6 +653,10 @@ class Process:
     --------
     `numpy.isclose <https://numpy.org/doc/stable/reference/generated/numpy.isclose.html>`_ for ``rtol`` and ``atol`` settings.
     """
+    # Number of times kinetics of any process has been changed, checked by
+    # `CompiledProcesses` to drop functions fused from the rate equations
+    _kinetics_changes = 0
+
     def __init__(self, ID, reaction, ref_component, rate_equation=None,
                  components=None, conserved_for=('COD', 'N', 'P', 'charge'),
                  parameters=()):
@@ -436,6 +673,27 @@ class Process:
         self._dyn_params={}
         self.rate_function=None
 
+    @classmethod
+    def _from_parsed(cls, ID, reaction, ref_component, stoichiometry, rate_equation,
+                     components=None, conserved_for=('COD', 'N', 'P', 'charge'),
+                     parameters=()):
+        '''
+        Create a :class:`Process` object with already solved stoichiometric
+        coefficients and parsed rate equation, skipping the symbolic work.
+        '''
+        self = cls.__new__(cls)
+        self._ID = ID
+        self._reaction = reaction
+        self.components = self._load_chemicals(components)
+        self._ref_component = ref_component
+        self.conserved_for = conserved_for
+        self._parameters = {p: symbols(p) for p in parameters}
+        self._stoichiometry = stoichiometry
+        self._rate_equation = rate_equation
+        self._dyn_params={}
+        self.rate_function=None
+        return self
+
     def get_conversion_factors(self, as_matrix=False):
         '''
         Return conversion factors (i.e., the 'i\_' attributes of the components)
@@ -514,6 +772,7 @@ class Process:
         if self._rate_equation:
             self._rate_equation = -self._rate_equation
         self._rate_function = None
+        Process._kinetics_changes += 1
 
     @property
     def ID(self):
@@ -654,6 +913,7 @@ class Process:
             return lambda f: self.kinetics(f, parameters=parameters)
         else:
             self._rate_function = Kinetics(self, function, parameters)
+            Process._kinetics_changes += 1
 
     @property
     def rate_function(self):
@@ -665,6 +925,7 @@ class Process:
     def rate_function(self, k):
         if k is None:
             self._rate_function = None
+            Process._kinetics_changes += 1
         elif isinstance(k, Kinetics):
             if k.process is self:
                 self._rate_function = k
@@ -672,6 +933,7 @@ class Process:
                 warn(f'attempted to use {k.__repr__()} for Process: {self.ID}. '
                      f'A copy was created instead.')
                 self._rate_function = k.copy(self)
+            Process._kinetics_changes += 1
         elif callable(k):
             self.kinetics(function=k)
         else:
@@ -694,6 +956,8 @@ class Process:
         def f(state_arr, params={}):
             return lamb(*state_arr, **params)
         self.kinetics(function=f, parameters=self.parameters)
+        # flag it so that it can be fused with other processes' rate equations
+        self._rate_function._from_rate_equation = True
 
     def _normalize_stoichiometry(self, new_ref):
         isa = isinstance
@@ -933,12 +1197,26 @@ class Processes:
         """
         return Process([getattr(self, i) for i in IDs])
 
-    def compile(self, skip_checks=False, to_class=None):
-        '''Cast as a :class:`CompiledProcesses` object unless otherwise specified.'''
+    def compile(self, skip_checks=False, to_class=None, backend='numpy'):
+        '''
+        Cast as a :class:`CompiledProcesses` object unless otherwise specified.
+
+        Parameters
+        ----------
+        skip_checks : bool, optional
+            Not used currently. The default is False.
+        to_class : type, optional
+            A subclass of :class:`CompiledProcesses` to cast the processes as.
+            The default is None.
+        backend : str, optional
+            Backend for the evaluation of the rates of production, can be
+            "numpy" or "numba". The default is "numpy".
+        '''
         processes = tuple(self)
         setattr(self, '__class__', CompiledProcesses)
         try:
             self._compile(processes, skip_checks)
+            self.set_backend(backend)
             if to_class is not None:
                 setattr(self, '__class__', to_class)
         except Exception as error:
@@ -976,7 +1254,7 @@ class Processes:
     def load_from_file(cls, path='', components=None,
                        conserved_for=('COD', 'N', 'P', 'charge'), parameters=(),
                        use_default_data=False, store_data=False, compile=True,
-                       **compile_kwargs):
+                       use_cache=True, **compile_kwargs):
         """
         Create :class:`CompiledProcesses` object from a table of process IDs, stoichiometric
         coefficients, and rate equations stored in a .tsv, .csv, or Excel file.
@@ -1000,6 +1278,12 @@ class Processes:
             Whether to store the file as default data. The default is False.
         compile : bool, optional
             Whether to compile processes. The default is True.
+        use_cache : bool, optional
+            Whether to reuse the solved stoichiometric coefficients and parsed
+            rate equations cached on disk (under `qsdsan.utils.cache_path`)
+            from earlier loading of the same table with the same
+            component conversion factors, `conserved_for`, and `parameters`.
+            The default is True.
 
         .. note::
 
@@ -1024,32 +1308,46 @@ class Processes:
             data = load_data(path=path, index_col=None, na_values=0)
 
         cmps = _load_components(components)
+        if use_cache:
+            key = _parsed_processes_key(data, cmps, conserved_for, parameters)
+            parsed = _load_parsed_processes(key)
+        else: parsed = None
 
         cmp_IDs = [i for i in data.columns if i in cmps.IDs]
         data.dropna(how='all', subset=cmp_IDs, inplace=True)
         new = cls(())
-        for i, proc in data.iterrows():
-            ID = proc[0]
-            stoichio = proc[cmp_IDs]
-            if data.columns[-1] in cmp_IDs: rate_eq = None
-            else:
-                if pd.isna(proc[-1]): rate_eq = None
-                else: rate_eq = proc[-1]
-            stoichio = stoichio[-pd.isna(stoichio)].to_dict()
-            ref = None
-            for k,v in stoichio.items():
-                try:
-                    v = stoichio[k] = float(v)
-                    if ref is None and v in (-1, 1): ref = k
-                except: continue
-            if ref is None: ref = stoichio.keys()[0]
-            process = Process(ID, stoichio,
-                              ref_component=ref,
-                              rate_equation=rate_eq,
-                              components=cmps,
-                              conserved_for=conserved_for,
-                              parameters=parameters)
-            new.append(process)
+        if parsed is not None:
+            for ID, stoichio, ref, stoichio_coeff, rate_eq in parsed:
+                new.append(Process._from_parsed(ID, stoichio, ref, stoichio_coeff, rate_eq,
+                                                components=cmps,
+                                                conserved_for=conserved_for,
+                                                parameters=parameters))
+        else:
+            parsed = []
+            for i, proc in data.iterrows():
+                ID = proc[0]
+                stoichio = proc[cmp_IDs]
+                if data.columns[-1] in cmp_IDs: rate_eq = None
+                else:
+                    if pd.isna(proc[-1]): rate_eq = None
+                    else: rate_eq = proc[-1]
+                stoichio = stoichio[-pd.isna(stoichio)].to_dict()
+                ref = None
+                for k,v in stoichio.items():
+                    try:
+                        v = stoichio[k] = float(v)
+                        if ref is None and v in (-1, 1): ref = k
+                    except: continue
+                if ref is None: ref = stoichio.keys()[0]
+                process = Process(ID, stoichio,
+                                  ref_component=ref,
+                                  rate_equation=rate_eq,
+                                  components=cmps,
+                                  conserved_for=conserved_for,
+                                  parameters=parameters)
+                new.append(process)
+                parsed.append((ID, stoichio, ref, process._stoichiometry, process._rate_equation))
+            if use_cache: _dump_parsed_processes(key, parsed)
 
         if store_data:
             cls._default_data = data
@@ -1070,28 +1368,50 @@ class CompiledProcesses(Processes):
 
     """
 
-    _cache = {}
+    _cache = _CompiledProcessesCache()
 
     def __new__(cls, processes):
         cache = cls._cache
         processes = tuple(processes)
-        if processes in cache:
-            self = cache[processes]
-        else:
+        self = cache.get(processes)
+        if self is None:
             self = object.__new__(cls)
             setfield = setattr
             for i in processes:
                 setfield(self, i.ID, i)
-            self._compile()
-            cache[processes] = self
+            self._compile(processes)
+            cache.put(processes, self)
         return self
 
+    @classmethod
+    def cache_info(cls):
+        """
+        Return a dict of the number of hits, misses, and evictions of the cache
+        of :class:`CompiledProcesses` objects, along with its maximum size,
+        the number of strongly referenced entries (size),
+        and the number of entries that are still alive (alive).
+        """
+        return cls._cache.info
+
+    @classmethod
+    def clear_cache(cls):
+        """Clear the cache of :class:`CompiledProcesses` objects and reset its counters."""
+        cls._cache.clear()
+
+    @classmethod
+    def set_cache_size(cls, maxsize):
+        """Set the maximum number of strongly referenced entries in the cache."""
+        cls._cache.maxsize = maxsize
+
     # def __dir__(self):
     #     pass
 
-    def compile(self, skip_checks=False):
-        """Do nothing, :class:`CompiledProcesses` objects are already compiled."""
-        pass
+    def compile(self, skip_checks=False, backend=None):
+        """
+        Do nothing, :class:`CompiledProcesses` objects are already compiled,
+        other than switching to the given backend (if provided).
+        """
+        if backend is not None: self.set_backend(backend)
 
     def _compile(self, processes, skip_checks=False):
         dct = self.__dict__
@@ -1118,7 +1438,7 @@ class CompiledProcesses(Processes):
             cmps = processes[0]._components
         dct['_components'] = _load_components(cmps)
         M_stch = []
-        params = {}
+        params = _Parameters()
         dyn_params = {}
         rate_eqs = tuple_([i._rate_equation for i in processes])
         all_numeric = True
@@ -1144,6 +1464,14 @@ class CompiledProcesses(Processes):
         else:
             dct['_production_rates'] = None
         dct['_rate_function'] = None
+        dct['_param_index'] = {}
+        dct['_param_arr'] = None
+        dct['_backend'] = 'numpy'
+        dct['_kinetics_changes'] = Process._kinetics_changes
+        dct['_production_rates_kernel'] = None
+        dct['_production_rates_source'] = None
+        dct['_rate_jacobian'] = None
+        dct['_rate_eqs_lambdified'] = None
 
     @property
     def parameters(self):
@@ -1154,12 +1482,23 @@ class CompiledProcesses(Processes):
         '''Append new symbolic parameters'''
         for p in new_pars:
             self._parameters[p] = symbols(p)
+        if self._param_arr is not None:
+            # compiled functions are bound to the old parameter array
+            dct = self.__dict__
+            dct['_param_index'] = {}
+            dct['_param_arr'] = None
+            self._parameters._arr = None
+            dct['_stoichio_lambdified'] = None
+            dct['_production_rates_kernel'] = None
+            dct['_production_rates_source'] = None
+            dct['_rate_jacobian'] = None
+            dct['_rate_eqs_lambdified'] = None
+            if getattr(self._rate_function, '_fused', False):
+                dct['_rate_function'] = None
 
     def set_parameters(self, **parameters):
         '''Set values to stoichiometric and/or kinetic parameters.'''
         self._parameters.update(parameters)
-        if self._stoichio_lambdified is not None:
-            self.__dict__['_stoichio_lambdified'] = None
 
     def dynamic_parameter(self, function=None, symbol=None, params={}):
         '''Add a function for the evaluation of a dynamic parameter in the
@@ -1177,8 +1516,13 @@ class CompiledProcesses(Processes):
     def params_eval(self, state_arr):
         '''Evaluate the dynamic parameters in the stoichiometry given an array of state variables.'''
         dct = self._parameters
+        setitem = dict.__setitem__ # bypass marking parameters as changed
+        idx = self._param_index
+        arr = self._param_arr
         for k, p in self._dyn_params.items():
-            dct[k] = p(state_arr)
+            v = p(state_arr)
+            setitem(dct, k, v)
+            if k in idx: arr[idx[k]] = v
 
     @property
     def stoichiometry(self):
@@ -1196,31 +1540,82 @@ class CompiledProcesses(Processes):
         else: return pd.DataFrame(stoichio, index=self.IDs, columns=self._components.IDs)
 
     def _lambdify_stoichio(self):
-        dct = self._dyn_params
-        dct_vals = self._parameters
-        if dct:
-            sbs = [i.symbol for i in dct.values()]
-            lamb = lambdify(sbs, self._stoichiometry, 'numpy')
-            arr = np.empty((self.size, len(self._components)))
-            def f():
-                v = [v for k,v in dct_vals.items() if k in dct.keys()]
-                arr[:,:] = lamb(*v)
-                return arr
-            self.__dict__['_stoichio_lambdified'] = f
-        else:
-            try:
-                stoichio_arr = self.stoichiometry.to_numpy(dtype=float)
-            except TypeError:
-                isa = isinstance
-                undefined = [k for k, v in dct_vals if not isa(v, (float, int))]
-                raise TypeError(f'Undefined static parameters: {undefined}')
-            self.__dict__['_stoichio_lambdified'] = lambda : stoichio_arr
+        '''
+        Compile the stoichiometry into a CSR matrix. Nonzero coefficients
+        depending on parameters are lambdified as functions of the indexed
+        parameter array and recomputed in place: those depending on dynamic
+        parameters on every evaluation, the others only after parameters are set.
+        '''
+        from scipy.sparse import csr_matrix
+        if self._param_arr is None: self._index_parameters()
+        dyn_params = self._dyn_params
+        params = self._parameters
+        param_sbs = list(symbols(tuple(self._param_index.keys())))
+        data, indices, indptr = [], [], [0]
+        static_pos, static_coeffs = [], []
+        dyn_pos, dyn_coeffs = [], []
+        isa = isinstance
+        for row in self._stoichiometry:
+            for i, v in enumerate(row):
+                if isa(v, Basic):
+                    if v.is_number: v = float(v)
+                    else:
+                        if any(str(sb) in dyn_params for sb in v.free_symbols):
+                            dyn_pos.append(len(data))
+                            dyn_coeffs.append(v)
+                        else:
+                            static_pos.append(len(data))
+                            static_coeffs.append(v)
+                        v = np.nan
+                if v != 0:
+                    data.append(v)
+                    indices.append(i)
+            indptr.append(len(data))
+        idx = self._param_index
+        arr = self._param_arr
+        undefined = set(str(sb) for v in static_coeffs+dyn_coeffs for sb in v.free_symbols)
+        undefined = [k for k in undefined if k not in dyn_params and (k not in idx or np.isnan(arr[idx[k]]))]
+        if undefined:
+            raise TypeError(f'Undefined static parameters: {sorted(undefined)}')
+        M = csr_matrix((np.array(data, dtype=float),
+                        np.array(indices, dtype=np.int32),
+                        np.array(indptr, dtype=np.int32)),
+                       shape=(self.size, len(self._components)))
+        M_data = M.data
+        # dense array returned by `stoichio_eval`, with the nonzeros copied from `M`
+        rows = np.repeat(np.arange(self.size), np.diff(M.indptr))
+        self.__dict__['_stoichio_dense'] = (np.zeros(M.shape), rows)
+        lamb_static = lambdify([param_sbs], static_coeffs, 'numpy') if static_pos else None
+        lamb_dyn = lambdify([param_sbs], dyn_coeffs, 'numpy') if dyn_pos else None
+        static_pos = np.array(static_pos, dtype=int)
+        dyn_pos = np.array(dyn_pos, dtype=int)
+        if lamb_static: M_data[static_pos] = lamb_static(arr)
+        params._stale = False
+        def f():
+            if params._stale:
+                if lamb_static: M_data[static_pos] = lamb_static(arr)
+                params._stale = False
+            if lamb_dyn: M_data[dyn_pos] = lamb_dyn(arr)
+            return M
+        self.__dict__['_stoichio_lambdified'] = f
 
-    def stoichio_eval(self):
-        '''Return the stoichiometric coefficients.'''
+    @property
+    def stoichio_csr(self):
+        '''
+        [scipy.sparse.csr_matrix] Stoichiometric coefficients (processes by components)
+        holding only the nonzeros, evaluated with the current parameter values.
+        The same matrix is updated in place on each access.
+        '''
         if self._stoichio_lambdified is None: self._lambdify_stoichio()
         return self._stoichio_lambdified()
 
+    def stoichio_eval(self):
+        '''Return the stoichiometric coefficients.'''
+        M = self.stoichio_csr
+        arr, rows = self._stoichio_dense
+        arr[rows, M.indices] = M.data
+        return arr
+
     @property
     def rate_equations(self):
         '''[pandas.DataFrame] Rate equations.'''
@@ -1231,6 +1626,7 @@ class CompiledProcesses(Processes):
     @property
     def rate_function(self):
         '''[:class:`MultiKinetics`] The function to evaluate the kinetic rates of the processes.'''
+        if self._kinetics_changes != Process._kinetics_changes: self._check_kinetics()
         if self._rate_function is None:
             self._collect_rate_func()
         return self._rate_function
@@ -1250,7 +1646,175 @@ class CompiledProcesses(Processes):
                             f'not {type(k)}')
 
     def _collect_rate_func(self):
-        self.__dict__['_rate_function'] = MultiKinetics(self)
+        dct = self.__dict__
+        if self._has_symbolic_kinetics():
+            dct['_rate_function'] = mk = MultiKinetics(self, function=self._lambdify_rate_eqs(),
+                                                       params={})
+            mk._fused = True
+        else:
+            dct['_rate_function'] = MultiKinetics(self)
+
+    def _check_kinetics(self):
+        '''
+        Drop the functions compiled from the rate equations if the kinetics
+        of any of the processes has been replaced since the compilation.
+        '''
+        dct = self.__dict__
+        dct['_kinetics_changes'] = Process._kinetics_changes
+        rf = dct['_rate_function']
+        fused = rf is not None and getattr(rf, '_fused', False)
+        if not fused and dct['_backend'] == 'numpy' and dct['_rate_jacobian'] is None: return
+        if self._has_symbolic_kinetics(): return
+        if fused: dct['_rate_function'] = None
+        dct['_rate_eqs_lambdified'] = None
+        dct['_rate_jacobian'] = None
+        dct['_production_rates_kernel'] = None
+        if dct['_backend'] == 'numba':
+            warn(f'kinetics of the processes in {self} are no longer all defined by '
+                 'rate equations, backend is switched back to "numpy".')
+            dct['_backend'] = 'numpy'
+
+    def _has_symbolic_kinetics(self):
+        '''Whether the kinetics of all processes are defined by their rate equations.'''
+        if self._production_rates is None: return False
+        getfield = getattr
+        rf = self._rate_function
+        if rf is not None and not getfield(rf, '_fused', False): return False
+        for p in self.tuple:
+            rho = p._rate_function
+            if rho is not None and not getfield(rho, '_from_rate_equation', False):
+                return False
+        return True
+
+    def _index_parameters(self):
+        '''
+        Index all parameters into a numerical array that the compiled functions
+        read from, the array is kept in sync when parameters are set
+        (through :func:`set_parameters` of the processes or any of the process)
+        and when dynamic parameters are evaluated in :func:`params_eval`.
+        '''
+        dct = self.__dict__
+        params = self._parameters
+        if not isinstance(params, _Parameters): # e.g., replaced by subclasses
+            dct['_parameters'] = params = _Parameters(params)
+        keys = tuple(params.keys())
+        dct['_param_index'] = idx = dict(zip(keys, range(len(keys))))
+        dct['_param_arr'] = arr = np.empty(len(keys))
+        params._index = idx
+        params._arr = arr
+        self._update_param_arr()
+
+    def _update_param_arr(self, parameters=None):
+        '''Write numerical parameter values into the indexed parameter array.'''
+        idx = self._param_index
+        arr = self._param_arr
+        parameters = self._parameters if parameters is None else parameters
+        for k, v in parameters.items():
+            if k not in idx: continue
+            try: arr[idx[k]] = v
+            except TypeError: arr[idx[k]] = np.nan # not yet defined
+
+    def _check_parameters(self, exprs):
+        free_sbs = set().union(*[sympify(i).free_symbols for i in exprs])
+        state_IDs = set(self._components.IDs + ('Q',))
+        idx = self._param_index
+        arr = self._param_arr
+        dyn_params = self._dyn_params
+        undefined = []
+        for sb in free_sbs:
+            k = str(sb)
+            if k in state_IDs or k in dyn_params: continue
+            if k not in idx or np.isnan(arr[idx[k]]): undefined.append(k)
+        if undefined:
+            raise TypeError(f'Undefined parameters: {sorted(undefined)}')
+
+    def _lambdify_rate_eqs(self):
+        '''
+        Return a single function that evaluates the rate equations of all processes
+        with the indexed parameter array.
+        '''
+        if self._param_arr is None: self._index_parameters()
+        rate_eqs = list(self._rate_equations)
+        self._check_parameters(rate_eqs)
+        state_sbs = list(symbols(self._components.IDs+('Q',)))
+        var = [state_sbs, list(symbols(tuple(self._param_index.keys())))]
+        try: lamb = lambdify(var, rate_eqs, 'numpy', cse=True)
+        except TypeError: # `cse` is only supported for sympy>=1.9
+            lamb = lambdify(var, rate_eqs, 'numpy')
+        self.__dict__['_rate_eqs_lambdified'] = lamb
+        param_arr = self._param_arr
+        idx = self._param_index
+        arr = param_arr.copy()
+        n = len(state_sbs)
+        rho_arr = np.empty(self.size)
+        def f(state_arr, params):
+            if params:
+                # parameters given to the function override the indexed values
+                arr[:] = param_arr
+                for k, v in params.items():
+                    if k not in idx:
+                        raise TypeError(f'{k} is not a parameter of the rate equations.')
+                    arr[idx[k]] = v
+                rho_arr[:] = lamb(state_arr[:n], arr)
+            else: rho_arr[:] = lamb(state_arr[:n], param_arr)
+            return rho_arr
+        return f
+
+    @property
+    def backend(self):
+        '''
+        [str] Backend for the evaluation of the rates of production, either "numpy"
+        or "numba", use :func:`set_backend` to change it.
+        '''
+        if self._kinetics_changes != Process._kinetics_changes: self._check_kinetics()
+        return self._backend
+
+    def set_backend(self, backend):
+        '''
+        Set the backend for the evaluation of the rates of production.
+
+        Parameters
+        ----------
+        backend : str
+            With "numpy", stoichiometry and rate functions are evaluated separately.
+            With "numba", the stoichiometry and rate equations are generated into
+            a single `numba`-compiled function on the first evaluation,
+            only applicable when all processes have rate equations.
+            The compiled function is cached on disk (under `qsdsan.utils.cache_path`)
+            for later sessions.
+        '''
+        backend = backend.lower()
+        if backend not in ('numpy', 'numba'):
+            raise ValueError(f'backend must be "numpy" or "numba", not "{backend}".')
+        if backend == 'numba' and not self._has_symbolic_kinetics():
+            raise RuntimeError('the "numba" backend is only applicable when all processes '
+                               'have rate equations and no user-defined kinetics.')
+        dct = self.__dict__
+        if backend == dct['_backend']: return
+        dct['_backend'] = backend
+        dct['_production_rates_kernel'] = None
+
+    def _get_production_rates_source(self):
+        '''
+        Return the source code of the `numba`-compiled function `production_rates(y, p)`,
+        which can be extended with functions calling it (e.g., the right-hand side
+        of a reactor) and loaded with :func:`_load_kernel`.
+        '''
+        src = self._production_rates_source
+        if src is None:
+            if self._param_arr is None: self._index_parameters()
+            stoichio = self._stoichiometry
+            rate_eqs = list(self._rate_equations)
+            self._check_parameters(rate_eqs + [v for row in stoichio for v in row])
+            state_sbs = list(symbols(self._components.IDs+('Q',)))
+            param_sbs = list(symbols(tuple(self._param_index.keys())))
+            src = _production_rates_kernel_source(stoichio, rate_eqs, state_sbs, param_sbs)
+            self.__dict__['_production_rates_source'] = src
+        return src
+
+    def _compile_production_rates_kernel(self):
+        src = self._get_production_rates_source()
+        self.__dict__['_production_rates_kernel'] = _load_kernel(src, 'production_rates')
 
     # def rate_eval(self, state_arr):
     #     '''Return the kinetic rates given an array of state variables.'''
@@ -1267,10 +1831,132 @@ class CompiledProcesses(Processes):
 
     def production_rates_eval(self, state_arr):
         '''Return the rates of production or consumption of the components.'''
+        if self._kinetics_changes != Process._kinetics_changes: self._check_kinetics()
+        if self._backend == 'numba':
+            if self._production_rates_kernel is None:
+                self._compile_production_rates_kernel()
+            self.params_eval(state_arr)
+            return self._production_rates_kernel(state_arr, self._param_arr)
+        self.params_eval(state_arr)
+        M = self.stoichio_csr
+        rho_arr = np.asarray(self.rate_function(state_arr), dtype=float)
+        return _csr_rmatvec(M.data, M.indices, M.indptr, rho_arr, np.empty(M.shape[1]))
+
+    def production_rates_batch_eval(self, state_mat):
+        '''
+        Return the rates of production or consumption of the components for
+        multiple sets of state variables (e.g., tanks in series, Monte Carlo
+        replicates, or time steps of a recorded trajectory) at once.
+
+        Parameters
+        ----------
+        state_mat : numpy.ndarray
+            2D array with each row being an array of state variables
+            as for :func:`production_rates_eval`.
+
+        Returns
+        -------
+        numpy.ndarray
+            2D array of the rates of production, one row per set of state variables.
+
+        Notes
+        -----
+        The evaluation is vectorized over the rows when all processes have
+        rate equations and there are no dynamic parameters, otherwise
+        :func:`production_rates_eval` is called for each row.
+        '''
+        state_mat = np.atleast_2d(np.asarray(state_mat, dtype=float))
+        if self._dyn_params or not self._has_symbolic_kinetics():
+            f = self.production_rates_eval
+            return np.array([f(state_arr) for state_arr in state_mat])
+        if self._rate_eqs_lambdified is None: self._collect_rate_func()
+        n = len(self._components) + 1
+        rhos = self._rate_eqs_lambdified(state_mat[:, :n].T, self._param_arr)
+        rho_mat = np.empty((self.size, state_mat.shape[0]))
+        for j, rho in enumerate(rhos): rho_mat[j] = rho
+        return (self.stoichio_csr.T @ rho_mat).T
+
+    def _lambdify_rate_jacobian(self):
+        '''
+        Differentiate the rate equations with regard to the component concentrations
+        and lambdify the nonzero derivatives into a single function.
+        '''
+        if not self._has_symbolic_kinetics():
+            raise RuntimeError('analytical Jacobian is only available when all processes '
+                               'have rate equations and no user-defined kinetics.')
+        if self._param_arr is None: self._index_parameters()
+        rate_eqs = [sympify(eq) for eq in self._rate_equations]
+        self._check_parameters(rate_eqs)
+        cmps = self._components
+        state_sbs = list(symbols(cmps.IDs+('Q',)))
+        rows, cols, derivs = [], [], []
+        for j, eq in enumerate(rate_eqs):
+            free_sbs = eq.free_symbols
+            for k, sb in enumerate(state_sbs[:-1]):
+                if sb not in free_sbs: continue
+                d = eq.diff(sb)
+                if d != 0:
+                    rows.append(j)
+                    cols.append(k)
+                    derivs.append(d)
+        var = [state_sbs, list(symbols(tuple(self._param_index.keys())))]
+        try: lamb = lambdify(var, derivs, 'numpy', cse=True)
+        except TypeError: # `cse` is only supported for sympy>=1.9
+            lamb = lambdify(var, derivs, 'numpy')
+        param_arr = self._param_arr
+        n = len(state_sbs)
+        drho = np.zeros((self.size, cmps.size))
+        rows, cols = np.array(rows, dtype=int), np.array(cols, dtype=int)
+        def f(state_arr):
+            drho[rows, cols] = lamb(state_arr[:n], param_arr)
+            return drho
+        # Structural nonzeros of the Jacobian of the rates of production
+        stoichio = np.array([[v != 0 for v in row] for row in self._stoichiometry], dtype=bool)
+        drho_nz = np.zeros(drho.shape, dtype=bool)
+        drho_nz[rows, cols] = True
+        dct = self.__dict__
+        dct['_rate_jacobian'] = f
+        dct['_jacobian_sparsity'] = stoichio.T.astype(int) @ drho_nz.astype(int) > 0
+
+    @property
+    def jacobian_sparsity(self):
+        '''
+        [numpy.ndarray] Boolean array (n_components by n_components) of the
+        structural nonzeros of the Jacobian of the rates of production.
+        '''
+        if self._rate_jacobian is None: self._lambdify_rate_jacobian()
+        return self._jacobian_sparsity
+
+    def production_rates_jacobian_eval(self, state_arr, sparse=False):
+        '''
+        Return the Jacobian of the rates of production of the components
+        with regard to the component concentrations, i.e.,
+        `J[i, k] = d(rate_i)/d(C_k)`, given an array of state variables.
+
+        Parameters
+        ----------
+        state_arr : numpy.ndarray
+            Array of state variables (component concentrations followed by
+            flow rate and exogenous dynamic variables, if any).
+        sparse : bool, optional
+            Whether to return a `scipy.sparse.csr_matrix` with the fixed structure
+            given by :attr:`jacobian_sparsity` rather than a dense array.
+            The default is False.
+
+        Notes
+        -----
+        Derivatives are generated from the rate equations symbolically,
+        dynamic parameters are evaluated at the given state but treated as
+        constants in the differentiation.
+        '''
+        if self._rate_jacobian is None: self._lambdify_rate_jacobian()
         self.params_eval(state_arr)
-        M_stoichio = self.stoichio_eval()
-        rho_arr = self.rate_function(state_arr)
-        return np.dot(M_stoichio.T, rho_arr)
+        J = self.stoichio_csr.T @ self._rate_jacobian(state_arr)
+        if sparse:
+            from scipy.sparse import csr_matrix
+            rows, cols = np.nonzero(self._jacobian_sparsity)
+            return csr_matrix((J[rows, cols], (rows, cols)), shape=J.shape)
+        return J
 
     def subgroup(self, IDs):
         '''Create a new subgroup of :class:`CompiledProcesses` objects.'''
@@ -44,7 +44,13 @@ from . import (
     Unit,
     WasteStream,
     )
-from .utils import SanUnitScope, ExogenousDynamicVariable as EDV
+from .utils import (
+    SanUnitScope,
+    ExogenousDynamicVariable as EDV,
+    get_block_diagonal_jacobian,
+    get_system_jacobian_sparsity,
+    )
+from .utils.dynamics import _get_exovar_group
 
 __all__ = ('SanUnit',)
 
@@ -284,6 +290,7 @@ class SanUnit(Unit, isabstract=True):
         self._ins_QC = np.zeros((len(self._ins), len(self.components)+1))
         self._ins_dQC = self._ins_QC.copy()
         self._ODE = None
+        self._ODE_jac = None
         self._AE = None
         if not hasattr(self, '_mock_dyn_sys'):
             self._mock_dyn_sys = System(self.ID+'_dynmock', path=(self,))
@@ -397,6 +404,17 @@ class SanUnit(Unit, isabstract=True):
         kwargs : dict
             Keyword arguments that will be passed to ``biosteam.systeam.dynamic_run``
             (useful when running dynamic simulation).
+            For implicit solvers (i.e., "BDF", "Radau", or "LSODA"),
+            unless `jac` or `jac_sparsity` is provided,
+            the analytical Jacobian (if available) will be used when the unit
+            is the only one with ODEs in its system and its process model
+            has no dynamic parameters, otherwise the structural
+            nonzeros of the Jacobian (if available) will be passed
+            as `jac_sparsity` to "BDF" and "Radau".
+            Set `jac` to "analytical" to use the Jacobian assembled by
+            :func:`qsdsan.utils.get_block_diagonal_jacobian` regardless,
+            which neglects the coupling between units and treats
+            dynamic parameters as constants.
 
         See Also
         --------
@@ -409,6 +427,22 @@ class SanUnit(Unit, isabstract=True):
             sys = self._mock_dyn_sys
             sys._feeds = self.ins
             sys._products = self.outs
+            method = kwargs.get('method')
+            jac = kwargs.get('jac')
+            if isinstance(jac, str):
+                if jac != 'analytical':
+                    raise ValueError(f'`jac` can only be "analytical" if given as a str, not "{jac}".')
+                kwargs['jac'] = get_block_diagonal_jacobian(sys)
+            elif method in ('BDF', 'Radau', 'LSODA') and 'jac' not in kwargs \
+                and 'jac_sparsity' not in kwargs:
+                n_ode = sum(u.hasode for u in sys.units)
+                # dynamic parameters are held constant in the analytical Jacobian
+                dyn_params = getattr(getattr(self, '_model', None), '_dyn_params', None)
+                if n_ode == 1 and not dyn_params and self.ODE_jacobian is not None:
+                    kwargs['jac'] = get_block_diagonal_jacobian(sys)
+                elif method != 'LSODA' \
+                    and getattr(self, 'jacobian_sparsity', None) is not None:
+                    kwargs['jac_sparsity'] = get_system_jacobian_sparsity(sys)
             sys.simulate(**kwargs)
             self._summary()
 
@@ -511,7 +545,13 @@ class SanUnit(Unit, isabstract=True):
 
     def eval_exo_dynamic_vars(self, t):
         '''Evaluates the exogenous dynamic variables at time t.'''
-        return [var(t) for var in self._exovars]
+        return self._get_exo_group()(t).tolist()
+
+    def _get_exo_group(self):
+        # all variables are evaluated together and written into one array,
+        # which is shared by units with the same exogenous dynamic variables
+        # and only updated once per time
+        return _get_exovar_group(self._exovars)
 
     @property
     def scope(self):
@@ -533,6 +573,17 @@ class SanUnit(Unit, isabstract=True):
         """Whether this unit's dynamic states are determined by ordinary differential equations."""
         return hasattr(self, '_compile_ODE')
 
+    @property
+    def ODE_jacobian(self):
+        '''
+        [callable or NoneType] Jacobian of the unit's ODEs with regard to its
+        own state (with inlets held constant), takes the same `t`, `QC_ins`,
+        and `QC` arguments as the ODEs, None if not available.
+        '''
+        if not hasattr(self, '_compile_ODE_jacobian'): return None
+        if getattr(self, '_ODE_jac', None) is None: self._compile_ODE_jacobian()
+        return self._ODE_jac or None
+
     def reset_cache(self, dynamic_system=False):
         '''Reset cached states for dynamic units.'''
         super().reset_cache()
@@ -262,7 +262,7 @@ class WasteStream(SanStream):
     `thermosteam.Stream <https://thermosteam.readthedocs.io/en/latest/Stream.html>`_
     '''
 
-    __slots__ = SanStream.__slots__ + _ws_specific_slots
+    __slots__ = SanStream.__slots__ + _ws_specific_slots + ('_port',)
     _default_ratios = _default_ratios
     ticket_name = 'ws'
 
@@ -306,6 +306,7 @@ class WasteStream(SanStream):
         self._ratios = ratios
         self._state = None
         self._dstate = None
+        self._port = None
 
     @staticmethod
     def from_stream(stream, ID='', **kwargs):
@@ -997,7 +998,7 @@ class WasteStream(SanStream):
         SanStream.mix_from(self, others, **kwargs)
 
         for slot in _ws_specific_slots:
-            if not hasattr(self, slot):
+            if slot == '_scope' or not hasattr(self, slot): # see notes in `copy`
                 continue
             #!!! This needs reviewing, might not be good to calculate some
             # attributes like pH
@@ -1153,12 +1154,27 @@ class WasteStream(SanStream):
         self.set_flow(M_bulk, 'kg/hr', bulk_liquid_ID)
         return self.F_vol*1e3 - target_Q
 
+    def _inlet_rows(self):
+        # Views of the stream's state and dstate in the inlet arrays of its sink,
+        # the cached port is only used while the stream is at the same inlet
+        # of the same sink and the inlet arrays have not been recreated
+        sink = self._sink
+        QC, dQC = sink._ins_QC, sink._ins_dQC
+        port = getattr(self, '_port', None)
+        if port is not None:
+            cached_sink, cached_QC, cached_dQC, i, row, drow = port
+            if cached_sink is sink and cached_QC is QC and cached_dQC is dQC:
+                ins = sink.ins
+                if i < len(ins) and ins[i] is self: return row, drow
+        i = sink.ins.index(self)
+        row, drow = QC[i], dQC[i]
+        self._port = (sink, QC, dQC, i, row, drow)
+        return row, drow
+
     @property
     def state(self):
         if self.isproduct(): return self._state
-        else:
-            i = self._sink._ins.index(self)
-            return self._sink._ins_QC[i]
+        return self._inlet_rows()[0]
 
     @state.setter
     def state(self, y):
@@ -1166,15 +1182,12 @@ class WasteStream(SanStream):
             try: self._state[:] = y
             except TypeError: self._state = y
         else:
-            i = self._sink._ins.index(self)
-            self._sink._ins_QC[i,:] = y
+            self._inlet_rows()[0][:] = y
 
     @property
     def dstate(self):
         if self.isproduct(): return self._dstate
-        else:
-            i = self._sink._ins.index(self)
-            return self._sink._ins_dQC[i]
+        return self._inlet_rows()[1]
 
     @dstate.setter
     def dstate(self, dy):
@@ -1183,8 +1196,7 @@ class WasteStream(SanStream):
             except TypeError: self._dstate = dy
             # decide whether to record state over time
         else:
-            i = self._sink._ins.index(self)
-            self._sink._ins_dQC[i,:] = dy
+            self._inlet_rows()[1][:] = dy
 
     @property
     def scope(self):
@@ -1207,6 +1219,7 @@ class WasteStream(SanStream):
         self._scope = s
 
     def _init_state(self):
+        self._port = None # the stream might have been moved
         self.state = np.append(self.conc.astype('float64'), self.get_total_flow('m3/d'))
         self.dstate = np.zeros_like(self.state)
 
@@ -19,7 +19,7 @@ from chemicals.elements import molecular_weight as get_mw
 from qsdsan import Component, Components, Process, Processes, CompiledProcesses
 import numpy as np
 from qsdsan.utils import ospath, data_path
-from scipy.optimize import brenth
+from numba import njit
 from warnings import warn
 
 __all__ = ('create_adm1_cmps', 'ADM1',
@@ -196,22 +196,46 @@ def T_correction_factor(T1, T2, delta_H):
 #     pKas = np.asarray(pKas)
 #     return 10**(-pKas) * T_correction_factor(T_base, T_op, theta)
 
+@njit(cache=True)
 def acid_base_rxn(h_ion, weak_acids_tot, Kas):
     # h, nh4, hco3, ac, pr, bu, va = mols
     # S_cat, S_an, S_IN, S_IC, S_ac, S_pro, S_bu, S_va = weak_acids_tot  # in M
-    S_cat, S_an, S_IN = weak_acids_tot[:3]
     # Kw, Ka_nh, Ka_co2, Ka_ac, Ka_pr, Ka_bu, Ka_va = Kas
-    Kw = Kas[0]
-    oh_ion = Kw/h_ion
-    nh3, hco3, ac, pro, bu, va = Kas[1:] * weak_acids_tot[2:] / (Kas[1:] + h_ion)
-    return S_cat + h_ion + (S_IN - nh3) - S_an - oh_ion - hco3 - ac - pro - bu - va
-
+    S_cat, S_an, S_IN = weak_acids_tot[0], weak_acids_tot[1], weak_acids_tot[2]
+    oh_ion = Kas[0]/h_ion
+    # nh3, hco3, ac, pro, bu, va
+    bases = 0.
+    for i in range(1, 7):
+        bases += Kas[i] * weak_acids_tot[i+1] / (Kas[i] + h_ion)
+    return S_cat + h_ion + S_IN - S_an - oh_ion - bases
+
+@njit(cache=True)
 def fprime_abr(h_ion, weak_acids_tot, Kas):
-    S_cat, S_an, S_IN = weak_acids_tot[:3]
-    Kw = Kas[0]
-    doh_ion = - Kw / h_ion ** 2
-    dnh3, dhco3, dac, dpro, dbu, dva = - Kas[1:] * weak_acids_tot[2:] / (Kas[1:] + h_ion)**2
-    return 1 + (-dnh3) - doh_ion - dhco3 - dhco3 - dac - dpro - dbu - dva
+    doh_ion = - Kas[0] / h_ion ** 2
+    dbases = 0.
+    for i in range(1, 7):
+        dbases -= Kas[i] * weak_acids_tot[i+1] / (Kas[i] + h_ion)**2
+    return 1 - doh_ion - dbases
+
+@njit(cache=True)
+def solve_h_ion(weak_acids_tot, Kas, h_guess, lb=1e-14, ub=1.0, rtol=1e-12, maxiter=100):
+    '''
+    Solve the charge balance for the concentration of H+ [M] using Newton's method
+    started from `h_guess`, with bisection (in log scale) within the bracket [`lb`, `ub`]
+    when the Newton step falls outside of the bracket.
+    '''
+    h = h_guess if lb < h_guess < ub else 1e-7
+    for _ in range(maxiter):
+        f = acid_base_rxn(h, weak_acids_tot, Kas)
+        # the charge balance monotonically increases with H+
+        if f > 0: ub = h
+        elif f < 0: lb = h
+        else: return h
+        h_new = h - f/fprime_abr(h, weak_acids_tot, Kas)
+        if not lb < h_new < ub: h_new = (lb*ub) ** 0.5
+        if abs(h_new - h) <= rtol * h_new: return h_new
+        h = h_new
+    return h
 
 def pH_inhibit(pH, ul, ll, lower_only=True):
     if lower_only:
@@ -228,85 +252,104 @@ def Hill_inhibit(H_ion, ul, ll):
     return 1/(1+(H_ion/K) ** n)
 
 rhos = np.zeros(22) # 22 kinetic processes
-Cs = np.empty(19)
-
-def rhos_adm1(state_arr, params):
-    ks = params['rate_constants']
-    Ks = params['half_sat_coeffs']
-    cmps = params['components']
-    # n = len(cmps)
-    pH_ULs = params['pH_ULs']
-    pH_LLs = params['pH_LLs']
-    KS_IN = params['KS_IN']
-    KI_nh3 = params['KI_nh3']
-    KIs_h2 = params['KIs_h2']
-    KHb = params['K_H_base']
-    Kab = params['Ka_base']
-    KH_dH = params['K_H_dH']
-    Ka_dH = params['Ka_dH']
-    kLa = params['kLa']
-    T_base = params['T_base']
-    root = params['root']
 
-    # Cs_ids = cmps.indices(['X_c', 'X_ch', 'X_pr', 'X_li', 'X_su', 'X_aa',
-    #                        'X_fa', 'X_c4', 'X_c4', 'X_pro', 'X_ac', 'X_h2',
-    #                        'X_su', 'X_aa', 'X_fa', 'X_c4', 'X_pro', 'X_ac', 'X_h2'])
-    # Cs = state_arr[Cs_ids]
-    Cs[:8] = state_arr[12:20]
-    Cs[8:12] = state_arr[19:23]
-    Cs[12:] = state_arr[16:23]
-    # substrates_ids = cmps.indices(['S_su', 'S_aa', 'S_fa', 'S_va',
-    #                                'S_bu', 'S_pro', 'S_ac', 'S_h2'])
-    # substrates = state_arr[substrates_ids]
-    substrates = state_arr[:8]
-    # S_va, S_bu, S_h2, S_IN = state_arr[cmps.indices(['S_va', 'S_bu', 'S_h2', 'S_IN'])]
-    # S_va, S_bu, S_h2, S_ch4, S_IC, S_IN = state_arr[[3,4,7,8,9,10]]
-    S_va, S_bu, S_h2, S_IN = state_arr[[3,4,7,10]]
-    unit_conversion = mass2mol_conversion(cmps)
-    cmps_in_M = state_arr[:27] * unit_conversion
-    weak_acids = cmps_in_M[[24, 25, 10, 9, 6, 5, 4, 3]]
-
-    T_op = state_arr[-1]
-    biogas_S = state_arr[7:10].copy()
-    biogas_p = R * T_op * state_arr[27:30]
-    Kas = Kab * T_correction_factor(T_base, T_op, Ka_dH)
-    KH = KHb * T_correction_factor(T_base, T_op, KH_dH) / unit_conversion[7:10]
-
-    rhos[:-3] = ks * Cs
-    Monod = substr_inhibit(substrates, Ks)
-    rhos[4:12] *= Monod
+@njit(cache=True)
+def _rhos_adm1_kernel(state_arr, ks, Ks, pH_ULs, pH_LLs, KIs_h2, Ka_base, Ka_dH,
+                      K_H_base, K_H_dH, scalars, unit_conversion, h_guess,
+                      rhos, diagnostics):
+    KS_IN, KI_nh3, kLa, T_base = scalars[0], scalars[1], scalars[2], scalars[3]
+    # Cs of X_c, X_ch, X_pr, X_li, X_su, X_aa, X_fa, X_c4, X_c4, X_pro, X_ac, X_h2,
+    # X_su, X_aa, X_fa, X_c4, X_pro, X_ac, X_h2
+    for i in range(8): rhos[i] = ks[i] * state_arr[12+i]
+    for i in range(8, 12): rhos[i] = ks[i] * state_arr[11+i]
+    for i in range(12, 19): rhos[i] = ks[i] * state_arr[4+i]
+    for i in range(8):
+        S = state_arr[i]
+        Monod = S/(Ks[i]+S)
+        diagnostics[15+i] = Monod
+        rhos[4+i] *= Monod
+    S_va, S_bu, S_h2, S_IN = state_arr[3], state_arr[4], state_arr[7], state_arr[10]
     if S_va > 0: rhos[7] *= 1/(1+S_bu/S_va)
     if S_bu > 0: rhos[8] *= 1/(1+S_va/S_bu)
 
-    h = brenth(acid_base_rxn, 1e-14, 1.0,
-            args=(weak_acids, Kas),
-            xtol=1e-12, maxiter=100)
-    # h = 10**(-7.46)
+    # S_cat, S_an, S_IN, S_IC, S_ac, S_pro, S_bu, S_va in M
+    weak_acids = np.empty(8)
+    for i, j in enumerate((24, 25, 10, 9, 6, 5, 4, 3)):
+        weak_acids[i] = state_arr[j] * unit_conversion[j]
+    T_op = state_arr[-1]
+    dT = 1/T_base - 1/T_op
+    Kas = Ka_base * np.exp(Ka_dH/(R*100) * dT)
+    h = solve_h_ion(weak_acids, Kas, h_guess[0])
+    h_guess[0] = h
 
     nh3 = Kas[1] * weak_acids[2] / (Kas[1] + h)
     co2 = weak_acids[3] - Kas[2] * weak_acids[3] / (Kas[2] + h)
-    biogas_S[-1] = co2 / unit_conversion[9]
-    
-    Iph = Hill_inhibit(h, pH_ULs, pH_LLs)
-    Iin = substr_inhibit(S_IN, KS_IN)
-    Ih2 = non_compet_inhibit(S_h2, KIs_h2)
-    Inh3 = non_compet_inhibit(nh3, KI_nh3)
-    rhos[4:12] *= Iph * Iin
-    rhos[6:10] *= Ih2
-    # rhos[4:12] *= Hill_inhibit(h, pH_ULs, pH_LLs) * substr_inhibit(S_IN, KS_IN)
-    # rhos[6:10] *= non_compet_inhibit(S_h2, KIs_h2)
+    Iin = S_IN/(KS_IN+S_IN)
+    Inh3 = KI_nh3/(KI_nh3+nh3)
+    diagnostics[0] = -np.log10(h)
+    for i in range(8):
+        ul, ll = pH_ULs[i], pH_LLs[i]
+        Iph = 1/(1+(h/10**(-(ul+ll)/2)) ** (3/(ul-ll)))
+        diagnostics[1+i] = Iph
+        rhos[4+i] *= Iph * Iin
+    for i in range(4):
+        Ih2 = KIs_h2[i]/(KIs_h2[i]+S_h2)
+        diagnostics[9+i] = Ih2
+        rhos[6+i] *= Ih2
     rhos[10] *= Inh3
-    root.data = {
-        'pH':-np.log10(h), 
-        'Iph':Iph, 
-        'Ih2':Ih2, 
-        'Iin':Iin, 
-        'Inh3':Inh3,
-        'Monod':Monod,
-        'rhos':rhos[4:12].copy()
-        }
-    rhos[-3:] = kLa * (biogas_S - KH * biogas_p)
-    # print(rhos)
+    diagnostics[13] = Iin
+    diagnostics[14] = Inh3
+
+    # liquid-gas transfer of S_h2, S_ch4, S_IC
+    for i in range(3):
+        S = co2/unit_conversion[9] if i == 2 else state_arr[7+i]
+        KH = K_H_base[i] * np.exp(K_H_dH[i]/(R*100) * dT) / unit_conversion[7+i]
+        rhos[19+i] = kLa * (S - KH * R * T_op * state_arr[27+i])
+    return rhos
+
+class _ADM1KineticParams(dict):
+    '''
+    Kinetic parameters of ADM1, packed into arrays for the compiled rate kernel
+    upon evaluation. Arrays are referenced rather than copied,
+    so in-place changes remain effective, and setting a new value
+    repacks the parameters.
+    '''
+    __slots__ = ('_packed',)
+
+    def __init__(self, *args, **kwargs):
+        self._packed = None
+        super().__init__(*args, **kwargs)
+
+    def __setitem__(self, k, v):
+        dict.__setitem__(self, k, v)
+        self._packed = None
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self._packed = None
+
+    @property
+    def packed(self):
+        '''[tuple] Arguments of the compiled rate kernel.'''
+        if self._packed is None: self._packed = _pack_adm1_params(self)
+        return self._packed
+
+def _pack_adm1_params(params):
+    asarray = lambda k: np.asarray(params[k], dtype=float)
+    return (*(asarray(k) for k in ('rate_constants', 'half_sat_coeffs',
+                                   'pH_ULs', 'pH_LLs', 'KIs_h2',
+                                   'Ka_base', 'Ka_dH', 'K_H_base', 'K_H_dH')),
+            np.array([params[k] for k in ('KS_IN', 'KI_nh3', 'kLa', 'T_base')], dtype=float),
+            np.asarray(mass2mol_conversion(params['components']), dtype=float),
+            np.array([1e-7]), # warm start of H+ concentration
+            )
+
+def rhos_adm1(state_arr, params):
+    if isinstance(params, _ADM1KineticParams): packed = params.packed
+    else: packed = _pack_adm1_params(params)
+    root = params['root']
+    _rhos_adm1_kernel(state_arr, *packed, rhos, root._buffer)
+    root._buffer[23:] = rhos[4:12]
     return rhos
 
 #%%
@@ -314,11 +357,75 @@ def rhos_adm1(state_arr, params):
 # ADM1 class
 # =============================================================================
 class TempState:
+    '''
+    Intermediate results of the latest evaluation of ADM1 kinetic rates,
+    i.e., pH, inhibition factors, Monod terms, and rates of substrate uptake.
+    Diagnostics are off by default, when enabled, intermediate results are
+    recorded by the reactor into a preallocated ring buffer after dynamic
+    simulation, recomputed at the states of the accepted solver steps
+    rather than at the trial states evaluated by the solver.
+    '''
+    dtype = np.dtype([('t', float), ('pH', float), ('Iph', float, 8),
+                      ('Ih2', float, 4), ('Iin', float), ('Inh3', float),
+                      ('Monod', float, 8), ('rhos', float, 8)])
+
     def __init__(self):
-        self.data = []
-    
-    # def append(self, value):
-    #     self.data += [value]
+        # all fields but t, written by the rate kernel in place
+        self._buffer = np.zeros(self.dtype.itemsize//8 - 1)
+        self._record = None
+        self._head = self._n = 0
+
+    @property
+    def data(self):
+        '''[dict] Intermediate results of the latest evaluation.'''
+        row = np.zeros(1, dtype=self.dtype)
+        row.view(float)[1:] = self._buffer
+        return {k: row[k][0] for k in self.dtype.names[1:]}
+
+    @property
+    def enabled(self):
+        '''[bool] Whether diagnostics are being recorded.'''
+        return self._record is not None
+
+    def enable(self, size=10000):
+        '''Start recording diagnostics into a ring buffer of `size` time points.'''
+        self._record = np.zeros(int(size), dtype=self.dtype)
+        self._head = self._n = 0
+
+    def disable(self):
+        '''Stop recording and discard the recorded diagnostics.'''
+        self._record = None
+        self._head = self._n = 0
+
+    def reset_cache(self):
+        '''Discard the recorded diagnostics, but continue recording (if enabled).'''
+        self._head = self._n = 0
+
+    def __call__(self, t):
+        '''
+        Record the intermediate results of the latest evaluation at time `t`,
+        discarding the recorded ones at or after `t`.
+        '''
+        rcd = self._record
+        if rcd is None: return
+        size = rcd.shape[0]
+        head, n = self._head, self._n
+        while n and rcd[head-1]['t'] >= t: # solver stepped back
+            head = (head - 1) % size
+            n -= 1
+        row = rcd[head:head+1].view(float)
+        row[0] = t
+        row[1:] = self._buffer
+        self._head = (head + 1) % size
+        self._n = min(n + 1, size)
+
+    @property
+    def record(self):
+        '''[numpy.ndarray] Recorded diagnostics as a structured array in chronological order.'''
+        rcd = self._record
+        if rcd is None: return None
+        n = self._n
+        return rcd[(self._head - n + np.arange(n)) % rcd.shape[0]]
 
 @chemicals_user
 class ADM1(CompiledProcesses):
@@ -579,17 +686,18 @@ class ADM1(CompiledProcesses):
                          f_ac_fa, 1-f_ac_fa, f_pro_va, f_ac_va, 1-f_pro_va-f_ac_va,
                          f_ac_bu, 1-f_ac_bu, f_ac_pro, 1-f_ac_pro,
                          Y_su, Y_aa, Y_fa, Y_c4, Y_pro, Y_ac, Y_h2)
-        pH_LLs = np.array([pH_limits_aa[0]]*6 + [pH_limits_ac[0], pH_limits_h2[0]])
-        pH_ULs = np.array([pH_limits_aa[1]]*6 + [pH_limits_ac[1], pH_limits_h2[1]])
+        # float arrays are packed as views, so that in-place setters take effect
+        pH_LLs = np.array([pH_limits_aa[0]]*6 + [pH_limits_ac[0], pH_limits_h2[0]], dtype=float)
+        pH_ULs = np.array([pH_limits_aa[1]]*6 + [pH_limits_ac[1], pH_limits_h2[1]], dtype=float)
         ks = np.array((q_dis, q_ch_hyd, q_pr_hyd, q_li_hyd,
                        k_su, k_aa, k_fa, k_c4, k_c4, k_pro, k_ac, k_h2,
-                       b_su, b_aa, b_fa, b_c4, b_pro, b_ac, b_h2))
-        Ks = np.array((K_su, K_aa, K_fa, K_c4, K_c4, K_pro, K_ac, K_h2))
-        KIs_h2 = np.array((KI_h2_fa, KI_h2_c4, KI_h2_c4, KI_h2_pro))
-        K_H_base = np.array(K_H_base)
-        K_H_dH = np.array(K_H_dH)
-        Ka_base = np.array([10**(-pKa) for pKa in pKa_base])
-        Ka_dH = np.array(Ka_dH)
+                       b_su, b_aa, b_fa, b_c4, b_pro, b_ac, b_h2), dtype=float)
+        Ks = np.array((K_su, K_aa, K_fa, K_c4, K_c4, K_pro, K_ac, K_h2), dtype=float)
+        KIs_h2 = np.array((KI_h2_fa, KI_h2_c4, KI_h2_c4, KI_h2_pro), dtype=float)
+        K_H_base = np.array(K_H_base, dtype=float)
+        K_H_dH = np.array(K_H_dH, dtype=float)
+        Ka_base = np.array([10**(-pKa) for pKa in pKa_base], dtype=float)
+        Ka_dH = np.array(Ka_dH, dtype=float)
         root = TempState()
         # root.data = 10**(-7.4655)
         dct = self.__dict__
@@ -597,7 +705,7 @@ class ADM1(CompiledProcesses):
 
         self.set_rate_function(rhos_adm1)
         dct['_parameters'] = dict(zip(cls._stoichio_params, stoichio_vals))
-        self.rate_function._params = dict(zip(cls._kinetic_params,
+        self.rate_function._params = _ADM1KineticParams(zip(cls._kinetic_params,
                                               [ks, Ks, pH_ULs, pH_LLs, KS_IN*N_mw,
                                                KI_nh3, KIs_h2, Ka_base, Ka_dH,
                                                K_H_base, K_H_dH, kLa,
@@ -657,6 +765,28 @@ class ADM1(CompiledProcesses):
         '''Set inhibition coefficient for free ammonia [M].'''
         self.rate_function._params['KI_nh3'] = K
 
+    def enable_diagnostics(self, size=10000):
+        '''
+        Record pH, inhibition factors, Monod terms, and substrate uptake rates
+        at the accepted solver steps of dynamic simulations (recomputed after
+        the simulation), keeping the latest `size` time points.
+        Diagnostics are off by default.
+        '''
+        self.rate_function._params['root'].enable(size)
+
+    def disable_diagnostics(self):
+        '''Stop recording diagnostics and discard the recorded data.'''
+        self.rate_function._params['root'].disable()
+
+    @property
+    def diagnostics(self):
+        '''
+        [numpy.ndarray] Recorded diagnostics as a structured array with fields
+        of "t", "pH", "Iph", "Ih2", "Iin", "Inh3", "Monod", and "rhos",
+        None if not enabled.
+        '''
+        return self.rate_function._params['root'].record
+
     def set_parameters(self, **parameters):
         '''Set values to stoichiometric parameters in `ADM1._stoichio_params`.'''
         non_stoichio = {}
@@ -668,8 +798,6 @@ class ADM1(CompiledProcesses):
         if non_stoichio:
             warn(f'ignored value setting for non-stoichiometric parameters {non_stoichio}')
         self.check_stoichiometric_parameters()
-        if self._stoichio_lambdified is not None:
-            self.__dict__['_stoichio_lambdified'] = None
 
     def check_stoichiometric_parameters(self):
         '''Check whether product COD fractions sum up to 1 for each process.'''
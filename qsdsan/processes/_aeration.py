@@ -341,7 +341,7 @@ class DiffusedAeration(Process):
 
     @KLa.setter
     def KLa(self, KLa):
-        self._KLa = KLa or self._calc_KLa()
+        self._KLa = self._calc_KLa() if KLa is None else KLa # 0 turns aeration off
         self.set_parameters(KLa=self._KLa)
 
     @property
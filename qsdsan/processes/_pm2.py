@@ -693,8 +693,6 @@ class PM2(CompiledProcesses):
         '''Set values to stoichiometric and/or kinetic parameters.'''
         stoichio_only = {k:v for k,v in parameters.items() if k in self._stoichio_params}
         self._parameters.update(stoichio_only)
-        if self._stoichio_lambdified is not None:
-            self.__dict__['_stoichio_lambdified'] = None
         if 'Q_N_min' in parameters.keys():
             if parameters['Q_N_min'] < self.Th_Q_N_min: 
                 raise ValueError(f'Value for Q_N_min must not be less than the '
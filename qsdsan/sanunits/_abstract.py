@@ -257,25 +257,49 @@ class Splitter(SanUnit, BSTSplitter):
         else:
             return dict(zip(list(self.components.IDs) + ['Q'], self._state))
 
+    @property
+    def split(self):
+        '''[SparseArray] Componentwise split of feed to 0th outlet stream.'''
+        return self._isplit.data
+    @split.setter
+    def split(self, values):
+        split = self.split
+        if split is not values:
+            split[:] = values
+        if getattr(self, '_split_out0_state', None) is not None:
+            self._update_split_states() # e.g., changed by a controller during simulation
+
+    def _update_split_states(self):
+        s = self.split
+        s_flow = s[self.components.index('H2O')]
+        s0, s1 = self._split_out0_state, self._split_out1_state
+        s0[:-1] = s/s_flow
+        s0[-1] = s_flow
+        s1[:-1] = (1-s)/(1-s_flow)
+        s1[-1] = 1-s_flow
+
     def _init_state(self):
         self._state = self._ins_QC[0]
         self._dstate = self._state * 0.
-        s = self.split
-        s_flow = s[self.components.index('H2O')]
-        self._split_out0_state = np.append(s/s_flow, s_flow)
-        self._split_out1_state = np.append((1-s)/(1-s_flow), 1-s_flow)
+        self._split_out0_state = np.zeros(len(self._state))
+        self._split_out1_state = np.zeros(len(self._state))
+        self._update_split_states()
 
     def _update_state(self):
         '''updates conditions of output stream based on conditions of the Splitter'''
         arr = self._state
-        self._outs[0].state = self._split_out0_state * arr
-        self._outs[1].state = self._split_out1_state * arr
+        for ws, s in zip(self._outs, (self._split_out0_state, self._split_out1_state)):
+            y = ws.state # written in place when available
+            if y is None: ws.state = s * arr
+            else: np.multiply(s, arr, out=y)
 
     def _update_dstate(self):
         '''updates rates of change of output stream from rates of change of the Splitter'''
         arr = self._dstate
-        self._outs[0].dstate = self._split_out0_state * arr
-        self._outs[1].dstate = self._split_out1_state * arr
+        for ws, s in zip(self._outs, (self._split_out0_state, self._split_out1_state)):
+            y = ws.dstate
+            if y is None: ws.dstate = s * arr
+            else: np.multiply(s, arr, out=y)
 
     @property
     def AE(self):
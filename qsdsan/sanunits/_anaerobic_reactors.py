@@ -290,7 +290,6 @@ class AnaerobicCSTR(CSTR):
         self._f_retain = np.array([fraction_retain if cmp.ID in retain_cmps \
                                    else 0 for cmp in self.components])
         self._mixed = WasteStream()
-        self._tempstate = []
     
     def ideal_gas_law(self, p=None, S=None):
         '''Calculates partial pressure [bar] given concentration [M] at 
@@ -471,8 +470,13 @@ class AnaerobicCSTR(CSTR):
         gas.state[-1] = self._q_gas
         gas.state[:n_cmps] = gas.state[:n_cmps] * chem_MW / i_mass * 1e3 # i.e., M biogas to mg (measured_unit) / L
 
+    @property
+    def _tempstate(self):
+        '''[dict] Intermediate results of the latest evaluation of the kinetic rates (if any).'''
+        try: return self._model.rate_function._params['root'].data
+        except (AttributeError, KeyError, TypeError): return {}
+
     def _update_dstate(self):
-        self._tempstate = self.model.rate_function._params['root'].data.copy()
         dy = self._dstate
         f_rtn = self._f_retain
         n_cmps = len(self.components)
@@ -516,6 +520,40 @@ class AnaerobicCSTR(CSTR):
         if self._ODE is None:
             self._compile_ODE()
         return self._ODE
+
+    # the analytical Jacobian and sparsity of `CSTR` do not cover the gas phase
+    jacobian_sparsity = None
+    def _compile_ODE_jacobian(self):
+        self._ODE_jac = False # not available
+
+    _diagnosed_sol = None
+    def _record_diagnostics(self):
+        # the intermediates are recomputed at the states of the solution,
+        # as the solver also evaluates the rates at trial states
+        root = self._model.rate_function.params.get('root') if self._model else None
+        if not getattr(root, 'enabled', False): return
+        sys = self.system
+        sol = getattr(getattr(sys, 'scope', None), 'sol', None)
+        if sol is None or sol is self._diagnosed_sol: return
+        self._diagnosed_sol = sol
+        start, stop = sys._state_idx[self.ID]
+        n = stop - start
+        hasexo = bool(len(self._exovars))
+        f_exovars = self._get_exo_group()
+        QC = np.zeros(n+len(self._exovars))
+        f_param = self._model.params_eval
+        f_rhos = self._model.rate_function
+        root.reset_cache()
+        for t, y in zip(sol.t, sol.y.T):
+            QC[:n] = y[start:stop]
+            if hasexo: QC[n:] = f_exovars(t)
+            f_param(QC)
+            f_rhos(QC)
+            root(t)
+
+    def _summary(self, *args, **kwargs):
+        self._record_diagnostics()
+        super()._summary(*args, **kwargs)
     
     def _compile_ODE(self):
         if self._model is None:
@@ -534,7 +572,8 @@ class AnaerobicCSTR(CSTR):
             V_gas = self.V_gas
             gas_mass2mol_conversion = (cmps.i_mass / cmps.chem_MW)[self._gas_cmp_idx]
             hasexo = bool(len(self._exovars))
-            f_exovars = self.eval_exo_dynamic_vars
+            f_exovars = self._get_exo_group()
+            y = np.zeros(len(_dstate)+len(self._exovars)) # state with the exogenous variables
             # _rQ = self._rQ
             if self._fixed_P_gas:
                 f_qgas = self.f_q_gas_fixed_P_headspace
@@ -552,8 +591,9 @@ class AnaerobicCSTR(CSTR):
                 S_ins = QC_ins[:, :-1] * 1e-3  # mg/L to kg/m3
                 Q = sum(Q_ins)
                 if hasexo:
-                    exo_vars = f_exovars(t)
-                    QC = np.append(QC, exo_vars)
+                    y[:len(QC)] = QC
+                    y[len(QC):] = exo_vars = f_exovars(t)
+                    QC = y
                     T = exo_vars[0]
                 else: T = self.T
                 _f_param(QC)
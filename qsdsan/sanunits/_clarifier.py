@@ -12,6 +12,8 @@ for license details.
 '''
 
 from numpy import maximum as npmax, minimum as npmin, exp as npexp
+from math import exp
+from numba import njit
 from .. import SanUnit, WasteStream
 import numpy as np
 
@@ -24,11 +26,42 @@ def _settling_flux(X, v_max, v_max_practical, X_min, rh, rp, n0):
     v = npmin(v_max_practical, v_max*(npexp(-rh*X_star) - npexp(-rp*X_star)))
     return X*npmax(v, n0)
 
-# from math import exp
-# def _settling_flux(X, v_max, v_max_practical, X_min, rh, rp, n0):
-#     X_star = max(X-X_min, 0)
-#     v = min(v_max_practical, v_max*(exp(-rh*X_star) - exp(-rp*X_star)))
-#     return X*max(v, 0)
+@njit(cache=True, error_model='numpy')
+def dydt_layered_clarifier(QC_ins, dQC_ins, QC, x, imass, Q_s, jf, fns, X_t,
+                           v_max, v_max_practical, rh, rp, A, hj, V,
+                           VX, dX_comp, dQC):
+    m = x.shape[0]
+    n = VX.shape[0]
+    Q_in = QC_ins[0, -1]
+    Q_e = Q_in - Q_s
+    X_in = 0.   # influent TSS
+    dX_in = 0.
+    for i in range(m):
+        X_in += QC_ins[0, i] * imass[i] * x[i]
+        dX_in += dQC_ins[0, i] * imass[i] * x[i]
+    X_min = X_in * fns
+    X = QC[m+1:]    # (n, ), TSS for each layer
+    #***********TSS*************
+    for j in range(n):
+        X_star = max(X[j]-X_min, 0.)
+        v = min(v_max_practical, v_max*(exp(-rh*X_star) - exp(-rp*X_star)))
+        VX[j] = X[j] * max(v, 0.)
+    settle_in = 0.
+    for j in range(n):
+        if j < jf: flow = Q_e * (X[j+1] - X[j])
+        elif j == jf: flow = Q_in * (X_in - X[j])
+        else: flow = Q_s * (X[j-1] - X[j])
+        if j == n-1: settle_out = 0.
+        elif j < jf and X[j+1] < X_t: settle_out = VX[j]
+        else: settle_out = min(VX[j], VX[j+1])
+        dQC[m+1+j] = (flow/A + settle_in - settle_out)/hj
+        settle_in = settle_out
+    #*********solubles**********
+    for i in range(m):
+        dQC[i] = Q_in * (QC_ins[0, i] - QC[i]) * (1-x[i]) / V
+        # instrumental variables
+        dX_comp[i] = (dQC_ins[0, i] * X_in - dX_in * QC_ins[0, i]) * x[i] / X_in**2
+    dQC[m] = dQC_ins[0, -1]
 
 
 class FlatBottomCircularClarifier(SanUnit):
@@ -53,7 +86,8 @@ class FlatBottomCircularClarifier(SanUnit):
     height : float, optional
         Height of the clarifier, in [m]. The default is 4.
     N_layer : int, optional
-        The number of layers to model settling. The default is 10.
+        The number of layers to model settling, the height of each layer
+        will be updated when changed. The default is 10.
     feed_layer : int, optional
         The feed layer counting from top to bottom. The default is 4.
     X_threshold : float, optional
@@ -73,6 +107,12 @@ class FlatBottomCircularClarifier(SanUnit):
         Non-settleable fraction of the suspended solids, dimensionless. Must be within
         [0, 1]. The default is 2.28e-3.
 
+    Notes
+    -----
+    The settling model is compiled with `numba` and writes into preallocated
+    arrays, the TSS of each layer is only coupled with the adjacent layers,
+    see :attr:`jacobian_sparsity` and :attr:`jacobian_bandwidth`.
+
     References
     ----------
     .. [1] Takács, I.; Patry, G. G.; Nolasco, D. A Dynamic Model of the Clarification
@@ -163,7 +203,18 @@ class FlatBottomCircularClarifier(SanUnit):
 
     @N_layer.setter
     def N_layer(self, N):
-        self._N_layer = int(N)
+        N = int(N)
+        if N < 2: raise ValueError('N_layer must be an integer no less than 2.')
+        if self._feed_layer > N:
+            raise ValueError(f'feed layer {self._feed_layer} is out of range, '
+                             f'N_layer must be no less than {self._feed_layer}.')
+        n = self._N_layer
+        # keep the height of the clarifier
+        self._hj *= n / N
+        self._state_header = self._state_header[:-n] + [f'TSS{i+1} [mg/L]' for i in range(N)]
+        if self._solids is not None and len(self._solids) != N: self._solids = None
+        self._N_layer = N
+        self._ODE = None
 
     @property
     def feed_layer(self):
@@ -283,59 +334,41 @@ class FlatBottomCircularClarifier(SanUnit):
     def _update_state(self):
         arr = self._state
         x = self.components.x
-        n = self._N_layer
-        Q_e = arr[-(1+n)] - self._Qras - self._Qwas
-        Z = arr[:len(x)]
-        inf, = self.ins
-        imass = self.components.i_mass
-        C_in = inf.state[:-1]
-        X_composition = self._X_comp = C_in*x/sum(C_in*imass*x)
-        X_e = arr[-n] * X_composition
+        m, n = len(x), self._N_layer
+        Q_e = arr[m] - self._Qras - self._Qwas
+        Z = arr[:m]
+        C_in = self._ins_QC[0,:-1] # state of the influent
+        X_composition = C_in * x
+        X_composition /= X_composition @ self.components.i_mass
+        self._X_comp = X_composition
         C_s = Z + arr[-1] * X_composition
         eff, ras, was = self._outs
-        if eff.isproduct() and eff.state is None: 
-            eff.state = np.append(Z+X_e, Q_e)
-        else:
-            eff.state[:-1] = Z+X_e   # not sure if this works for a setter
-            eff.state[-1] = Q_e
         #!!! might need to enable dynamic sludge volume flows
-        if ras.isproduct() and ras.state is None: 
-            ras.state = np.append(C_s, self._Qras)
-        else: 
-            ras.state[:-1] = C_s
-            ras.state[-1] = self._Qras
-        if was.isproduct() and was.state is None: 
-            was.state = np.append(C_s, self._Qwas)
-        else: 
-            was.state[:-1] = C_s
-            was.state[-1] = self._Qwas
+        for ws, C, Q in ((eff, Z + arr[-n] * X_composition, Q_e),
+                         (ras, C_s, self._Qras), (was, C_s, self._Qwas)):
+            y = ws.state # written in place when available
+            if y is None: ws.state = np.append(C, Q)
+            else:
+                y[:-1] = C
+                y[-1] = Q
 
     def _update_dstate(self):
         arr = self._dstate
-        x = self.components.x
-        n = self._N_layer
-        dQ = arr[-(1+n)]
-        dZ = arr[:len(x)]
+        m, n = len(self.components), self._N_layer
+        dZ = arr[:m]
         TSS_e, TSS_s = self._state[-n], self._state[-1]
         X_composition = self._X_comp # (m, ), mg COD/ mg TSS
         dX_composition = self._dX_comp
         dC_e = dZ + arr[-n] * X_composition + dX_composition * TSS_e
         dC_s = dZ + arr[-1] * X_composition + dX_composition * TSS_s
         eff, ras, was = self._outs
-        if eff.isproduct() and eff.dstate is None: 
-            eff.dstate = np.append(dC_e, dQ)
-        else:
-            eff.dstate[:-1] = dC_e # not sure if this works for a setter
-            eff.dstate[-1] = dQ
         #!!! might need to enable dynamic sludge volume flows
-        if ras.isproduct() and ras.dstate is None: 
-            ras.dstate = np.append(dC_s, 0.)
-        else: 
-            ras.dstate[:-1] = dC_s
-        if was.isproduct() and was.dstate is None: 
-            was.dstate = np.append(dC_s, 0.)
-        else: 
-            was.dstate[:-1] = dC_s
+        for ws, dC, dQ in ((eff, dC_e, arr[m]), (ras, dC_s, 0.), (was, dC_s, 0.)):
+            y = ws.dstate
+            if y is None: ws.dstate = np.append(dC, dQ)
+            else:
+                y[:-1] = dC
+                if ws is eff: y[-1] = dQ
 
     def _run(self):
         '''only to converge volumetric flows.'''
@@ -361,74 +394,46 @@ class FlatBottomCircularClarifier(SanUnit):
             self._compile_ODE()
         return self._ODE
 
+    @property
+    def jacobian_sparsity(self):
+        '''
+        [scipy.sparse.csr_matrix] Structural nonzeros of the Jacobian of the
+        clarifier's ODEs, diagonal for the solubles and tridiagonal for
+        the TSS of the layers.
+        '''
+        from scipy.sparse import block_diag, diags
+        m = len(self.components)
+        n = self._N_layer
+        ones = np.ones(n, dtype=bool)
+        TSS = diags([ones[1:], ones, ones[1:]], [-1, 0, 1], dtype=bool)
+        # total flow is independent of the state
+        blks = [np.eye(m, dtype=bool), np.zeros((1, 1), dtype=bool), TSS]
+        return block_diag(blks, format='csr').astype(bool)
+
+    @property
+    def jacobian_bandwidth(self):
+        '''
+        [tuple] Lower and upper bandwidths of the Jacobian of the
+        clarifier's ODEs, e.g., for `lband` and `uband` of the LSODA solver.
+        '''
+        return (1, 1)
+
     def _compile_ODE(self):
         n = self._N_layer
         jf = self._feed_layer - 1
-        x = self.components.x
-        m = len(x)
-        imass = self.components.i_mass
-        fns = self._fns
-        Q_s = self._Qras + self._Qwas
-
+        x = self.components.x.astype(float)
+        imass = self.components.i_mass.astype(float)
         dQC = self._dstate
         dX_comp = self._dX_comp
         _update_dstate = self._update_dstate
-
-        nzeros = np.zeros(n)
-        Q_jout = nzeros.copy()
-        X_rolled = nzeros.copy()
-        X_min_arr = nzeros.copy()
-        settle_out = nzeros.copy()
-        settle_in = nzeros.copy()
-
-        # Make these constants into arrays so it'll be faster in `dy_dt`
-        vmax_arr = np.full_like(nzeros, self._v_max)
-        vmaxp_arr = np.full_like(nzeros, self._v_max_p)
-        rh_arr = np.full_like(nzeros, self._rh)
-        rp_arr = np.full_like(nzeros, self._rp)
-        func_vx = lambda x_arr, xmin_arr : _settling_flux(x_arr, vmax_arr, vmaxp_arr, xmin_arr, rh_arr, rp_arr, nzeros)
-        
-        A, hj, V = self._A, self._hj, self._V
-        A_arr = np.full_like(nzeros, A)
-        hj_arr = np.full_like(nzeros, hj)
-        J = np.zeros(n-1)
-        X_t_arr = np.full(jf, self._X_t)
-        Q_in_arr = np.zeros(m)
-        V_arr = np.full(m, V)
+        VX = np.zeros(n) # settling fluxes of layers
+        params = (float(self._Qras + self._Qwas), jf, float(self._fns), float(self._X_t),
+                  float(self._v_max), float(self._v_max_p), float(self._rh), float(self._rp),
+                  float(self._A), float(self._hj), float(self._V))
 
         def dy_dt(t, QC_ins, QC, dQC_ins):
-            dQC[-(n+1)] = dQC_ins[0,-1]
-            Q_in = QC_ins[0,-1]
-            Q_e = Q_in - Q_s
-            C_in = QC_ins[0,:-1]
-            dC_in = dQC_ins[0,:-1]
-            Z_in = C_in*(1-x)
-            X_in = sum(C_in*imass*x)           # influent TSS
-            dX_in = sum(dC_in*imass*x)
-            X_min_arr[:] = X_in * fns
-            X = QC[-n:]                        # (n, ), TSS for each layer
-            Z = QC[:m] * (1-x)
-            #***********TSS*************
-            Q_jout[:jf] = Q_e
-            Q_jout[jf] = Q_in
-            Q_jout[jf+1:] = Q_s
-            flow_out = X * Q_jout
-            X_rolled[:jf] = X[1: jf+1]
-            X_rolled[jf] = X_in
-            X_rolled[jf+1:] = X[jf: -1]
-            flow_in = X_rolled * Q_jout
-            VX = func_vx(X, X_min_arr)
-            J[:] = npmin(VX[:-1], VX[1:])
-            condition = (X_rolled[:jf]<X_t_arr)
-            J[:jf][condition] = VX[:jf][condition]
-            settle_out[:-1] = J
-            settle_in[1:] = J
-            dQC[-n:] = ((flow_in - flow_out)/A_arr + settle_in - settle_out)/hj_arr       # (n,)
-            #*********solubles**********
-            Q_in_arr[:] = Q_in
-            dQC[:m] = Q_in_arr*(Z_in - Z)/V_arr
-            # instrumental variables
-            dX_comp[:] = (dC_in * X_in - dX_in * C_in) * x / X_in**2
+            dydt_layered_clarifier(QC_ins, dQC_ins, QC, x, imass, *params,
+                                   VX, dX_comp, dQC)
             _update_dstate()
 
         self._ODE = dy_dt
@@ -12,7 +12,8 @@ for license details.
 
 from .. import SanUnit
 from ..utils import ospath, load_data, data_path
-from scipy.interpolate import InterpolatedUnivariateSpline, CubicSpline, interp1d
+from ..utils.dynamics import _PiecewisePolynomial
+from scipy.interpolate import InterpolatedUnivariateSpline, CubicSpline, interp1d, PPoly
 import numpy as np
 
 __all__ = ('DynamicInfluent',)
@@ -33,6 +34,9 @@ class DynamicInfluent(SanUnit):
         The file path for the time-series data. Acceptable file extensions are
         `.xlsx`, `.xls`, `.csv`, `.tsv`. If none specified, will load the default
         time-series data of dry-weather influent with components from ASM1.
+        A `.npy` file of a structured array (see :func:`to_npy`) is memory-mapped
+        instead of loaded, only a window of `window_size` time points around 
+        the simulated time is read and interpolated at a time.
     by_mass : bool, optional
         Whether time-series data indicate mass flowrates. If True, all columns
         assumed in kg/hr. If False, data are assumed to indicate concentrations
@@ -53,6 +57,9 @@ class DynamicInfluent(SanUnit):
         data as input upon initiation. Interpolant that is not at least 
         first-order differentiable is not recommended (e.g., linear interpolation).
         The default is :class:`scipy.interpolate.CubicSpline`. 
+        Splines (i.e., the default, an integer, 'slinear', 'quadratic', or 'cubic')
+        are converted into one piecewise polynomial of all variables, of which
+        values and derivatives are evaluated together in compiled code.
     derivative_approximator : callable, optional
         Function that returns derivative of the variable at given time. If none specified,
         will use the :func:`derivative` method of (if available) of the interpolant.
@@ -61,6 +68,11 @@ class DynamicInfluent(SanUnit):
         function. The default is {}.
     intpl_kwargs : dict, optional
         Keyword arguments for initiating the interpolant. The default is {}.
+    window_size : int, optional
+        Number of time points kept in memory for a memory-mapped `.npy` data file,
+        up to two windows (with their interpolation coefficients) are cached.
+        Periodic end conditions only apply when the whole data fit in one window.
+        The default is 2000.
 
     See Also
     --------
@@ -72,13 +84,16 @@ class DynamicInfluent(SanUnit):
     """
     _N_ins = 0
     _N_outs = 1
+    _N_windows = 2
     
     def __init__(self, ID='', ins=None, outs=(), data_file=None, by_mass=False, interpolator=None, 
                  derivative_approximator=None, thermo=None, init_with='WasteStream', 
-                 isdynamic=True, load_data_kwargs={}, intpl_kwargs={}, **kwargs):
+                 isdynamic=True, load_data_kwargs={}, intpl_kwargs={}, 
+                 window_size=2000, **kwargs):
         SanUnit.__init__(self, ID, None, outs, thermo, init_with, isdynamic=isdynamic)
         self.by_mass = by_mass
-        self._intpl_kwargs = intpl_kwargs
+        self.window_size = window_size
+        self._intpl_kwargs = intpl_kwargs.copy()
         self.interpolator = interpolator
         self.derivative_approximator = derivative_approximator
         self._init_from_file(data_file, **load_data_kwargs)
@@ -131,6 +146,8 @@ class DynamicInfluent(SanUnit):
             
     def _init_from_file(self, file_path=None, **kwargs):
         path = file_path or dynamic_inf_path
+        self._windows = None
+        if path.endswith('.npy'): return self._init_from_npy(path)
         self._data = df = load_data(path, index_col=None, **kwargs)
         df.sort_values('t', inplace=True)
         df_y = df.loc[:, df.columns!='t']
@@ -141,41 +158,127 @@ class DynamicInfluent(SanUnit):
         self._t_end = df.t.iloc[-1]
         intpl = self._intpl
         ikwargs = self._intpl_kwargs
+        t = df.t.to_numpy(dtype=float)
+        Y = self._get_table(df.columns, lambda y: df.loc[:,y], len(t))
+        # splines are converted to a single vector-valued piecewise polynomial
+        self._ppoly = None
+        if intpl in (CubicSpline, InterpolatedUnivariateSpline):
+            self._ppoly = self._fit_ppoly(t, Y, ikwargs)
+        elif intpl is interp1d: # vector-valued, derivatives from `derivative_approximator`
+            self._interpolant = intpl(t, Y, axis=0, **ikwargs)
+        else:
+            fs = [intpl(t, y, **ikwargs) for y in Y.T]
+            self._interpolant = lambda t: np.array([f(t) for f in fs])
+            if self._func_dydt is None:
+                dfs = [f.derivative() for f in fs]
+                self._derivative = lambda t: np.array([f(t) for f in dfs])
+
+    def _init_from_npy(self, path):
+        # memory-mapped, rows are only read when a window around the time is fitted
+        self._data = data = np.load(path, mmap_mode='r')
+        names = data.dtype.names
+        if names is None or 't' not in names:
+            raise ValueError(f'{path} must contain a structured array with a "t" field '
+                             f'(e.g., from `DynamicInfluent.to_npy`).')
+        if self._intpl not in (CubicSpline, InterpolatedUnivariateSpline):
+            raise ValueError('only spline interpolators are supported for memory-mapped '
+                             '`.npy` data files.')
+        self._get_table(names, None, 0) # check the state variables
+        self._t_end = float(data['t'][-1])
+        self._ppoly = None
+        self._windows = []
+
+    def _get_table(self, columns, get_column, n):
+        # one table for all variables, those not in the data are zeros
         y_IDs = self.components.IDs + ('Q',)
-        diff_set = set(df.columns) - set(y_IDs) - {'t'}
+        diff_set = set(columns) - set(y_IDs) - {'t'}
         if diff_set: 
             raise RuntimeError(f'The data file contains state variable(s) that are '
                                f'inconsistent with the thermo: {diff_set}')
-        self._interpolant = [intpl(df.t, df.loc[:,y], **ikwargs) \
-                             if y in df.columns else lambda t: 0 \
-                             for y in y_IDs]
-        if self.by_mass: 
-            # convert from kg/hr to g/d
-            self._interpolant = [intpl(df.t, df.loc[:,y]*24e3, **ikwargs) \
-                                 if y in df.columns else lambda t: 0 \
-                                 for y in y_IDs]
-            self._interpolant[-1] = lambda t: 1
+        Y = np.zeros((n, len(y_IDs)))
+        if n == 0: return Y
+        for i, y in enumerate(y_IDs):
+            if y in columns: Y[:,i] = get_column(y)
+        if self.by_mass:
+            Y *= 24e3 # convert from kg/hr to g/d
+            Y[:,-1] = 1
+        return Y
+
+    def _fit_ppoly(self, t, Y, ikwargs):
+        intpl = self._intpl
+        if intpl is CubicSpline:
+            cs = intpl(t, Y, axis=0, **ikwargs)
+            return _PiecewisePolynomial(cs.x, cs.c)
+        # knots are the same for all variables as they only depend on `t`
+        pps = [PPoly.from_spline(intpl(t, y, **ikwargs)._eval_args) for y in Y.T]
+        return _PiecewisePolynomial(pps[0].x, np.stack([pp.c for pp in pps], axis=-1))
+
+    def _fit_window(self, t):
+        # fits the rows around `t`, only the central half of the window is used
+        # so that the end conditions of the window have negligible effects
+        data = self._data
+        ts = data['t']
+        n = len(ts)
+        size = self.window_size
+        margin = size // 4
+        ikwargs = self._intpl_kwargs
+        if n <= size: 
+            start, stop = 0, n
         else:
-            self._interpolant = [intpl(df.t, df.loc[:,y], **ikwargs) \
-                                 if y in df.columns else lambda t: 0 \
-                                 for y in y_IDs]
-        if self._func_dydt is None:
-            self._derivative = [i.derivative() if hasattr(i, 'derivative') \
-                                else lambda t: 0 \
-                                for i in self._interpolant]
-        else: self._derivative = None
+            i = ts.searchsorted(t, 'right') - 1
+            start = max(0, min(i - margin, n - size))
+            stop = start + size
+            if ikwargs.get('bc_type') == 'periodic': 
+                ikwargs = {**ikwargs, 'bc_type': 'not-a-knot'}
+        rows = np.array(data[start:stop])
+        t = rows['t'].astype(float)
+        Y = self._get_table(rows.dtype.names, rows.__getitem__, len(t))
+        lo = -np.inf if start == 0 else t[margin]
+        hi = np.inf if stop == n else t[-margin-1]
+        return lo, hi, self._fit_ppoly(t, Y, ikwargs)
+
+    def _get_ppoly(self, t):
+        windows = self._windows
+        if windows is None: return self._ppoly
+        for lo, hi, ppoly in windows:
+            if lo <= t <= hi: return ppoly
+        window = self._fit_window(t)
+        windows.insert(0, window)
+        del windows[self._N_windows:]
+        return window[-1]
+
+    @staticmethod
+    def to_npy(data_file, path, **load_data_kwargs):
+        '''
+        Convert a time-series data file (e.g., `.tsv`, `.csv`, `.xlsx`) into a
+        `.npy` file of a structured array (one field per column) that
+        can be memory-mapped as the `data_file` of :class:`DynamicInfluent`. 
+        Returns the path of the `.npy` file.
+        
+        Records too long to be loaded at once can be written directly into
+        a structured array from :func:`numpy.lib.format.open_memmap` in chunks.
+        '''
+        df = load_data(data_file, index_col=None, **load_data_kwargs).sort_values('t')
+        arr = np.empty(len(df), dtype=[(str(c), float) for c in df.columns])
+        for c in df.columns: arr[str(c)] = df[c]
+        if not path.endswith('.npy'): path += '.npy'
+        np.save(path, arr)
+        return path
 
     def interpolant(self, t):
         '''Returns the interpolated values at time t.'''
         t %= self._t_end
-        return np.array([f(t) for f in self._interpolant])
-    
+        ppoly = self._get_ppoly(t)
+        if ppoly is None: return self._interpolant(t)
+        return ppoly(t)[0]
+
     def derivative(self, t):
         '''Returns the estimated time derivatives at time t.'''
-        if self._derivative is None: return self.derivative_approximator(t)
-        else: 
-            t %= self._t_end
-            return np.array([f(t) for f in self._derivative])
+        if self._func_dydt is not None: return self._func_dydt(t)
+        t %= self._t_end
+        ppoly = self._get_ppoly(t)
+        if ppoly is None: return self._derivative(t)
+        return ppoly(t)[1]
 
     def _init_state(self):
         self._state = self.interpolant(0)
@@ -190,7 +293,9 @@ class DynamicInfluent(SanUnit):
     def _run(self):
         '''Only to converge volumetric flows.'''
         out, = self._outs
-        y0 = self._data.iloc[0,:].to_dict()
+        data = self._data
+        if self._windows is None: y0 = data.iloc[0,:].to_dict()
+        else: y0 = dict(zip(data.dtype.names, data[0].tolist()))
         y0.pop('t', None)
         Q = y0.pop('Q')
         if self.by_mass:
@@ -213,11 +318,27 @@ class DynamicInfluent(SanUnit):
         f_dy = self.derivative
         _update_state = self._update_state
         _update_dstate = self._update_dstate      
+        ppoly = self._ppoly
+        t_end = self._t_end
 
-        def yt(t, QC_ins, dQC_ins):
-            _state[:] = f(t)
-            _update_state()
-            _dstate[:] = f_dy(t)
-            _update_dstate()
+        if ppoly is not None and self._func_dydt is None:
+            eval_into = ppoly.eval_into
+            def yt(t, QC_ins, dQC_ins):
+                eval_into(t % t_end, _state, _dstate) # values and derivatives at once
+                _update_state()
+                _update_dstate()
+        elif self._windows is not None and self._func_dydt is None:
+            get_ppoly = self._get_ppoly
+            def yt(t, QC_ins, dQC_ins):
+                t %= t_end
+                get_ppoly(t).eval_into(t, _state, _dstate)
+                _update_state()
+                _update_dstate()
+        else:
+            def yt(t, QC_ins, dQC_ins):
+                _state[:] = f(t)
+                _update_state()
+                _dstate[:] = f_dy(t)
+                _update_dstate()
 
         self._AE = yt
\ No newline at end of file
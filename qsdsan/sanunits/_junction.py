@@ -15,7 +15,7 @@ for license details.
 
 import numpy as np
 from warnings import warn
-from math import isclose
+from numba import njit
 from biosteam.units import Junction as BSTjunction
 from .. import SanUnit, processes as pc
 
@@ -235,12 +235,333 @@ class Junction(SanUnit):
             
 # %%
 
+# Conversion kernels of the ADM interfaces, compiled with `numba`,
+# the positions of components in the input and output arrays follow
+# the default ADM1 and ASM1 components
+@njit(cache=True)
+def _isclose(a, b, rtol, atol):
+    # same as `math.isclose`
+    return abs(a-b) <= max(rtol*max(abs(a), abs(b)), atol)
+
+@njit(cache=True)
+def _dot(vals, coefs):
+    tot = 0.
+    for i in range(vals.shape[0]): tot += vals[i] * coefs[i]
+    return tot
+
+@njit(cache=True)
+def _isbalanced(lhs, rhs, rtol, atol):
+    error = rhs - lhs
+    tol = max(rtol*lhs, rtol*rhs, atol)
+    return abs(error) <= tol, error, tol
+
+@njit(cache=True)
+def _balance_cod_tkn(ins_vals, outs_vals, ins_i_COD, ins_i_N, non_cod_idx,
+                     non_tkn_idx, outs_i_COD, outs_i_N, rtol, atol):
+    '''
+    Scale the COD (or TKN) of `outs_vals` in place to match those of `ins_vals`
+    within tolerance, return False (with `outs_vals` unchanged) if the COD and
+    TKN cannot be balanced at the same time.
+    '''
+    ins_cod = _dot(ins_vals, ins_i_COD)
+    for i in non_cod_idx: ins_cod -= ins_vals[i]
+    ins_tkn = _dot(ins_vals, ins_i_N)
+    for i in non_tkn_idx: ins_tkn -= ins_vals[i]
+    outs_cod = _dot(outs_vals, outs_i_COD)
+    outs_tkn = _dot(outs_vals, outs_i_N)
+    cod_bl, cod_err, cod_tol = _isbalanced(ins_cod, outs_cod, rtol, atol)
+    tkn_bl, tkn_err, tkn_tol = _isbalanced(ins_tkn, outs_tkn, rtol, atol)
+    if cod_bl:
+        if tkn_bl: return True
+        if tkn_err > 0: d = -(tkn_err - tkn_tol)/outs_tkn
+        else: d = -(tkn_err + tkn_tol)/outs_tkn
+        scaled_i, checked_i, lhs = outs_i_N, outs_i_COD, ins_cod
+    else:
+        if cod_err > 0: d = -(cod_err - cod_tol)/outs_cod
+        else: d = -(cod_err + cod_tol)/outs_cod
+        scaled_i, checked_i, lhs = outs_i_COD, outs_i_N, ins_tkn
+    rhs = 0.
+    for i in range(outs_vals.shape[0]):
+        if scaled_i[i] > 0: rhs += outs_vals[i] * (1+d) * checked_i[i]
+        else: rhs += outs_vals[i] * checked_i[i]
+    if not _isbalanced(lhs, rhs, rtol, atol)[0]: return False
+    for i in range(outs_vals.shape[0]):
+        if scaled_i[i] > 0: outs_vals[i] *= 1 + d
+    return True
+
+@njit(cache=True)
+def _adm2asm(adm_vals, asm_vals, params, bio_idx, alphas, ions_idx,
+             adm_i_COD, adm_i_N, gas_idx, no_idx, asm_i_COD, asm_i_N, counts):
+    rtol, atol, bio_to_xs, X_c_i_N, X_pr_i_N, S_aa_i_N, adm_X_I_i_N, adm_S_I_i_N, \
+        X_P_i_N, X_S_i_N, S_S_i_N, asm_X_I_i_N, asm_S_I_i_N = params
+    S_su, S_aa, S_fa, S_va, S_bu, S_pro, S_ac, S_h2, S_ch4, S_IC, S_IN, S_I = adm_vals[:12]
+    X_c, X_ch, X_pr, X_li, X_su, X_aa, X_fa, X_c4, X_pro, X_ac, X_h2, X_I = adm_vals[12:24]
+
+    # Step 0: snapshot of charged components
+    ions_charge = alphas[0]*S_IN + alphas[1]*S_IC + alphas[2]*S_ac \
+        + alphas[3]*S_pro + alphas[4]*S_bu + alphas[5]*S_va
+
+    # Step 1a: convert biomass into X_S+X_ND and X_P
+    bio_cod = X_su + X_aa + X_fa + X_c4 + X_pro + X_ac + X_h2
+    bio_n = 0.
+    for i in bio_idx: bio_n += adm_vals[i] * adm_i_N[i]
+    xp_cod = bio_cod * (1-bio_to_xs)
+    xp_ndm = xp_cod*X_P_i_N
+    if xp_ndm > bio_n:
+        counts[0] += 1
+        X_P = bio_n/X_P_i_N
+        bio_n = 0.
+    else:
+        X_P = xp_cod
+        bio_n -= xp_ndm
+    X_S = bio_cod - X_P
+    xs_ndm = X_S*X_S_i_N
+    if xs_ndm <= bio_n:
+        X_ND = bio_n - xs_ndm
+        bio_n = 0.
+    elif xs_ndm <= bio_n + S_IN:
+        X_ND = 0.
+        S_IN -= (xs_ndm - bio_n)
+        bio_n = 0.
+    else:
+        if _isclose(xs_ndm, bio_n + S_IN, rtol, atol):
+            X_ND = S_IN = bio_n = 0.
+        else:
+            raise RuntimeError('Not enough nitrogen (S_IN + biomass) to map '
+                               'all biomass COD into X_P and X_S')
+
+    # Step 1b: convert particulate substrates into X_S + X_ND
+    xsub_cod = X_c + X_ch + X_pr + X_li
+    xsub_n = X_c*X_c_i_N + X_pr*X_pr_i_N
+    X_S += xsub_cod
+    X_ND += xsub_n - xsub_cod*X_S_i_N  # X_S.i_N should technically be zero
+    if X_ND < 0:
+        if _isclose(X_ND, 0., rtol, atol): X_ND = 0.
+        else:
+            raise RuntimeError('Not enough nitrogen (substrate + excess X_ND) '
+                               'to map all particulate substrate COD into X_S')
+
+    # Step 2: map all X_I from ADM to ASM
+    excess_XIn = X_I * (adm_X_I_i_N - asm_X_I_i_N)
+    S_IN += excess_XIn
+    if S_IN < 0:
+        if _isclose(S_IN, 0., rtol, atol): S_IN = 0.
+        else:
+            raise RuntimeError('Not enough nitrogen (X_I + S_IN) to map '
+                               'all ADM X_I into ASM X_I')
+
+    # Step 3: map ADM S_I into ASM S_I and S_NH
+    excess_SIn = S_I * (adm_S_I_i_N - asm_S_I_i_N)
+    if excess_SIn > 0:
+        S_NH = excess_SIn
+    else:
+        S_NH = 0.
+        S_IN += excess_SIn
+        if S_IN < 0:
+            if _isclose(S_IN, 0., rtol, atol): S_IN = 0.
+            else:
+                raise RuntimeError('Not enough nitrogen (S_I + S_IN) to map '
+                                   'all ADM S_I into ASM S_I')
+    S_NH += S_IN
+
+    # Step 4: map all soluble substrates into S_S and S_ND
+    ssub_cod = S_su + S_aa + S_fa + S_va + S_bu + S_pro + S_ac
+    ssub_n = S_aa * S_aa_i_N
+    if ssub_cod*S_S_i_N <= ssub_n:
+        S_S = ssub_cod
+        S_ND = ssub_n
+        if S_S_i_N != 0: S_ND -= S_S/S_S_i_N # S_S.i_N should technically be zero
+    else:
+        if _isclose(ssub_cod*S_S_i_N, ssub_n, rtol, atol):
+            S_S = ssub_cod
+            S_ND = 0.
+        else:
+            raise RuntimeError('Not enough nitrogen to map all soluble '
+                               'substrates into ASM S_S')
+
+    # Step 6: check COD and TKN balance
+    asm_vals[:] = 0.
+    asm_vals[0], asm_vals[1], asm_vals[2], asm_vals[3] = S_I, S_S, X_I, X_S
+    asm_vals[6] = X_P
+    asm_vals[9], asm_vals[10], asm_vals[11] = S_NH, S_ND, X_ND
+    asm_vals[14] = adm_vals[26] # H2O
+
+    if S_h2 > 0 or S_ch4 > 0: counts[1] += 1
+
+    if not _balance_cod_tkn(adm_vals, asm_vals, adm_i_COD, adm_i_N, gas_idx,
+                            no_idx, asm_i_COD, asm_i_N, rtol, atol):
+        counts[2] += 1
+
+    # Step 5: charge balance for alkalinity
+    S_NH = asm_vals[ions_idx[0]]
+    asm_vals[ions_idx[1]] = (ions_charge - S_NH/14)*(-12)
+
+@njit(cache=True)
+def _adm2asm_batch(adm_arr, asm_arr, params, bio_idx, alphas, ions_idx,
+                   adm_i_COD, adm_i_N, gas_idx, no_idx, asm_i_COD, asm_i_N, counts):
+    for k in range(adm_arr.shape[0]):
+        _adm2asm(adm_arr[k], asm_arr[k], params, bio_idx, alphas, ions_idx,
+                 adm_i_COD, adm_i_N, gas_idx, no_idx, asm_i_COD, asm_i_N, counts)
+
+@njit(cache=True)
+def _asm2adm(asm_vals, adm_vals, params, ions_idx,
+             asm_i_COD, asm_i_N, no_idx, non_tkn_idx, adm_i_COD, adm_i_N, counts):
+    rtol, atol, frac_deg, xs_to_li, bio_to_li, S_NO_i_COD, X_BH_i_N, X_BA_i_N, \
+        asm_X_I_i_N, X_P_i_N, S_aa_i_N, X_pr_i_N, S_I_i_N, adm_X_I_i_N, \
+        alpha_IN, alpha_IC, proton_charge = params
+    S_I, S_S, X_I, X_S, X_BH, X_BA, X_P, S_O, S_NO, S_NH, S_ND, X_ND, S_ALK = asm_vals[:13]
+
+    # Step 0: charged component snapshot
+    asm_charge_tot = S_NH/14 - S_NO/14 - S_ALK/12
+
+    # Step 1: remove any remaining COD demand
+    O_coddm = S_O
+    NO_coddm = -S_NO*S_NO_i_COD
+    cod_spl = S_S + X_S + X_BH + X_BA
+    bioN = X_BH*X_BH_i_N + X_BA*X_BA_i_N
+
+    if cod_spl <= O_coddm:
+        S_O = O_coddm - cod_spl
+        S_S = X_S = X_BH = X_BA = 0.
+    elif cod_spl <= O_coddm + NO_coddm:
+        S_O = 0.
+        S_NO = -(O_coddm + NO_coddm - cod_spl)/S_NO_i_COD
+        S_S = X_S = X_BH = X_BA = 0.
+    else:
+        S_S -= O_coddm + NO_coddm
+        if S_S < 0:
+            X_S += S_S
+            S_S = 0.
+            if X_S < 0:
+                X_BH += X_S
+                X_S = 0.
+                if X_BH < 0:
+                    X_BA += X_BH
+                    X_BH = 0.
+        S_O = S_NO = 0.
+
+    # Step 2: convert any readily biodegradable
+    # COD and TKN into amino acids and sugars
+    # Assumed S_S, X_S has no nitrogen
+    req_scod = S_ND / S_aa_i_N
+    if S_S < req_scod:
+        S_aa = S_S
+        S_su = 0.
+        S_ND -= S_aa * S_aa_i_N
+    else:
+        S_aa = req_scod
+        S_su = S_S - S_aa
+        S_ND = 0.
+
+    # Step 3: convert slowly biodegradable COD and TKN
+    # into proteins, lipids, and carbohydrates
+    req_xcod = X_ND / X_pr_i_N
+    if X_S < req_xcod:
+        X_pr = X_S
+        X_li = X_ch = 0.
+        X_ND -= X_pr * X_pr_i_N
+    else:
+        X_pr = req_xcod
+        X_li = xs_to_li * (X_S - X_pr)
+        X_ch = (X_S - X_pr) - X_li
+        X_ND = 0.
+
+    # Step 4: convert active biomass into protein, lipids,
+    # carbohydrates and potentially particulate TKN
+    available_bioN = bioN - (X_BH+X_BA) * (1-frac_deg) * adm_X_I_i_N
+    if available_bioN < 0:
+        raise RuntimeError('Not enough N in X_BA and X_BH to fully convert '
+                           'the non-biodegradable portion into X_I in ADM1.')
+    req_bioN = (X_BH+X_BA) * frac_deg * X_pr_i_N
+    if available_bioN + X_ND >= req_bioN:
+        X_pr += (X_BH+X_BA) * frac_deg
+        X_ND += available_bioN - req_bioN
+    else:
+        bio2pr = (available_bioN + X_ND)/X_pr_i_N
+        X_pr += bio2pr
+        bio_to_split = (X_BH+X_BA) * frac_deg - bio2pr
+        bio_split_to_li = bio_to_split * bio_to_li
+        X_li += bio_split_to_li
+        X_ch += (bio_to_split - bio_split_to_li)
+        X_ND = 0.
+
+    # Step 5: map particulate inerts
+    xi_nsp = X_P_i_N * X_P + asm_X_I_i_N * X_I
+    xi_ndm = (X_P+X_I) * adm_X_I_i_N
+    if xi_nsp + X_ND >= xi_ndm:
+        deficit = xi_ndm - xi_nsp
+        X_I += X_P + (X_BH+X_BA) * (1-frac_deg)
+        X_ND -= deficit
+    elif _isclose(xi_nsp+X_ND, xi_ndm, rtol, atol):
+        X_I += X_P + (X_BH+X_BA) * (1-frac_deg)
+        X_ND = 0.
+    else:
+        raise RuntimeError('Not enough N in X_I, X_P, X_ND to fully '
+                           'convert X_I and X_P into X_I in ADM1.')
+
+    req_sn = S_I * S_I_i_N
+    if req_sn <= S_ND:
+        S_ND -= req_sn
+    elif req_sn <= S_ND + X_ND:
+        X_ND -= (req_sn - S_ND)
+        S_ND = 0.
+    elif req_sn <= S_ND + X_ND + S_NH:
+        S_NH -= (req_sn - S_ND - X_ND)
+        S_ND = X_ND = 0.
+    else:
+        counts[0] += 1
+        SI_cod = (S_ND + X_ND + S_NH)/S_I_i_N
+        S_su += S_I - SI_cod
+        S_I = SI_cod
+        S_ND = X_ND = S_NH = 0.
+
+    # Step 6: map any remaining TKN
+    S_IN = S_ND + X_ND + S_NH
+
+    # Step 8: check COD and TKN balance
+    # has TKN: S_aa, S_IN, S_I, X_pr, X_I
+    adm_vals[:] = 0.
+    adm_vals[0], adm_vals[1] = S_su, S_aa
+    adm_vals[10], adm_vals[11] = S_IN, S_I
+    adm_vals[13], adm_vals[14], adm_vals[15] = X_ch, X_pr, X_li
+    adm_vals[23] = X_I
+    adm_vals[26] = asm_vals[14] # H2O
+
+    if not _balance_cod_tkn(asm_vals, adm_vals, asm_i_COD, asm_i_N, no_idx,
+                            non_tkn_idx, adm_i_COD, adm_i_N, rtol, atol):
+        counts[1] += 1
+
+    # Step 7: charge balance
+    #!!! charge balance should technically include VFAs,
+    # but VFAs concentrations are assumed zero per previous steps??
+    S_IN = adm_vals[ions_idx[0]]
+    adm_vals[ions_idx[1]] = (asm_charge_tot - S_IN*alpha_IN)/alpha_IC
+    net_Scat = asm_charge_tot + proton_charge
+    if net_Scat > 0:
+        adm_vals[ions_idx[2]] = net_Scat
+        adm_vals[ions_idx[3]] = 0.
+    else:
+        adm_vals[ions_idx[2]] = 0.
+        adm_vals[ions_idx[3]] = -net_Scat
+
+@njit(cache=True)
+def _asm2adm_batch(asm_arr, adm_arr, params, ions_idx,
+                   asm_i_COD, asm_i_N, no_idx, non_tkn_idx, adm_i_COD, adm_i_N, counts):
+    for k in range(asm_arr.shape[0]):
+        _asm2adm(asm_arr[k], adm_arr[k], params, ions_idx,
+                 asm_i_COD, asm_i_N, no_idx, non_tkn_idx, adm_i_COD, adm_i_N, counts)
+
+
 #TODO: add a `rtol` kwargs for error checking
 class ADMjunction(Junction):
     '''
     An abstract superclass holding common properties of ADM interface classes.
     Users should use its subclasses (e.g., ``ASMtoADM``, ``ADMtoASM``) instead.
     
+    The conversions are compiled with `numba`. Warnings raised during the
+    conversions are counted rather than issued each time, and reported
+    (see :func:`report_warnings`) after the unit or its system is simulated.
+    
     See Also
     --------
     :class:`qsdsan.sanunits.Junction`
@@ -253,10 +574,14 @@ class ADMjunction(Junction):
     rtol = 1e-2
     atol = 1e-6
     
+    # Warnings that can be raised during the conversions, in the order of the counters
+    _warning_messages = ()
+    
     def __init__(self, ID='', upstream=None, downstream=(), thermo=None,
                  init_with='WasteStream', F_BM_default=None, isdynamic=False,
                  adm1_model=None):
         self.adm1_model = adm1_model # otherwise there won't be adm1_model when `_compile_reactions` is called
+        self._warning_counts = np.zeros(len(self._warning_messages), dtype=np.int64)
         if thermo is None:
             warn('No `thermo` object is provided and is prone to raise error. '
                  'If you are not sure how to get the `thermo` object, '
@@ -329,6 +654,76 @@ class ADMjunction(Junction):
         pKa_IN = self.pKa[1]
         return 10**(pKa_IN-pH)/(1+10**(pKa_IN-pH))/14
     
+    def isbalanced(self, lhs, rhs_vals, rhs_i):
+        rhs = sum(rhs_vals*rhs_i)
+        error = rhs - lhs
+        tol = max(self.rtol*lhs, self.rtol*rhs, self.atol)
+        return abs(error) <= tol, error, tol, rhs
+    
+    def balance_cod_tkn(self, ins_vals, outs_vals):
+        '''
+        Return a copy of the concentrations of the downstream (`outs_vals`)
+        with COD (or TKN) scaled to match those of the upstream (`ins_vals`)
+        within `rtol` and `atol`, or `outs_vals` if COD and TKN
+        cannot be balanced at the same time.
+        '''
+        self.reactions # make sure that the conversions are compiled
+        outs_vals = np.array(outs_vals, dtype=float)
+        if not _balance_cod_tkn(np.asarray(ins_vals, dtype=float), outs_vals,
+                                *self._balance_args, self.rtol, self.atol):
+            warn(f'cannot balance COD and TKN at the same time with rtol={self.rtol} '
+                 f'and atol={self.atol}.')
+        return outs_vals
+    
+    @property
+    def warning_counts(self):
+        '''
+        [dict] Number of times each of the warnings has been raised during the
+        conversions since they were last reported.
+        '''
+        return dict(zip(self._warning_messages, self._warning_counts.tolist()))
+    
+    def report_warnings(self, reset=True):
+        '''
+        Issue each of the warnings raised during the conversions once along with
+        the number of times it was raised, then reset the counters if `reset` is True.
+        Automatically called after the unit or its system is simulated.
+        '''
+        for msg, n in zip(self._warning_messages, self._warning_counts):
+            if n: warn(f'{self.ID}: {msg.format(rtol=self.rtol, atol=self.atol)} '
+                       f'(raised {n} time(s) during the conversions).')
+        if reset: self._warning_counts[:] = 0
+    
+    def _summary(self, *args, **kwargs):
+        self.report_warnings()
+        super()._summary(*args, **kwargs)
+    
+    def convert_trajectory(self, record):
+        '''
+        Convert the concentrations of the upstream at multiple time points at once,
+        e.g., for post-processing of the record of the upstream's scope.
+        
+        Parameters
+        ----------
+        record : 2d array
+            Concentrations of the upstream components [mg/L] with one row per
+            time point, can be followed by a column of the flow rate,
+            which will be copied to the results.
+        
+        Returns
+        -------
+        2d array of concentrations of the downstream components [mg/L]
+        (and the flow rate, if included in `record`).
+        '''
+        record = np.asarray(record, dtype=float)
+        n_up = len(self.ins[0].components)
+        if record.ndim != 2 or record.shape[1] not in (n_up, n_up+1):
+            raise ValueError(f'`record` must be a 2d array with {n_up} or {n_up+1} '
+                             f'columns, not with a shape of {record.shape}.')
+        self.reactions # make sure that the conversions are compiled
+        Y = self._batch_reactions(np.ascontiguousarray(record[:, :n_up]))
+        if record.shape[1] > n_up: Y = np.column_stack((Y, record[:, -1]))
+        return Y
         
     def _compile_AE(self):
         _state = self._state
@@ -339,8 +734,7 @@ class ADMjunction(Junction):
         rxn = self.reactions
                
         def yt(t, QC_ins, dQC_ins):
-            before_vals = QC_ins[0,:-1]
-            _state[:-1] = rxn(before_vals)
+            rxn(QC_ins[0,:-1], _state[:-1])
             _state[-1] = QC_ins[0,-1]
             if t > self._cached_t:
                 _dstate[:] = (_state - _cached_state)/(t-self._cached_t)
@@ -394,194 +788,53 @@ class ADMtoASM(ADMjunction):
     # Should be constants
     cod_vfa = np.array([64, 112, 160, 208])
     
-    def isbalanced(self, lhs, rhs_vals, rhs_i):
-        rhs = sum(rhs_vals*rhs_i)
-        error = rhs - lhs
-        tol = max(self.rtol*lhs, self.rtol*rhs, self.atol)
-        return abs(error) <= tol, error, tol, rhs
-    
-    def balance_cod_tkn(self, adm_vals, asm_vals):
-        cmps_adm = self.ins[0].components
-        cmps_asm = self.outs[0].components
-        asm_i_COD = cmps_asm.i_COD
-        adm_i_COD = cmps_adm.i_COD
-        gas_idx = cmps_adm.indices(('S_h2', 'S_ch4'))
-        asm_i_N = cmps_asm.i_N
-        adm_i_N = cmps_adm.i_N
-        adm_cod = sum(adm_vals*adm_i_COD) - sum(adm_vals[gas_idx])
-        adm_tkn = sum(adm_vals*adm_i_N)
-        cod_bl, cod_err, cod_tol, asm_cod = self.isbalanced(adm_cod, asm_vals, asm_i_COD)
-        tkn_bl, tkn_err, tkn_tol, asm_tkn = self.isbalanced(adm_tkn, asm_vals, asm_i_N)
-        if cod_bl:
-            if tkn_bl: return asm_vals
-            else:
-                if tkn_err > 0: dtkn = -(tkn_err - tkn_tol)/asm_tkn
-                else: dtkn = -(tkn_err + tkn_tol)/asm_tkn
-                _asm_vals = asm_vals * (1 + (asm_i_N>0)*dtkn)
-                _cod_bl, _cod_err, _cod_tol, _asm_cod = self.isbalanced(adm_cod, _asm_vals, asm_i_COD)
-                if _cod_bl: return _asm_vals
-                else: 
-                    warn('cannot balance COD and TKN at the same '
-                        f'time with rtol={self.rtol} and atol={self.atol}. '
-                        f'influent (ADM) COD is {adm_cod}, '
-                        f'effluent (ASM) COD is {asm_cod} or {_asm_cod}. '
-                        f'influent TKN is {adm_tkn}, ' 
-                        f'effluent TKN is {asm_tkn} or {asm_tkn*(1+dtkn)}. ')
-                    return asm_vals
-        else:
-            if cod_err > 0: dcod = -(cod_err - cod_tol)/asm_cod
-            else: dcod = -(cod_err + cod_tol)/asm_cod
-            _asm_vals = asm_vals * (1 + (asm_i_COD>0)*dcod)
-            _tkn_bl, _tkn_err, _tkn_tol, _asm_tkn = self.isbalanced(adm_tkn, _asm_vals, asm_i_N)
-            if _tkn_bl: return _asm_vals
-            else:
-                warn('cannot balance COD and TKN at the same '
-                    f'time with rtol={self.rtol} and atol={self.atol}. '
-                    f'influent (ADM) COD is {adm_cod}, '
-                    f'effluent (ASM) COD is {asm_cod} or {asm_cod*(1+dcod)}. '
-                    f'influent TKN is {adm_tkn}, ' 
-                    f'effluent TKN is {asm_tkn} or {_asm_tkn}. ')
-                return asm_vals
+    _warning_messages = (
+        'Not enough biomass N to map the specified proportion of '
+        'biomass COD into X_P. Mapped as much COD as possible, the rest '
+        'goes to X_S.',
+        'Ignored dissolved H2 or CH4.',
+        'cannot balance COD and TKN at the same time with rtol={rtol} and atol={atol}.',
+        )
     
     def _compile_reactions(self):
         # Retrieve constants
-        ins = self.ins[0]
-        outs = self.outs[0]
-        rtol = self.rtol
-        atol = self.atol
-        
-        cmps_adm = ins.components
-        X_c_i_N = cmps_adm.X_c.i_N
-        X_pr_i_N = cmps_adm.X_pr.i_N
-        S_aa_i_N = cmps_adm.S_aa.i_N
-        adm_X_I_i_N = cmps_adm.X_I.i_N
-        adm_S_I_i_N = cmps_adm.S_I.i_N
-        adm_i_N = cmps_adm.i_N
-        adm_bio_N_indices = cmps_adm.indices(('X_su', 'X_aa', 'X_fa', 
-                                              'X_c4', 'X_pro', 'X_ac', 'X_h2'))
-
-        cmps_asm = outs.components
-        X_P_i_N = cmps_asm.X_P.i_N
-        X_S_i_N = cmps_asm.X_S.i_N
-        S_S_i_N = cmps_asm.S_S.i_N
-        asm_X_I_i_N = cmps_asm.X_I.i_N
-        asm_S_I_i_N = cmps_asm.S_I.i_N
-        asm_X_P_i_N = cmps_asm.X_P.i_N
-        asm_ions_idx = cmps_asm.indices(('S_NH', 'S_ALK'))
-        
-        alpha_IN = self.alpha_IN
-        alpha_IC = self.alpha_IC
-        alpha_vfa = self.alpha_vfa
-        f_corr = self.balance_cod_tkn
-
-        def adm2asm(adm_vals):    
-            S_su, S_aa, S_fa, S_va, S_bu, S_pro, S_ac, S_h2, S_ch4, S_IC, S_IN, S_I, \
-                X_c, X_ch, X_pr, X_li, X_su, X_aa, X_fa, X_c4, X_pro, X_ac, X_h2, X_I, \
-                S_cat, S_an, H2O = adm_vals
-                       
-            # Step 0: snapshot of charged components
-            _ions = np.array([S_IN, S_IC, S_ac, S_pro, S_bu, S_va])
-            
-            # Step 1a: convert biomass into X_S+X_ND and X_P
-            bio_cod = X_su + X_aa + X_fa + X_c4 + X_pro + X_ac + X_h2
-            bio_n = sum((adm_vals*adm_i_N)[adm_bio_N_indices])
-            xp_cod = bio_cod * (1-self.bio_to_xs)
-            xp_ndm = xp_cod*X_P_i_N
-            if xp_ndm > bio_n:
-                warn('Not enough biomass N to map the specified proportion of '
-                     'biomass COD into X_P. Mapped as much COD as possible, the rest '
-                     'goes to X_S.')
-                X_P = bio_n/asm_X_P_i_N
-                bio_n = 0
-            else:
-                X_P = xp_cod
-                bio_n -= xp_ndm
-            X_S = bio_cod - X_P
-            xs_ndm = X_S*X_S_i_N
-            if xs_ndm <= bio_n:
-                X_ND = bio_n - xs_ndm
-                bio_n = 0
-            elif xs_ndm <= bio_n + S_IN:
-                X_ND = 0
-                S_IN -= (xs_ndm - bio_n)
-                bio_n = 0
-            else:
-                if isclose(xs_ndm,  bio_n + S_IN, rel_tol=rtol, abs_tol=atol):
-                    X_ND = S_IN = bio_n = 0
-                else:
-                    raise RuntimeError('Not enough nitrogen (S_IN + biomass) to map '
-                                       'all biomass COD into X_P and X_S')
-            
-            # Step 1b: convert particulate substrates into X_S + X_ND
-            xsub_cod = X_c + X_ch + X_pr + X_li
-            xsub_n = X_c*X_c_i_N + X_pr*X_pr_i_N
-            X_S += xsub_cod
-            X_ND += xsub_n - xsub_cod*X_S_i_N  # X_S.i_N should technically be zero
-            if X_ND < 0:
-                if isclose(X_ND, 0, rel_tol=rtol, abs_tol=atol): X_ND = 0
-                else:
-                    raise RuntimeError('Not enough nitrogen (substrate + excess X_ND) '
-                                       'to map all particulate substrate COD into X_S')
-            
-            # Step 2: map all X_I from ADM to ASM           
-            excess_XIn = X_I * (adm_X_I_i_N - asm_X_I_i_N)
-            S_IN += excess_XIn
-            if S_IN < 0:
-                if isclose(S_IN, 0, rel_tol=rtol, abs_tol=atol): S_IN = 0
-                raise RuntimeError('Not enough nitrogen (X_I + S_IN) to map '
-                                   'all ADM X_I into ASM X_I')
-            
-            # Step 3: map ADM S_I into ASM S_I and S_NH
-            excess_SIn = S_I * (adm_S_I_i_N - asm_S_I_i_N)
-            if excess_SIn > 0:
-                S_NH = excess_SIn
-            else:
-                S_NH = 0
-                S_IN += excess_SIn
-                if S_IN < 0:
-                    if isclose(S_IN, 0, rel_tol=rtol, abs_tol=atol): S_IN = 0
-                    raise RuntimeError('Not enough nitrogen (S_I + S_IN) to map '
-                                       'all ADM S_I into ASM S_I')
-            S_NH += S_IN
-                
-            # Step 4: map all soluble substrates into S_S and S_ND        
-            ssub_cod = S_su + S_aa + S_fa + S_va + S_bu + S_pro + S_ac
-            ssub_n = S_aa * S_aa_i_N
-            if ssub_cod*S_S_i_N <= ssub_n:
-                S_S = ssub_cod
-                S_ND = ssub_n
-                if S_S_i_N != 0: S_ND -= S_S/S_S_i_N # S_S.i_N should technically be zero
-            else:
-                if isclose(ssub_cod*S_S_i_N, ssub_n, rel_tol=rtol, abs_tol=atol): 
-                    S_S = ssub_cod
-                    S_ND = 0
-                else:
-                    raise RuntimeError('Not enough nitrogen to map all soluble '
-                                       'substrates into ASM S_S')
-                        
-            # Step 6: check COD and TKN balance
-            asm_vals = np.array(([
-                S_I, S_S, X_I, X_S, 
-                0, 0, # X_BH, X_BA, 
-                X_P, 
-                0, 0, # S_O, S_NO, 
-                S_NH, S_ND, X_ND,  
-                0, 0, # temporary S_ALK, S_N2, 
-                H2O]))
-            
-            if S_h2 > 0 or S_ch4 > 0:
-                warn('Ignored dissolved H2 or CH4.')
-            
-            asm_vals = f_corr(adm_vals, asm_vals)
-            
-            # Step 5: charge balance for alkalinity
-            S_NH = asm_vals[asm_ions_idx[0]]
-            S_ALK = (sum(_ions * np.append([alpha_IN, alpha_IC], alpha_vfa)) - S_NH/14)*(-12)
-            asm_vals[asm_ions_idx[1]] = S_ALK
-            
+        cmps_adm = self.ins[0].components
+        cmps_asm = self.outs[0].components
+        # the first three are user defined values, updated upon each conversion
+        params = np.array([
+            self.rtol, self.atol, self.bio_to_xs,
+            cmps_adm.X_c.i_N, cmps_adm.X_pr.i_N, cmps_adm.S_aa.i_N,
+            cmps_adm.X_I.i_N, cmps_adm.S_I.i_N,
+            cmps_asm.X_P.i_N, cmps_asm.X_S.i_N, cmps_asm.S_S.i_N,
+            cmps_asm.X_I.i_N, cmps_asm.S_I.i_N,
+            ], dtype=float)
+        bio_idx = cmps_adm.indices(('X_su', 'X_aa', 'X_fa', 'X_c4', 'X_pro', 'X_ac', 'X_h2'))
+        bio_idx = np.asarray(bio_idx, dtype=np.intp)
+        alphas = np.append([self.alpha_IN, self.alpha_IC], self.alpha_vfa)
+        ions_idx = np.asarray(cmps_asm.indices(('S_NH', 'S_ALK')), dtype=np.intp)
+        self._balance_args = args = (
+            np.asarray(cmps_adm.i_COD, dtype=float), np.asarray(cmps_adm.i_N, dtype=float),
+            np.asarray(cmps_adm.indices(('S_h2', 'S_ch4')), dtype=np.intp),
+            np.zeros(0, dtype=np.intp),
+            np.asarray(cmps_asm.i_COD, dtype=float), np.asarray(cmps_asm.i_N, dtype=float),
+            )
+        counts = self._warning_counts
+        n_asm = len(cmps_asm)
+
+        def adm2asm(adm_vals, asm_vals=None):
+            if asm_vals is None: asm_vals = np.empty(n_asm)
+            params[:3] = self.rtol, self.atol, self.bio_to_xs
+            _adm2asm(adm_vals, asm_vals, params, bio_idx, alphas, ions_idx, *args, counts)
             return asm_vals
         
+        def adm2asm_batch(adm_arr):
+            asm_arr = np.empty((adm_arr.shape[0], n_asm))
+            params[:3] = self.rtol, self.atol, self.bio_to_xs
+            _adm2asm_batch(adm_arr, asm_arr, params, bio_idx, alphas, ions_idx, *args, counts)
+            return asm_arr
+        
         self._reactions = adm2asm
+        self._batch_reactions = adm2asm_batch
     
     @property
     def alpha_vfa(self):
@@ -636,68 +889,15 @@ class ASMtoADM(ADMjunction):
     frac_deg = 0.68
     
     
-    def isbalanced(self, lhs, rhs_vals, rhs_i):
-        rhs = sum(rhs_vals*rhs_i)
-        error = rhs - lhs
-        tol = max(self.rtol*lhs, self.rtol*rhs, self.atol)
-        return abs(error) <= tol, error, tol, rhs
+    _warning_messages = (
+        'Additional soluble inert COD is mapped to S_su.',
+        'cannot balance COD and TKN at the same time with rtol={rtol} and atol={atol}.',
+        )
     
-    def balance_cod_tkn(self, asm_vals, adm_vals):
-        cmps_asm = self.ins[0].components
-        cmps_adm = self.outs[0].components
-        asm_i_COD = cmps_asm.i_COD
-        adm_i_COD = cmps_adm.i_COD
-        non_tkn_idx = cmps_asm.indices(('S_NO', 'S_N2'))
-        asm_i_N = cmps_asm.i_N
-        adm_i_N = cmps_adm.i_N
-        asm_cod = sum(asm_vals*asm_i_COD)
-        asm_tkn = sum(asm_vals*asm_i_N) - sum(asm_vals[non_tkn_idx])
-        cod_bl, cod_err, cod_tol, adm_cod = self.isbalanced(asm_cod, adm_vals, adm_i_COD)
-        tkn_bl, tkn_err, tkn_tol, adm_tkn = self.isbalanced(asm_tkn, adm_vals, adm_i_N)
-        if cod_bl:
-            if tkn_bl: return adm_vals
-            else:
-                if tkn_err > 0: dtkn = -(tkn_err - tkn_tol)/adm_tkn
-                else: dtkn = -(tkn_err + tkn_tol)/adm_tkn
-                _adm_vals = adm_vals * (1 + (adm_i_N>0)*dtkn)
-                _cod_bl, _cod_err, _cod_tol, _adm_cod = self.isbalanced(asm_cod, _adm_vals, adm_i_COD)
-                if _cod_bl: return _adm_vals
-                else: 
-                    warn('cannot balance COD and TKN at the same '
-                        f'time with rtol={self.rtol} and atol={self.atol}.\n '
-                        f'influent (ASM) COD is {asm_cod}\n '
-                        f'effluent (ADM) COD is {adm_cod} or {_adm_cod}\n '
-                        f'influent TKN is {asm_tkn}\n ' 
-                        f'effluent TKN is {adm_tkn} or {adm_tkn*(1+dtkn)}. ')
-                    return adm_vals
-        else:
-            if cod_err > 0: dcod = -(cod_err - cod_tol)/adm_cod
-            else: dcod = -(cod_err + cod_tol)/adm_cod
-            _adm_vals = adm_vals * (1 + (adm_i_COD>0)*dcod)
-            _tkn_bl, _tkn_err, _tkn_tol, _adm_tkn = self.isbalanced(asm_tkn, _adm_vals, adm_i_N)
-            if _tkn_bl: return _adm_vals
-            else:
-                warn('cannot balance COD and TKN at the same '
-                    f'time with rtol={self.rtol} and atol={self.atol}.\n '
-                    f'influent (ASM) COD is {asm_cod}\n '
-                    f'effluent (ADM) COD is {adm_cod} or {adm_cod*(1+dcod)}\n '
-                    f'influent TKN is {asm_tkn}\n ' 
-                    f'effluent TKN is {adm_tkn} or {_adm_tkn}. ')
-                return adm_vals
-                
     def _compile_reactions(self):
         # Retrieve constants
-        ins = self.ins[0]
-        outs = self.outs[0]
-        rtol = self.rtol
-        atol = self.atol
-
-        cmps_asm = ins.components
-        S_NO_i_COD = cmps_asm.S_NO.i_COD
-        X_BH_i_N = cmps_asm.X_BH.i_N
-        X_BA_i_N = cmps_asm.X_BA.i_N
-        asm_X_I_i_N = cmps_asm.X_I.i_N
-        X_P_i_N = cmps_asm.X_P.i_N
+        cmps_asm = self.ins[0].components
+        cmps_adm = self.outs[0].components
         if cmps_asm.X_S.i_N > 0: 
             warn(f'X_S in ASM has positive nitrogen content: {cmps_asm.X_S.i_N} gN/gCOD. '
                  'These nitrogen will be ignored by the interface model '
@@ -707,162 +907,37 @@ class ASMtoADM(ADMjunction):
                  'These nitrogen will be ignored by the interface model '
                  'and could lead to imbalance of TKN after conversion.')
         
-        cmps_adm = outs.components
-        S_aa_i_N = cmps_adm.S_aa.i_N
-        X_pr_i_N = cmps_adm.X_pr.i_N
-        S_I_i_N = cmps_adm.S_I.i_N
-        adm_X_I_i_N = cmps_adm.X_I.i_N
-        adm_ions_idx = cmps_adm.indices(['S_IN', 'S_IC', 'S_cat', 'S_an'])
-        
-        frac_deg = self.frac_deg
-        alpha_IN = self.alpha_IN
-        alpha_IC = self.alpha_IC
-        proton_charge = 10**(-self.pKa[0]+self.pH) - 10**(-self.pH) # self.pKa[0] is pKw
-        f_corr = self.balance_cod_tkn
-
-        def asm2adm(asm_vals):
-            S_I, S_S, X_I, X_S, X_BH, X_BA, X_P, S_O, S_NO, S_NH, S_ND, X_ND, S_ALK, S_N2, H2O = asm_vals
-
-            # Step 0: charged component snapshot
-            _sno = S_NO
-            _snh = S_NH
-            _salk = S_ALK
-            
-            # Step 1: remove any remaining COD demand
-            O_coddm = S_O
-            NO_coddm = -S_NO*S_NO_i_COD
-            cod_spl = S_S + X_S + X_BH + X_BA
-            bioN = X_BH*X_BH_i_N + X_BA*X_BA_i_N
-            
-            if cod_spl <= O_coddm:
-                S_O = O_coddm - cod_spl
-                S_S = X_S = X_BH = X_BA = 0
-            elif cod_spl <= O_coddm + NO_coddm:
-                S_O = 0
-                S_NO = -(O_coddm + NO_coddm - cod_spl)/S_NO_i_COD
-                S_S = X_S = X_BH = X_BA = 0
-            else:
-                S_S -= O_coddm + NO_coddm
-                if S_S < 0:
-                    X_S += S_S
-                    S_S = 0
-                    if X_S < 0:
-                        X_BH += X_S                        
-                        X_S = 0    
-                        if X_BH < 0:
-                            X_BA += X_BH
-                            X_BH = 0
-                S_O = S_NO = 0
-            
-            # Step 2: convert any readily biodegradable 
-            # COD and TKN into amino acids and sugars
-            # Assumed S_S, X_S has no nitrogen
-            req_scod = S_ND / S_aa_i_N
-            if S_S < req_scod:
-                S_aa = S_S
-                S_su = 0
-                S_ND -= S_aa * S_aa_i_N
-            else:
-                S_aa = req_scod
-                S_su = S_S - S_aa
-                S_ND = 0
-
-            # Step 3: convert slowly biodegradable COD and TKN
-            # into proteins, lipids, and carbohydrates
-            req_xcod = X_ND / X_pr_i_N
-            if X_S < req_xcod:
-                X_pr = X_S
-                X_li = X_ch = 0
-                X_ND -= X_pr * X_pr_i_N
-            else:
-                X_pr = req_xcod
-                X_li = self.xs_to_li * (X_S - X_pr)
-                X_ch = (X_S - X_pr) - X_li
-                X_ND = 0
-            
-            # Step 4: convert active biomass into protein, lipids, 
-            # carbohydrates and potentially particulate TKN
-            available_bioN = bioN - (X_BH+X_BA) * (1-frac_deg) * adm_X_I_i_N
-            if available_bioN < 0:
-                raise RuntimeError('Not enough N in X_BA and X_BH to fully convert '
-                                   'the non-biodegradable portion into X_I in ADM1.')
-            req_bioN = (X_BH+X_BA) * frac_deg * X_pr_i_N
-            if available_bioN + X_ND >= req_bioN:
-                X_pr += (X_BH+X_BA) * frac_deg
-                X_ND += available_bioN - req_bioN
-            else:
-                bio2pr = (available_bioN + X_ND)/X_pr_i_N
-                X_pr += bio2pr
-                bio_to_split = (X_BH+X_BA) * frac_deg - bio2pr
-                bio_split_to_li = bio_to_split * self.bio_to_li
-                X_li += bio_split_to_li
-                X_ch += (bio_to_split - bio_split_to_li)
-                X_ND = 0
-            
-            # Step 5: map particulate inerts
-            xi_nsp = X_P_i_N * X_P + asm_X_I_i_N * X_I
-            xi_ndm = (X_P+X_I) * adm_X_I_i_N
-            if xi_nsp + X_ND >= xi_ndm:
-                deficit = xi_ndm - xi_nsp
-                X_I += X_P + (X_BH+X_BA) * (1-frac_deg)
-                X_ND -= deficit
-            elif isclose(xi_nsp+X_ND, xi_ndm, rel_tol=rtol, abs_tol=atol):
-                X_I += X_P + (X_BH+X_BA) * (1-frac_deg)
-                X_ND = 0
-            else:
-                raise RuntimeError('Not enough N in X_I, X_P, X_ND to fully '
-                                   'convert X_I and X_P into X_I in ADM1.')
-
-            req_sn = S_I * S_I_i_N
-            if req_sn <= S_ND:
-                S_ND -= req_sn
-            elif req_sn <= S_ND + X_ND:
-                X_ND -= (req_sn - S_ND)
-                S_ND = 0
-            elif req_sn <= S_ND + X_ND + S_NH:
-                S_NH -= (req_sn - S_ND - X_ND)
-                S_ND = X_ND = 0
-            else:
-                warn('Additional soluble inert COD is mapped to S_su.')
-                SI_cod = (S_ND + X_ND + S_NH)/S_I_i_N
-                S_su += S_I - SI_cod
-                S_I = SI_cod
-                S_ND = X_ND = S_NH = 0
-                
-            # Step 6: map any remaining TKN
-            S_IN = S_ND + X_ND + S_NH            
-            
-            # Step 8: check COD and TKN balance
-            # has TKN: S_aa, S_IN, S_I, X_pr, X_I
-            S_IC = S_cat = S_an = 0
-            adm_vals = np.array([
-                S_su, S_aa, 
-                0, 0, 0, 0, 0, # S_fa, S_va, S_bu, S_pro, S_ac, 
-                0, 0, # S_h2, S_ch4,
-                S_IC, S_IN, S_I, 
-                0, # X_c, 
-                X_ch, X_pr, X_li, 
-                0, 0, 0, 0, 0, 0, 0, # X_su, X_aa, X_fa, X_c4, X_pro, X_ac, X_h2,
-                X_I, S_cat, S_an, H2O])
-            
-            adm_vals = f_corr(asm_vals, adm_vals)
-            
-            # Step 7: charge balance
-            asm_charge_tot = _snh/14 - _sno/14 - _salk/12
-            #!!! charge balance should technically include VFAs, 
-            # but VFAs concentrations are assumed zero per previous steps??
-            S_IN = adm_vals[adm_ions_idx[0]]
-            S_IC = (asm_charge_tot -  S_IN*alpha_IN)/alpha_IC
-            net_Scat = asm_charge_tot + proton_charge
-            if net_Scat > 0:  
-                S_cat = net_Scat
-                S_an = 0
-            else:
-                S_cat = 0
-                S_an = -net_Scat
-            
-            adm_vals[adm_ions_idx[1:]] = [S_IC, S_cat, S_an]
-            
+        pH = self.pH
+        proton_charge = 10**(-self.pKa[0]+pH) - 10**(-pH) # self.pKa[0] is pKw
+        # the first five are user defined values, updated upon each conversion
+        params = np.array([
+            self.rtol, self.atol, self.frac_deg, self.xs_to_li, self.bio_to_li,
+            cmps_asm.S_NO.i_COD, cmps_asm.X_BH.i_N, cmps_asm.X_BA.i_N,
+            cmps_asm.X_I.i_N, cmps_asm.X_P.i_N,
+            cmps_adm.S_aa.i_N, cmps_adm.X_pr.i_N, cmps_adm.S_I.i_N, cmps_adm.X_I.i_N,
+            self.alpha_IN, self.alpha_IC, proton_charge,
+            ], dtype=float)
+        ions_idx = np.asarray(cmps_adm.indices(['S_IN', 'S_IC', 'S_cat', 'S_an']), dtype=np.intp)
+        self._balance_args = args = (
+            np.asarray(cmps_asm.i_COD, dtype=float), np.asarray(cmps_asm.i_N, dtype=float),
+            np.zeros(0, dtype=np.intp),
+            np.asarray(cmps_asm.indices(('S_NO', 'S_N2')), dtype=np.intp),
+            np.asarray(cmps_adm.i_COD, dtype=float), np.asarray(cmps_adm.i_N, dtype=float),
+            )
+        counts = self._warning_counts
+        n_adm = len(cmps_adm)
+
+        def asm2adm(asm_vals, adm_vals=None):
+            if adm_vals is None: adm_vals = np.empty(n_adm)
+            params[:5] = self.rtol, self.atol, self.frac_deg, self.xs_to_li, self.bio_to_li
+            _asm2adm(asm_vals, adm_vals, params, ions_idx, *args, counts)
             return adm_vals
         
-        self._reactions = asm2adm    
\ No newline at end of file
+        def asm2adm_batch(asm_arr):
+            adm_arr = np.empty((asm_arr.shape[0], n_adm))
+            params[:5] = self.rtol, self.atol, self.frac_deg, self.xs_to_li, self.bio_to_li
+            _asm2adm_batch(asm_arr, adm_arr, params, ions_idx, *args, counts)
+            return adm_arr
+        
+        self._reactions = asm2adm
+        self._batch_reactions = asm2adm_batch
@@ -11,8 +11,9 @@ for license details.
 '''
 
 from .. import SanUnit, WasteStream, Process, Processes, CompiledProcesses
-from ._clarifier import _settling_flux
-from sympy import symbols, lambdify, Matrix
+from .._process import _load_kernel
+from ._clarifier import _settling_flux, npmin
+from sympy import symbols
 from scipy.integrate import solve_ivp
 from warnings import warn
 from math import floor, ceil
@@ -23,13 +24,20 @@ from numba import njit
 __all__ = ('CSTR',
            'BatchExperiment',
            'SBR',
+           'PFR',
            )
 
+def _sync_parameters(processes, model):
+    # the combined processes hold parameter values from when they were compiled
+    processes._parameters.update(model.parameters)
+    if processes._param_arr is not None: processes._update_param_arr()
+
 def _add_aeration_to_growth_model(aer, model):
     if isinstance(aer, Process):
-        processes = Processes(model.tuple)
-        processes.append(aer)
-        processes.compile()
+        # reuse the compiled processes (if cached) when recompiling the ODE
+        processes = CompiledProcesses((*model.tuple, aer))
+        processes.compile(backend=getattr(model, 'backend', None))
+        _sync_parameters(processes, model)
     else:
         processes = model
         processes.compile()
@@ -59,6 +67,29 @@ def dydt_cstr_no_rxn_controlled_aer(QC_ins, dQC_ins, V_arr, Q_e_arr, _dstate, QC
     flow_out = Q_e_arr * QC[:-1] / V_arr
     _dstate[:-1] = flow_in - flow_out
 
+# Right-hand side of the CSTR, appended to the source code of the
+# `production_rates(y, p)` kernel of the (combined) growth model
+# so that the whole dy/dt is `numba`-compiled and cached as one function
+_dydt_cstr_source = '''
+@njit(cache=True)
+def dydt_cstr(QC_ins, dQC_ins, QC, y, p, V, i_DO, fixed_DO, dstate):
+    m = QC.shape[0] - 1
+    if i_DO >= 0: QC[i_DO] = fixed_DO
+    Q_e = 0.
+    dQ = 0.
+    for j in range(QC_ins.shape[0]):
+        Q_e += QC_ins[j, -1]
+        dQ += dQC_ins[j, -1]
+    y[:m+1] = QC # slots after m+1 hold the exogenous dynamic variables
+    r = production_rates(y, p)
+    for i in range(m):
+        flow_in = 0.
+        for j in range(QC_ins.shape[0]): flow_in += QC_ins[j, -1] * QC_ins[j, i]
+        dstate[i] = (flow_in - Q_e * QC[i]) / V + r[i]
+    dstate[m] = dQ
+    if i_DO >= 0: dstate[i_DO] = 0.
+'''
+
 #%%
 class CSTR(SanUnit):
     '''
@@ -88,6 +119,9 @@ class CSTR(SanUnit):
         reactor is aerated. The default is 'S_O2'.
     suspended_growth_model : :class:`Processes`, optional
         The suspended growth biokinetic model. The default is None.
+        When the model uses the "numba" backend (see :func:`CompiledProcesses.set_backend`)
+        and has no dynamic parameters, the entire right-hand side of the reactor
+        (flows, reactions, and aeration) is evaluated by one compiled function.
     exogenous_var : iterable[:class:`ExogenousDynamicVariable`], optional
         Any exogenous dynamic variables that affect the process mass balance,
         e.g., temperature, sunlight irradiance. Must be independent of state 
@@ -207,6 +241,9 @@ class CSTR(SanUnit):
         if self._concs is not None: Cs = self._concs
         else: Cs = mixed.conc
         self._state = np.append(Cs, Q).astype('float64')
+        if isinstance(self._aeration, (float, int)):
+            # start at the DO held by the fixed aeration
+            self._state[self.components.index(self._DO_ID)] = self._aeration
         self._dstate = self._state * 0.
 
     def _update_state(self):
@@ -214,18 +251,20 @@ class CSTR(SanUnit):
         if self.split is None: self._outs[0].state = arr
         else:
             for ws, spl in zip(self._outs, self.split):
-                y = arr.copy()
+                y = ws.state # written in place when available
+                if y is None: ws.state = y = arr.copy()
+                else: y[:] = arr
                 y[-1] *= spl
-                ws.state = y
 
     def _update_dstate(self):
         arr = self._dstate
         if self.split is None: self._outs[0].dstate = arr
         else:
             for ws, spl in zip(self._outs, self.split):
-                y = arr.copy()
+                y = ws.dstate
+                if y is None: ws.dstate = y = arr.copy()
+                else: y[:] = arr
                 y[-1] *= spl
-                ws.dstate = y
 
     def _run(self):
         '''Only to converge volumetric flows.'''
@@ -267,27 +306,109 @@ class CSTR(SanUnit):
         V_arr = np.full(m, self._V_max)
         Q_e_arr = np.zeros(m)
         hasexo = bool(len(self._exovars))
-        f_exovars = self.eval_exo_dynamic_vars
+        f_exovars = self._get_exo_group()
         
-        if isa(self._aeration, (float, int)):
+        if self._model is not None and processes.backend == 'numba' \
+            and not processes._dyn_params:
+            # flows, reactions, and aeration in one compiled function
+            dydt_cstr = _load_kernel(processes._get_production_rates_source() \
+                                     + _dydt_cstr_source, 'dydt_cstr')
+            p = processes._param_arr
+            y = np.zeros(m+1+len(self._exovars))
+            V = float(self._V_max)
+            if isa(self._aeration, (float, int)):
+                i = self.components.index(self._DO_ID)
+                fixed_DO = float(self._aeration)
+            else: i, fixed_DO = -1, 0.
+            def dy_dt(t, QC_ins, QC, dQC_ins):
+                if hasexo: y[m+1:] = f_exovars(t)
+                dydt_cstr(QC_ins, dQC_ins, QC, y, p, V, i, fixed_DO, _dstate)
+                _update_dstate()
+        elif isa(self._aeration, (float, int)):
             i = self.components.index(self._DO_ID)
             fixed_DO = self._aeration
+            y = np.zeros(m+1+len(self._exovars)) # state with the exogenous variables
             def dy_dt(t, QC_ins, QC, dQC_ins):
                 QC[i] = fixed_DO
                 dydt_cstr_no_rxn_controlled_aer(QC_ins, dQC_ins, V_arr, Q_e_arr, _dstate, QC)
-                if hasexo: QC = np.append(QC, f_exovars(t))
+                if hasexo:
+                    y[:m+1] = QC
+                    y[m+1:] = f_exovars(t)
+                    QC = y
                 _dstate[:-1] += r(QC)
                 _dstate[i] = 0
                 _update_dstate()
         else:
+            y = np.zeros(m+1+len(self._exovars))
             def dy_dt(t, QC_ins, QC, dQC_ins):
                 dydt_cstr_no_rxn_fixed_aer(QC_ins, dQC_ins, V_arr, Q_e_arr, _dstate, QC)
-                if hasexo: QC = np.append(QC, f_exovars(t))
+                if hasexo:
+                    y[:m+1] = QC
+                    y[m+1:] = f_exovars(t)
+                    QC = y
                 _dstate[:-1] += r(QC)
                 _update_dstate()
 
         self._ODE = dy_dt
 
+    def _compile_ODE_jacobian(self):
+        m = len(self.components)
+        if self._model is None:
+            dr = lambda state_arr: np.zeros((m, m))
+        else:
+            processes = _add_aeration_to_growth_model(self._aeration, self._model)
+            if not processes._has_symbolic_kinetics():
+                self._ODE_jac = False # not available
+                return
+            dr = processes.production_rates_jacobian_eval
+
+        V = self._V_max
+        J = np.zeros((m+1, m+1))
+        diag = np.arange(m)
+        hasexo = bool(len(self._exovars))
+        f_exovars = self._get_exo_group()
+        y = np.zeros(m+1+len(self._exovars))
+        if isinstance(self._aeration, (float, int)):
+            i = self.components.index(self._DO_ID)
+            fixed_DO = self._aeration
+            def jac(t, QC_ins, QC):
+                y[:m+1] = QC
+                y[i] = fixed_DO
+                if hasexo: y[m+1:] = f_exovars(t)
+                J[:m, :m] = dr(y)
+                J[diag, diag] -= QC_ins[:, -1].sum() / V
+                J[i, :] = J[:, i] = 0
+                return J
+        else:
+            def jac(t, QC_ins, QC):
+                if hasexo:
+                    y[:m+1] = QC
+                    y[m+1:] = f_exovars(t)
+                    QC = y
+                J[:m, :m] = dr(QC)
+                J[diag, diag] -= QC_ins[:, -1].sum() / V
+                return J
+
+        self._ODE_jac = jac
+
+    @property
+    def jacobian_sparsity(self):
+        '''
+        [scipy.sparse.csr_matrix] Structural nonzeros of the Jacobian of the
+        reactor's ODEs, given by the sparsity of the suspended growth model
+        (with aeration) and the dilution on the diagonal.
+        '''
+        from scipy.sparse import block_diag
+        m = len(self.components)
+        if self._model is None: blk = np.eye(m, dtype=bool)
+        else:
+            processes = _add_aeration_to_growth_model(self._aeration, self._model)
+            if processes._has_symbolic_kinetics():
+                blk = processes.jacobian_sparsity | np.eye(m, dtype=bool)
+            else: blk = np.ones((m, m), dtype=bool)
+        # total flow is independent of concentrations
+        return block_diag([blk, np.zeros((1, 1), dtype=bool)], format='csr').astype(bool)
+
     def _design(self):
         pass
 
@@ -375,10 +496,15 @@ class BatchExperiment(SanUnit):
 
         _dstate = self._dstate
         hasexo = bool(len(self._exovars))
-        f_exovars = self.eval_exo_dynamic_vars
+        f_exovars = self._get_exo_group()
+        
+        y = np.zeros(len(_dstate)+len(self._exovars))
         
         def dy_dt(t, QC_ins, QC, dQC_ins):
-            if hasexo: QC = np.append(QC, f_exovars(t))
+            if hasexo:
+                y[:len(QC)] = QC
+                y[len(QC):] = f_exovars(t)
+                QC = y
             _dstate[:-1] = r(QC)
             
         self._ODE = dy_dt
@@ -491,6 +617,8 @@ class SBR(SanUnit):
         self._init_Vas = None
         self._init_Cas = None
         self._dynamic_composition = None
+        self._inputs = np.zeros(len(self.components)+2)
+        self._dC_dt_cache = {}
 
 
     @property
@@ -525,7 +653,7 @@ class SBR(SanUnit):
             sludge.copy_like(inf)
             C_in = inf.mass / inf.F_vol * 1e3    # concentrations in g/m3
             cmps = self.components
-            C = list(symbols(cmps.IDs))
+            m = len(cmps)
             if self._init_Vas is not None:
                 V_0 = self._init_Vas
                 C_0 = self._init_Cas
@@ -535,68 +663,64 @@ class SBR(SanUnit):
             n = self._N_layer
             if self._aeration.count(None) == len(self._aeration):
                 Vmax = self._V
-                hj = self._h/n
             else:
                 Vmax = self._V*0.75
-                hj = self._h*0.75/n
 
             # ********fill and mix/aerate stages***********
-            T_fill = (Vmax - V_0)/Q_in # maximum total fill time in day
+            # stages are integrated with the compiled rate functions of each
+            # (fill, aeration) setting, filling stops upon a full reactor
+            inputs = self._inputs
+            inputs[:m] = C_in
+            inputs[m] = Q_in
+            inputs[m+1] = Vmax
             T = [t/24 for t in self._operation_cycle]  # operation cycle in day
-            if T_fill <= T[0]:
-                schedule = [T_fill, T[0]-T_fill] + T[1:4]
-                aer = [self._aeration[0], self._aeration[0]] + list(self._aeration[1:4])
-                fill = [True] + [False]*4
-                V_total = Vmax
-            elif T_fill <= T[0]+T[1]:
-                schedule = [T[0], T_fill-T[0], T[0]+T[1]-T_fill] + T[2:4]
-                aer = list(self._aeration[:2]) + [self._aeration[1]] + list(self._aeration[2:4])
-                fill = [True]*2 + [False]*3
-                V_total = Vmax
-            else:
-                schedule = T[:4]
-                aer = list(self._aeration[:4])
-                fill = [True]*2 + [False]*2
-                V_total = Q_in*(T[0]+T[1])+V_0
-                hj = V_total/self._V*self._h/n
-
-            for i in range(1, len(schedule)):
-                if fill[-i] == fill[-i-1] and aer[-i] == aer[-i-1]:
-                    schedule[-i-1] += schedule[-i]
-                    schedule[-i] = 0
-
-            t_arr = np.array([])
-            y_mat = np.ndarray([])
-            for i in range(len(schedule)):
-                if schedule[i] > 0:
-                    dC_dt, J_func = self._compile_dC_dt(V_0, Q_in, C_in, C, fill[i], aer[i])
-                    if isa(aer[i], (float, int)): C_0[cmps.index(self._DO_ID)] = aer[i]
-                    sol = solve_ivp(dC_dt, (0, schedule[i]), C_0, method='BDF', jac=J_func)
-                    C_0 = sol.y.transpose()[-1]
-                    V_0 += Q_in * schedule[i] * fill[i]
-                    t_arr = np.concatenate((t_arr, sol.t + t_arr[-1]))
-                    y_mat = np.hstack((y_mat, sol.y))
-            self._dynamic_composition = np.vstack((t_arr, y_mat)).transpose()
+            y0 = np.append(C_0, V_0)
+            full = V_0 >= Vmax
+            t0 = 0.
+            ts, ys = [], []
+            for k in range(4):
+                if T[k] <= 0: continue
+                t1 = t0 + T[k]
+                aer = self._aeration[k]
+                if isa(aer, (float, int)): y0[cmps.index(self._DO_ID)] = aer
+                while t0 < t1:
+                    fill = k < 2 and not full
+                    dy_dt, jac = self._get_dC_dt(fill, aer)
+                    sol = solve_ivp(dy_dt, (t0, t1), y0, method='BDF', jac=jac,
+                                    events=self._full_event if fill else None)
+                    ts.append(sol.t)
+                    ys.append(sol.y[:m])
+                    y0 = sol.y[:, -1].copy()
+                    if sol.status == 1: 
+                        full = True
+                        t0 = sol.t[-1]
+                    else: t0 = t1
+            C_0, V_total = y0[:m], y0[m]
+            self._dynamic_composition = np.vstack((np.concatenate(ts), 
+                                                   np.hstack(ys))).transpose()
 
             # *********settle, decant, desludge**********
             eff.set_flow(C_0*eff.F_vol, 'g/hr', self.components.IDs)
             X_0 = eff.get_TSS()
             X_min = X_0 * self._fns
             T_settle = T[4]
+            hj = V_total/self._A/n
+            args = (self._v_max, self._v_max_p, X_min, self._rh, self._rp, np.zeros(n))
+            X_t = self._X_t
             def dX_dt(t, X):
-                VX = [_settling_flux(x, self._v_max, self._v_max_p, X_min, self._rh, self._rp) for x in X]
-                J = [VX[j] if X[j+1] <= self._X_t else min(VX[j], VX[j+1]) for j in range(n-1)]
-                settle_out = np.array(J + [0])
-                settle_in = np.array([0] + J)
-                dXdt = (settle_in - settle_out)/hj
-                return dXdt
+                VX = _settling_flux(X, *args)
+                J = np.where(X[1:] <= X_t, VX[:-1], npmin(VX[:-1], VX[1:]))
+                dXdt = np.zeros(n)
+                dXdt[1:] += J   # settling in
+                dXdt[:-1] -= J  # settling out
+                return dXdt/hj
             sol = solve_ivp(dX_dt, (0, T_settle), np.ones(n)*X_0)
             X = sol.y.transpose()[-1]
 
             V_eff = min(T[5]*self._Q_e, V_total*(n-1)/n)
-            n_eff = V_eff/V_total
+            n_eff = V_eff/V_total*n
             w_eff = np.array([1]*floor(n_eff)+[n_eff-floor(n_eff)])
-            X_eff = np.average(X[:ceil(n_eff)], weights=w_eff)
+            X_eff = np.average(X[:ceil(n_eff)], weights=w_eff[:ceil(n_eff)])
             eff_mass_flow = (X_eff/X_0*cmps.x + (1-cmps.x))*C_0*V_eff/T[5]
             eff.set_flow(eff_mass_flow, 'g/d', cmps.IDs)
 
@@ -614,40 +738,495 @@ class SBR(SanUnit):
     def _design(self):
         pass
 
-    def _compile_dC_dt(self, V0, Qin, Cin, C, fill, aer):
-        isa = isinstance
-        processes = _add_aeration_to_growth_model(aer, self._model)
-        if fill:
-            t = symbols('t')
-            mass_balance_terms = list(zip(Cin, C, processes.production_rates.rate_of_production))
-            C_dot_eqs = [(cin-c)/(t+V0/Qin) + r for cin, c, r in mass_balance_terms]
-            if isa(aer, (float, int)): C_dot_eqs[self.components.index(self._DO_ID)] = 0
-            def dC_dt(t, y):
-                C_dot = lambdify([t]+C, C_dot_eqs)
-                return C_dot(t, *y)
-            J = Matrix(dC_dt(t, C)).jacobian(C)
+    def _full_event(self, t, y):
+        return y[-1] - self._inputs[-1]
+    _full_event.terminal = True
+    _full_event.direction = 1
+
+    def _get_dC_dt(self, fill, aer):
+        # keyed on the objects so that they are kept alive while cached
+        key = (self._model, fill, aer)
+        cached = self._dC_dt_cache.get(key)
+        if cached is None:
+            processes = _add_aeration_to_growth_model(aer, self._model)
+            self._dC_dt_cache[key] = cached = (processes, *self._compile_dC_dt(processes, fill, aer))
         else:
-            C_dot_eqs = processes.production_rates.rate_of_production
-            if isa(aer, (float, int)): C_dot_eqs[self.components.index(self._DO_ID)] = 0
-            def dC_dt(t, y):
-                C_dot = lambdify(C, C_dot_eqs)
-                return C_dot(*y)
-            J = Matrix(dC_dt(None, C)).jacobian(C)
-        def J_func(t, y):
-            J_func = lambdify(C, J)
-            return J_func(*y)
-        return (dC_dt, J_func)
-
-# class PFR(SanUnit):
-
-#     _N_ins = 1
-#     _N_outs = 2
-
-#     def __init__(self, ID='', ins=None, outs=(), **kwargs):
-#         SanUnit.__init__(self, ID, ins, outs)
-
-#     def _run(self, steady_state=True):
-#         pass
-
-#     def _design(self):
-#         pass
\ No newline at end of file
+            processes = cached[0]
+            # parameters of the model might have been set since the last run
+            if processes is not self._model: _sync_parameters(processes, self._model)
+        return cached[1:]
+
+    def _compile_dC_dt(self, processes, fill, aer):
+        # compiled once for each (fill, aeration) setting and reused for all
+        # cycles, the influent and the maximum volume are read from `_inputs`
+        r = processes.production_rates_eval
+        m = len(self.components)
+        inputs = self._inputs
+        C_in = inputs[:m]
+        V_min = 1e-6 * self._V # the first fill starts from an empty reactor
+        i = self.components.index(self._DO_ID) if isinstance(aer, (float, int)) else None
+        y = np.zeros(m+1)   # state array for the kinetics, i.e., concentrations and flow rate
+        def dC_dt(t, C_V):
+            y[:m] = C_V[:m]
+            y[m] = inputs[m]
+            dy = np.zeros(m+1)
+            dy[:m] = r(y)
+            if fill:
+                dy[:m] += inputs[m] * (C_in - y[:m]) / max(C_V[m], V_min)
+                dy[m] = inputs[m]
+            if i is not None: dy[i] = 0
+            return dy
+
+        if not processes._has_symbolic_kinetics(): return dC_dt, None
+        dr = processes.production_rates_jacobian_eval
+        diag = np.arange(m)
+        def J_func(t, C_V):
+            y[:m] = C_V[:m]
+            y[m] = inputs[m]
+            J = np.zeros((m+1, m+1))
+            J[:m, :m] = dr(y)
+            if fill and C_V[m] > V_min:
+                J[diag, diag] -= inputs[m] / C_V[m]
+                J[:m, m] = - inputs[m] * (C_in - y[:m]) / C_V[m]**2
+            if i is not None: J[i, :] = 0
+            return J
+        return dC_dt, J_func
+
+#%%
+@njit(cache=True)
+def dydt_pfr_no_rxn(QC_ins, dQC_ins, feed, V_arr, C, Q_arr, dC):
+    '''
+    Hydraulics of tanks in series, writes the flow rates through and the rates
+    of change of concentrations in each compartment to `Q_arr` and `dC`,
+    and returns the rate of change of the total flow rate.
+    '''
+    N, m = C.shape
+    n_ins = QC_ins.shape[0]
+    Q = 0.
+    dQ = 0.
+    for j in range(N):
+        for i in range(m): dC[j, i] = Q * C[j-1, i] if j > 0 else 0.
+        for k in range(n_ins):
+            if feed[k] == j:
+                Q_k = QC_ins[k, -1]
+                Q += Q_k
+                for i in range(m): dC[j, i] += Q_k * QC_ins[k, i]
+        Q_arr[j] = Q
+        for i in range(m): dC[j, i] = (dC[j, i] - Q * C[j, i]) / V_arr[j]
+    for k in range(n_ins): dQ += dQC_ins[k, -1]
+    return dQ
+
+class PFR(SanUnit):
+    '''
+    A plug flow reactor modeled as completely mixed compartments (tanks) in series.
+    States of all compartments are held by the reactor as a block, and the
+    kinetics of all compartments are evaluated at once.
+
+    Parameters
+    ----------
+    ID : str
+        ID for the reactor.
+    ins : :class:`WasteStream`
+        Influents to the reactor. Can be an array of up to 3 WasteStream objects by
+        default, typically wastewater to be treated, recycled effluent, recycled
+        activated sludge.
+    outs : :class:`WasteStream`
+        Treated effluent.
+    split : iterable of float
+        Volumetric splits of effluent flows if there are more than one effluent.
+        The default is None.
+    N_tanks_in_series : int, optional
+        The number of compartments. The default is 5.
+    V_tanks : float or iterable[float], optional
+        Volume of each compartment, in [m^3]. The default is 1000.
+    feed_stages : iterable[int], optional
+        Index of the compartment (counting from 0) each influent enters.
+        The default is None, i.e., all influents enter the first compartment.
+    aeration : float or iterable[float or None], optional
+        Targeted dissolved oxygen concentration of each compartment in [mg O2/L],
+        or None for compartments without a targeted concentration. The default is 2.0.
+    kLa : float or iterable[float], optional
+        Oxygen transfer coefficient of each compartment in [d^(-1)], only relevant
+        for compartments without a targeted dissolved oxygen concentration.
+        The default is 0 (i.e., not aerated).
+    DOsat : float, optional
+        Saturation dissolved oxygen concentration, in [mg O2/L]. The default is 8.0.
+    DO_ID : str, optional
+        The :class:`Component` ID for dissolved oxygen, only relevant when the
+        reactor is aerated. The default is 'S_O2'.
+    suspended_growth_model : :class:`CompiledProcesses`, optional
+        The suspended growth biokinetic model. The default is None.
+    exogenous_var : iterable[:class:`ExogenousDynamicVariable`], optional
+        Any exogenous dynamic variables that affect the process mass balance,
+        e.g., temperature, sunlight irradiance. Must be independent of state
+        variables of the suspended_growth_model (if has one).
+
+    Examples
+    --------
+    >>> from qsdsan import processes as pc, sanunits as su, WasteStream
+    >>> cmps = pc.create_asm1_cmps()
+    >>> asm1 = pc.ASM1()
+    >>> inf = WasteStream('inf', H2O=1e5, units='kg/hr')
+    >>> PFR = su.PFR('PFR', ins=inf, N_tanks_in_series=4, V_tanks=[1000, 1000, 1333, 1333],
+    ...              aeration=[None, None, 2.0, 2.0], DO_ID='S_O',
+    ...              suspended_growth_model=asm1)
+    >>> PFR.jacobian_bandwidth
+    (15, 14)
+
+    See Also
+    --------
+    :class:`CSTR`
+    '''
+
+    _N_ins = 3
+    _N_outs = 1
+    _ins_size_is_fixed = False
+    _outs_size_is_fixed = False
+
+    def __init__(self, ID='', ins=None, outs=(), split=None, thermo=None,
+                 init_with='WasteStream', N_tanks_in_series=5, V_tanks=1000,
+                 feed_stages=None, aeration=2.0, kLa=0., DOsat=8.0,
+                 DO_ID='S_O2', suspended_growth_model=None,
+                 isdynamic=True, exogenous_vars=(), **kwargs):
+        SanUnit.__init__(self, ID, ins, outs, thermo, init_with, isdynamic=isdynamic,
+                         exogenous_vars=exogenous_vars, **kwargs)
+        self._N = int(N_tanks_in_series)
+        self.V_tanks = V_tanks
+        self.feed_stages = feed_stages
+        self.aeration = aeration
+        self.kLa = kLa
+        self.DOsat = DOsat
+        self._DO_ID = DO_ID
+        self.suspended_growth_model = suspended_growth_model
+        self._concs = None
+        self._mixed = WasteStream()
+        self.split = split
+        self._state_header = [f'{cmp.ID}_{j} [mg/L]' for j in range(self._N) \
+                              for cmp in self.components] + ['Q [m3/d]']
+
+    def _per_tank(self, value):
+        if isinstance(value, (float, int)) or value is None: return [value]*self._N
+        value = list(value)
+        if len(value) != self._N:
+            raise ValueError(f'expects a scalar or an iterable of length {self._N}, '
+                             f'not {len(value)}')
+        return value
+
+    @property
+    def N_tanks_in_series(self):
+        '''[int] The number of compartments.'''
+        return self._N
+
+    @property
+    def V_tanks(self):
+        '''[numpy.1darray] Volume of each compartment, in m^3.'''
+        return self._V_tanks
+
+    @V_tanks.setter
+    def V_tanks(self, Vs):
+        Vs = np.asarray(self._per_tank(Vs), dtype=float)
+        if (Vs <= 0).any(): raise ValueError('volume of compartments must be positive.')
+        self._V_tanks = Vs
+
+    @property
+    def V_max(self):
+        '''[float] Total volume of the compartments, in m^3.'''
+        return self._V_tanks.sum()
+
+    @property
+    def feed_stages(self):
+        '''[numpy.1darray] Index of the compartment each influent enters.'''
+        return self._feed_stages
+
+    @feed_stages.setter
+    def feed_stages(self, stages):
+        if stages is None: stages = [0]*len(self._ins)
+        stages = np.asarray(stages, dtype=np.int64)
+        if len(stages) != len(self._ins):
+            raise ValueError(f'feed_stages must have one entry for each of the '
+                             f'{len(self._ins)} influents, not {len(stages)}.')
+        if ((stages < 0) | (stages >= self._N)).any():
+            raise ValueError(f'feed_stages must be within [0, {self._N-1}].')
+        self._feed_stages = stages
+
+    @property
+    def aeration(self):
+        '''[list] Targeted dissolved oxygen concentration of each compartment, in mg O2/L.'''
+        return self._aeration
+
+    @aeration.setter
+    def aeration(self, ae):
+        ae = self._per_tank(ae)
+        for DO in ae:
+            if DO is None: continue
+            elif not isinstance(DO, (float, int)):
+                raise TypeError(f'aeration must be float, int, NoneType, or an '
+                                f'iterable of them, not {type(DO)}')
+            elif DO < 0:
+                raise ValueError('targeted dissolved oxygen concentration for aeration must be non-negative.')
+            elif DO > 14:
+                warn(f'targeted dissolved oxygen concentration for {self.ID} might exceed the saturated level.')
+        self._aeration = ae
+
+    @property
+    def kLa(self):
+        '''
+        [numpy.1darray] Oxygen transfer coefficient of each compartment, in d^(-1).
+        Can be updated in place during dynamic simulation.
+        '''
+        return self._kLa
+
+    @kLa.setter
+    def kLa(self, k):
+        k = np.asarray(self._per_tank(k), dtype=float)
+        if (k < 0).any(): raise ValueError('kLa must be non-negative.')
+        if getattr(self, '_kLa', None) is None: self._kLa = k
+        else: self._kLa[:] = k # compiled ODE reads from the same array
+
+    @property
+    def DO_ID(self):
+        '''[str] The `Component` ID for dissolved oxygen used in the suspended growth model and the aeration model.'''
+        return self._DO_ID
+
+    @DO_ID.setter
+    def DO_ID(self, doid):
+        if doid not in self.components.IDs:
+            raise ValueError(f'DO_ID must be in the set of `CompiledComponents` used to set thermo, '
+                             f'i.e., one of {self.components.IDs}.')
+        self._DO_ID = doid
+
+    @property
+    def suspended_growth_model(self):
+        '''[:class:`CompiledProcesses` or NoneType] Suspended growth model.'''
+        return self._model
+
+    @suspended_growth_model.setter
+    def suspended_growth_model(self, model):
+        if isinstance(model, CompiledProcesses) or model is None: self._model = model
+        else: raise TypeError(f'suspended_growth_model must be one of the following '
+                              f'types: CompiledProesses, NoneType. Not {type(model)}')
+
+    @property
+    def split(self):
+        '''[numpy.1darray or NoneType] The volumetric split of outs.'''
+        return self._split
+
+    @split.setter
+    def split(self, split):
+        if split is None: self._split = split
+        else:
+            if len(split) != len(self._outs):
+                raise ValueError('split and outs must have the same size')
+            self._split = np.array(split)/sum(split)
+
+    @property
+    def state(self):
+        '''
+        [pandas.DataFrame] Component concentrations [mg/L] in each compartment
+        and the effluent flow rate [m^3/d] (identical for all rows).
+        '''
+        if self._state is None: return None
+        m = len(self.components)
+        df = pd.DataFrame(self._state[:-1].reshape((self._N, m)),
+                          columns=self.components.IDs)
+        df['Q'] = self._state[-1]
+        return df
+
+    @state.setter
+    def state(self, QCs):
+        QCs = np.asarray(QCs, dtype=float)
+        n = self._N * len(self.components) + 1
+        if QCs.shape != (n, ):
+            raise ValueError(f'state must be a 1D array of length {n}, indicating '
+                             f'component concentrations [mg/L] in each compartment '
+                             f'followed by the total flow rate [m^3/d]')
+        self._state = QCs
+
+    def set_init_conc(self, **kwargs):
+        '''
+        Set the initial concentrations [mg/L] of the compartments,
+        each value can be a scalar (same for all compartments) or an iterable
+        with one value for each compartment.
+        '''
+        Cs = np.zeros((self._N, len(self.components)))
+        cmpx = self.components.index
+        for k, v in kwargs.items(): Cs[:, cmpx(k)] = self._per_tank(v)
+        self._concs = Cs
+
+    def _init_state(self):
+        mixed = self._mixed
+        Q = mixed.get_total_flow('m3/d')
+        if self._concs is not None: Cs = self._concs
+        else: Cs = np.tile(mixed.conc, (self._N, 1))
+        self._state = np.append(Cs.flatten(), Q).astype('float64')
+        fixed, fixed_DO = self._fixed_DO()
+        if len(fixed):
+            # start at the DO held by the fixed aeration
+            m = len(self.components)
+            self._state[fixed*m + self.components.index(self._DO_ID)] = fixed_DO
+        self._dstate = self._state * 0.
+
+    def _update_state(self):
+        self._update_outs(self._state, 'state')
+
+    def _update_dstate(self):
+        self._update_outs(self._dstate, 'dstate')
+
+    def _update_outs(self, arr, attr):
+        # effluent is the last tank, written in place when available
+        m = len(self.components)
+        split = (1.,) if self.split is None else self.split
+        for ws, spl in zip(self._outs, split):
+            y = getattr(ws, attr)
+            if y is None:
+                y = np.empty(m+1)
+                setattr(ws, attr, y)
+            y[:-1] = arr[-(m+1):-1]
+            y[-1] = arr[-1] * spl
+
+    def _run(self):
+        '''Only to converge volumetric flows.'''
+        mixed = self._mixed # avoid creating multiple new streams
+        mixed.mix_from(self.ins)
+        Q = mixed.F_vol # m3/hr
+        if self.split is None: self.outs[0].copy_like(mixed)
+        else:
+            for ws, spl in zip(self._outs, self.split):
+                ws.copy_like(mixed)
+                ws.set_total_flow(Q*spl, 'm3/hr')
+
+    def get_retained_mass(self, biomass_IDs):
+        cmps = self.components
+        Cs = self._state[:-1].reshape((self._N, len(cmps)))
+        mass = (self._V_tanks @ Cs) * cmps.i_mass
+        return mass[cmps.indices(biomass_IDs)].sum()
+
+    def _fixed_DO(self):
+        fixed = [j for j, DO in enumerate(self._aeration) if DO is not None]
+        return np.array(fixed, dtype=np.int64), \
+            np.array([self._aeration[j] for j in fixed], dtype=float)
+
+    @property
+    def ODE(self):
+        if self._ODE is None:
+            self._compile_ODE()
+        return self._ODE
+
+    def _compile_ODE(self):
+        m = len(self.components)
+        N = self._N
+        model = self._model
+        if model is None:
+            warn(f'{self.ID} was initialized without a suspended growth model, '
+                 f'and thus run as a non-reactive unit')
+            r = None
+        else: r = model.production_rates_batch_eval
+
+        _dstate = self._dstate
+        dC = _dstate[:-1].reshape((N, m))
+        _update_dstate = self._update_dstate
+        V_arr = self._V_tanks
+        feed = self._feed_stages
+        Q_arr = np.zeros(N)
+        hasexo = bool(len(self._exovars))
+        f_exovars = self._get_exo_group()
+        Y = np.zeros((N, m+1+len(self._exovars))) # states of all compartments
+        fixed, fixed_DO = self._fixed_DO()
+        has_fixed = bool(len(fixed))
+        kLa = self._kLa
+        aerated = has_fixed or bool(kLa.any())
+        if aerated:
+            i = self.components.index(self._DO_ID)
+            DOsat = self.DOsat
+
+        def dy_dt(t, QC_ins, QC, dQC_ins):
+            C = QC[:-1].reshape((N, m))
+            if has_fixed: C[fixed, i] = fixed_DO
+            _dstate[-1] = dydt_pfr_no_rxn(QC_ins, dQC_ins, feed, V_arr, C, Q_arr, dC)
+            if r is not None:
+                Y[:, :m] = C
+                Y[:, m] = Q_arr
+                if hasexo: Y[:, m+1:] = f_exovars(t)
+                dC[:] += r(Y)
+            if aerated:
+                dC[:, i] += kLa * (DOsat - C[:, i])
+                if has_fixed: dC[fixed, i] = 0
+            _update_dstate()
+
+        self._ODE = dy_dt
+
+    def _compile_ODE_jacobian(self):
+        m = len(self.components)
+        N = self._N
+        model = self._model
+        if model is None: dr = lambda state_arr: 0.
+        elif not model._has_symbolic_kinetics():
+            self._ODE_jac = False # not available
+            return
+        else: dr = model.production_rates_jacobian_eval
+
+        n = N * m + 1
+        J = np.zeros((n, n))
+        V_arr = self._V_tanks
+        feed = self._feed_stages
+        diag = np.arange(m)
+        hasexo = bool(len(self._exovars))
+        f_exovars = self._get_exo_group()
+        Y = np.zeros((N, m+1+len(self._exovars)))
+        fixed, fixed_DO = self._fixed_DO()
+        kLa = self._kLa
+        i = self.components.index(self._DO_ID) if (len(fixed) or kLa.any()) else None
+        DOsat = self.DOsat
+
+        def jac(t, QC_ins, QC):
+            Q_feed = np.zeros(N)
+            np.add.at(Q_feed, feed, QC_ins[:, -1])
+            Q_arr = np.cumsum(Q_feed)
+            Y[:, :m] = QC[:-1].reshape((N, m))
+            Y[:, m] = Q_arr
+            if i is not None: Y[fixed, i] = fixed_DO
+            if hasexo: Y[:, m+1:] = f_exovars(t)
+            J[:] = 0.
+            for j in range(N):
+                blk = slice(j*m, (j+1)*m)
+                J[blk, blk] = dr(Y[j])
+                J[j*m+diag, j*m+diag] -= Q_arr[j] / V_arr[j]
+                if j > 0: J[j*m+diag, (j-1)*m+diag] = Q_arr[j-1] / V_arr[j]
+                if i is not None: J[j*m+i, j*m+i] -= kLa[j]
+            if i is not None:
+                idx = fixed*m + i
+                J[idx, :] = J[:, idx] = 0
+            return J
+
+        self._ODE_jac = jac
+
+    @property
+    def jacobian_sparsity(self):
+        '''
+        [scipy.sparse.csr_matrix] Structural nonzeros of the Jacobian of the
+        reactor's ODEs, block tridiagonal with the sparsity of the
+        suspended growth model on the diagonal blocks and the flow
+        from upstream compartments on the lower blocks.
+        '''
+        from scipy.sparse import block_diag, eye, kron
+        m = len(self.components)
+        N = self._N
+        model = self._model
+        if model is None: blk = np.eye(m, dtype=bool)
+        elif model._has_symbolic_kinetics(): blk = model.jacobian_sparsity | np.eye(m, dtype=bool)
+        else: blk = np.ones((m, m), dtype=bool)
+        S = kron(eye(N, dtype=bool), blk) + kron(eye(N, k=-1, dtype=bool), eye(m, dtype=bool))
+        # total flow is independent of concentrations
+        return block_diag([S, np.zeros((1, 1), dtype=bool)], format='csr').astype(bool)
+
+    @property
+    def jacobian_bandwidth(self):
+        '''
+        [tuple] Lower and upper bandwidths of the Jacobian of the
+        reactor's ODEs, e.g., for `lband` and `uband` of the LSODA solver.
+        '''
+        m = len(self.components)
+        return (m, m-1)
+
+    def _design(self):
+        pass
@@ -33,6 +33,7 @@ from . import (
     formatting,
     loading,
     dynamics,
+    control,
     misc,
     model_eval,
     parsing,
@@ -48,6 +49,7 @@ from .construction import *
 from .formatting import *
 from .loading import *
 from .dynamics import *
+from .control import *
 from .misc import *
 from .model_eval import *
 from .parsing import *
@@ -65,6 +67,7 @@ __all__ = (
     *formatting.__all__,
     *loading.__all__,
     *dynamics.__all__,
+    *control.__all__,
     *model_eval.__all__,
     *misc.__all__,
     *parsing.__all__,
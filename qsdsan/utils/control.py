@@ -0,0 +1,431 @@
+# -*- coding: utf-8 -*-
+'''
+QSDsan: Quantitative Sustainable Design for sanitation and resource recovery systems
+
+This module is developed by:
+    Joy Zhang <joycheung1994@gmail.com>
+
+This module is under the University of Illinois/NCSA Open Source License.
+Please refer to https://github.com/QSD-Group/QSDsan/blob/main/LICENSE.txt
+for license details.
+'''
+
+from scipy import __version__ as _scipy_version
+from scipy.integrate import OdeSolver, RK23, RK45, DOP853, Radau, BDF, LSODA
+from scipy.optimize import brentq
+import numpy as np
+
+__all__ = ('Controller', 'DiscreteController', 'PIController',
+           'EventController', 'simulate_with_controllers')
+
+
+_methods = {'RK23': RK23, 'RK45': RK45, 'DOP853': DOP853,
+            'Radau': Radau, 'BDF': BDF, 'LSODA': LSODA}
+# solvers that tolerate a moved bound once finished, others (e.g., LSODA,
+# whose bound is fixed in the Fortran code) are restarted
+_warm_methods = (RK23, RK45, DOP853, Radau, BDF)
+# moving the bound sets the `t_bound` and `status` of the finished solver, which
+# are not part of the public API, so the solvers are restarted with other versions
+# (`OdeSolver.step` handles them the same way throughout scipy 1.x)
+_warm_scipy = (1, 0) <= tuple(int(i) for i in _scipy_version.split('.')[:2]) < (2, 0)
+
+def _get_measure(measured):
+    if callable(measured): return measured
+    stream, variable = measured
+    def measure():
+        i = -1 if variable == 'Q' else stream.components.index(variable)
+        return stream.state[i]
+    return measure
+
+class Controller:
+    '''
+    Base class of controllers that manipulate an attribute of an object
+    during dynamic simulation (e.g., `KLa` of a :class:`DiffusedAeration`
+    process or `split` of a :class:`Splitter`), see :func:`simulate_with_controllers`.
+
+    Parameters
+    ----------
+    ID : str
+        ID of the controller.
+    target : object
+        Object with the manipulated attribute.
+    attr : str
+        Name of the manipulated attribute.
+    '''
+    def __init__(self, ID, target, attr):
+        self._ID = ID
+        self.target = target
+        self.attr = attr
+        self._history = []
+
+    @property
+    def ID(self):
+        '''[str] ID of the controller.'''
+        return self._ID
+
+    @property
+    def history(self):
+        '''[list] Time and value of the manipulated attribute for all actions
+        in the last simulation.'''
+        return self._history
+
+    def set(self, t, value):
+        '''Set the manipulated attribute to `value` at time `t`.'''
+        setattr(self.target, self.attr, value)
+        self._history.append((t, value if np.isscalar(value) else np.copy(value)))
+
+    def reset(self):
+        '''Reset the controller before a simulation.'''
+        self._history = []
+
+    def __repr__(self):
+        return f'<{type(self).__name__}: {self._ID}>'
+
+
+class DiscreteController(Controller):
+    '''
+    Discrete-time controller that sets the manipulated attribute to the
+    value of a control law at every sampling instant, the value is held
+    between the instants (i.e., zero-order hold).
+
+    Parameters
+    ----------
+    ID : str
+        ID of the controller.
+    target : object
+        Object with the manipulated attribute.
+    attr : str
+        Name of the manipulated attribute.
+    law : callable
+        Function of time that returns the new value of the manipulated attribute
+        (or None to keep the current value), states of the units and streams
+        are up-to-date when it is called.
+    sample_time : float
+        Time between sampling instants, [d].
+    t_start : float, optional
+        First sampling instant, [d]. If None, will be the start of the simulation.
+
+    Examples
+    --------
+    Timed wastage, e.g., pumping for 2 hours every 12 hours:
+
+    >>> from qsdsan.utils import DiscreteController
+    >>> class Pump: split = 0.
+    >>> pump = Pump()
+    >>> WAS = DiscreteController('WAS', pump, 'split', sample_time=1/24,
+    ...                          law=lambda t: 0.02 if t % 0.5 < 2/24 else 0.)
+    >>> WAS
+    <DiscreteController: WAS>
+    '''
+    def __init__(self, ID, target, attr, law, sample_time, t_start=None):
+        super().__init__(ID, target, attr)
+        self.law = law
+        self.sample_time = sample_time
+        self.t_start = t_start
+
+    def _start(self, t0):
+        t_start = t0 if self.t_start is None else self.t_start
+        k = max(0, np.ceil((t0 - t_start) / self.sample_time))
+        self._k = k
+        self._t_start = t_start
+        self._t_next = t_start + k * self.sample_time
+
+    def sample(self, t):
+        '''Apply the control law at time `t`.'''
+        value = self.law(t)
+        if value is not None: self.set(t, value)
+        self._k += 1
+        self._t_next = self._t_start + self._k * self.sample_time
+
+
+class PIController(DiscreteController):
+    '''
+    Discrete-time proportional-integral controller in the velocity form,
+    i.e., :math:`u_k = u_{k-1} + K_p (e_k - e_{k-1}) + K_p T_s/T_i e_k`,
+    with :math:`e_k` being the setpoint minus the measured value.
+    The output is clipped to the bounds, which also prevents integral windup.
+
+    Parameters
+    ----------
+    ID : str
+        ID of the controller.
+    target : object
+        Object with the manipulated attribute.
+    attr : str
+        Name of the manipulated attribute.
+    measured : tuple(:class:`WasteStream`, str) or callable
+        The measured stream and variable (a component ID or "Q"),
+        or a function without arguments that returns the measured value.
+    setpoint : float
+        Setpoint of the measured variable.
+    Kp : float
+        Proportional gain.
+    Ti : float, optional
+        Integral time, [d]. If None, will be a proportional controller.
+    sample_time : float
+        Time between sampling instants, [d].
+    bounds : tuple(float, float), optional
+        Lower and upper bounds of the manipulated attribute. The default is (0, inf).
+    u0 : float, optional
+        Initial value of the manipulated attribute. If None, will
+        be the value of the attribute at the start of the simulation.
+    t_start : float, optional
+        First sampling instant, [d]. If None, will be the start of the simulation.
+
+    Examples
+    --------
+    Dissolved oxygen control in the last aerobic tank of BSM1:
+
+    >>> from qsdsan import processes as pc, WasteStream
+    >>> from qsdsan.utils import PIController
+    >>> cmps = pc.create_asm1_cmps()
+    >>> aer = pc.DiffusedAeration('aer', 'S_O', KLa=84, DOsat=8.0, V=1333)
+    >>> eff = WasteStream('eff')
+    >>> DO_ctrl = PIController('DO', aer, 'KLa', measured=(eff, 'S_O'), setpoint=2,
+    ...                        Kp=500, Ti=0.001, sample_time=1/1440, bounds=(0, 360))
+    >>> DO_ctrl
+    <PIController: DO>
+    '''
+    def __init__(self, ID, target, attr, measured, setpoint, Kp, Ti=None,
+                 sample_time=1/1440, bounds=(0, np.inf), u0=None, t_start=None):
+        super().__init__(ID, target, attr, self._law, sample_time, t_start)
+        self._measure = _get_measure(measured)
+        self.setpoint = setpoint
+        self.Kp = Kp
+        self.Ti = Ti
+        self.bounds = bounds
+        self.u0 = u0
+
+    def reset(self):
+        super().reset()
+        self._u = None
+        self._e = 0.
+
+    def _law(self, t):
+        u = self._u
+        if u is None:
+            u = getattr(self.target, self.attr) if self.u0 is None else self.u0
+        e = self.setpoint - self._measure()
+        du = self.Kp * (e - self._e)
+        if self.Ti: du += self.Kp * self.sample_time / self.Ti * e
+        self._u = u = min(max(u + du, self.bounds[0]), self.bounds[1])
+        self._e = e
+        return u
+
+
+class EventController(Controller):
+    '''
+    Event-triggered controller that sets the manipulated attribute when the
+    measured value crosses a threshold, the time of the crossing is located
+    on the solver's dense output.
+
+    Parameters
+    ----------
+    ID : str
+        ID of the controller.
+    target : object
+        Object with the manipulated attribute.
+    attr : str
+        Name of the manipulated attribute.
+    measured : tuple(:class:`WasteStream`, str) or callable
+        The measured stream and variable (a component ID or "Q"),
+        or a function without arguments that returns the measured value.
+    threshold : float
+        Threshold of the measured value.
+    value : float or callable
+        New value of the manipulated attribute, or a function of time
+        that returns the new value.
+    direction : int, optional
+        1 for the measured value rising above the threshold, -1 for falling
+        below, 0 for both. The default is 0.
+
+    Examples
+    --------
+    Intermittent aeration between 1 and 2.5 mg O2/L:
+
+    >>> from qsdsan import processes as pc, WasteStream
+    >>> from qsdsan.utils import EventController
+    >>> cmps = pc.create_asm1_cmps()
+    >>> aer = pc.DiffusedAeration('aer', 'S_O', KLa=240, DOsat=8.0, V=1333)
+    >>> eff = WasteStream('eff')
+    >>> off = EventController('off', aer, 'KLa', (eff, 'S_O'), 2.5, 0., direction=1)
+    >>> on = EventController('on', aer, 'KLa', (eff, 'S_O'), 1., 240., direction=-1)
+    '''
+    def __init__(self, ID, target, attr, measured, threshold, value, direction=0):
+        super().__init__(ID, target, attr)
+        self._measure = _get_measure(measured)
+        self.threshold = threshold
+        self.value = value
+        self.direction = direction
+
+    def condition(self):
+        '''Measured value minus the threshold.'''
+        return self._measure() - self.threshold
+
+    def crossed(self, g0, g1):
+        '''Whether the condition crossed zero from `g0` to `g1` in the given direction.'''
+        d = self.direction
+        up = g0 < 0 <= g1
+        down = g0 > 0 >= g1
+        return up if d > 0 else down if d < 0 else (up or down)
+
+    def trigger(self, t):
+        '''Set the manipulated attribute at time `t`.'''
+        value = self.value
+        self.set(t, value(t) if callable(value) else value)
+
+
+def _solver_count(name):
+    def get(self):
+        solver = getattr(self, '_solver', None)
+        return getattr(self, name) + (0 if solver is None else getfield(solver, name[1:]))
+    def set(self, value): setattr(self, name, value)
+    getfield = getattr
+    return property(get, set)
+
+class _SampledDataSolver(OdeSolver):
+    # Integrates with another solver (e.g., BDF) up to the next sampling instant,
+    # at which the discrete controllers are applied and the same solver continues
+    # with its step size, order, and Jacobian (BDF, Radau, and RK solvers with
+    # `warm` and scipy 1.x, others are restarted with the last step size); event-triggered
+    # actions are taken at the located crossing, where the solver is restarted.
+
+    nfev = _solver_count('_nfev')
+    njev = _solver_count('_njev')
+    nlu = _solver_count('_nlu')
+
+    def __init__(self, fun, t0, y0, t_bound, vectorized=False, controllers=(),
+                 solver='BDF', warm=True, **options):
+        super().__init__(fun, t0, y0, t_bound, vectorized)
+        isa = isinstance
+        self._method = method = _methods[solver] if isa(solver, str) else solver
+        self._warm = warm and _warm_scipy and issubclass(method, _warm_methods)
+        self._options = options
+        self._discrete = [c for c in controllers if isa(c, DiscreteController)]
+        self._events = [c for c in controllers if isa(c, EventController)]
+        for c in controllers: c.reset()
+        for c in self._discrete: c._start(t0)
+        self._update(t0, self.y)
+        self._sample(t0)
+        self._g = [c.condition() for c in self._events]
+        self._solver = self._stepped = method(self._fun, t0, self.y, self._next_instant(),
+                                              vectorized=vectorized, **options)
+
+    def _update(self, t, y):
+        # brings the states of units and streams to `y` for measurements
+        self._nfev += 1
+        self._fun(t, y)
+
+    def _next_instant(self):
+        return min([c._t_next for c in self._discrete if c._t_next > self.t] + [self.t_bound])
+
+    def _sample(self, t):
+        for c in self._discrete:
+            if c._t_next <= t: c.sample(t)
+
+    def _restart(self, t, y, first_step):
+        old = self._solver
+        for i in ('nfev', 'njev', 'nlu'):
+            setattr(self, '_'+i, getattr(self, '_'+i) + getattr(old, i))
+        options = {**self._options, 'first_step': first_step}
+        self._solver = self._method(self._fun, t, y, self._next_instant(),
+                                    vectorized=self.vectorized, **options)
+
+    def _locate_event(self, solver):
+        events = self._events
+        t_old, t = solver.t_old, solver.t
+        self._update(t, solver.y)
+        g = [c.condition() for c in events]
+        active = [i for i, c in enumerate(events) if c.crossed(self._g[i], g[i])]
+        if not active:
+            self._g = g
+            return None
+        sol = solver.dense_output()
+        def condition(s, c):
+            self._update(s, sol(s))
+            return c.condition()
+        roots = [(brentq(condition, t_old, t, args=(events[i],), xtol=1e-12), i) for i in active]
+        t_e, i = min(roots)
+        y_e = sol(t_e)
+        self._update(t_e, y_e)
+        events[i].trigger(t_e)
+        self._g = [c.condition() for c in events]
+        self._g[i] = g[i] # on the other side of the crossing
+        return t_e, y_e
+
+    def _step_impl(self):
+        solver = self._stepped = self._solver
+        message = solver.step()
+        if solver.status == 'failed': return False, message
+        event = self._locate_event(solver) if self._events else None
+        if event is None:
+            self.t = t = solver.t
+            self.y = solver.y
+            if t < self.t_bound and solver.status == 'finished': # at a sampling instant
+                self._update(t, self.y)
+                self._sample(t)
+                if self._warm:
+                    solver.t_bound = self._next_instant()
+                    solver.status = 'running'
+                else: self._restart(t, self.y, solver.step_size)
+        else:
+            self.t, self.y = event
+            self._restart(self.t, self.y, max(solver.step_size, 1e-12))
+        return True, None
+
+    def _dense_output_impl(self):
+        return self._stepped.dense_output()
+
+
+def simulate_with_controllers(system, controllers, method='BDF', warm=True, **dynsim_kwargs):
+    '''
+    Dynamically simulate a system with controllers. The integration is only
+    segmented at the sampling instants of the discrete controllers, where
+    the solver continues with its step size and Jacobian, and
+    at the located crossings of the event-triggered controllers.
+
+    Parameters
+    ----------
+    system : :class:`biosteam.System`
+        The dynamic system.
+    controllers : iterable[:class:`Controller`]
+        Discrete-time and/or event-triggered controllers.
+    method : str or :class:`scipy.integrate.OdeSolver`, optional
+        The integration method. The default is "BDF".
+    warm : bool, optional
+        Whether to continue the solver at the sampling instants (by moving its
+        bound), only used for the BDF, Radau, and Runge-Kutta solvers of scipy 1.x.
+        If False, the solver is restarted at each sampling instant
+        with the last step size. The default is True.
+    dynsim_kwargs : optional
+        Other keyword arguments of :func:`biosteam.System.simulate`
+        (e.g., `t_span`, `t_eval`, `state_reset_hook`).
+
+    Examples
+    --------
+    >>> from qsdsan import processes as pc, sanunits as su, WasteStream, System
+    >>> from qsdsan.utils import PIController, simulate_with_controllers
+    >>> cmps = pc.create_asm1_cmps()
+    >>> asm1 = pc.ASM1()
+    >>> inf = WasteStream('inf', H2O=1e5, units='kg/hr')
+    >>> inf.set_flow_by_concentration(18446, {'S_S':69.5, 'X_S':202.32, 'X_BH':28.17,
+    ...                                       'S_NH':31.56, 'S_ALK':84}, units=('m3/d', 'mg/L'))
+    >>> aer = pc.DiffusedAeration('aer', 'S_O', KLa=84, DOsat=8.0, V=1333)
+    >>> R1 = su.CSTR('R1', ins=inf, V_max=1333, aeration=aer, DO_ID='S_O',
+    ...              suspended_growth_model=asm1)
+    >>> R1.set_init_conc(X_BH=2500, X_S=100, S_O=0.5, S_NH=2, S_ALK=84)
+    >>> DO_ctrl = PIController('DO', aer, 'KLa', measured=(R1-0, 'S_O'), setpoint=2,
+    ...                        Kp=500, Ti=0.001, sample_time=1/1440, bounds=(0, 360))
+    >>> sys = System('sys', path=(R1,))
+    >>> simulate_with_controllers(sys, [DO_ctrl], t_span=(0, 0.5))
+    >>> round(float(R1.outs[0].iconc['S_O']), 1)
+    2.0
+    '''
+    dk = system.dynsim_kwargs
+    previous = {k: dk[k] for k in ('method', 'solver', 'warm', 'controllers') if k in dk}
+    try:
+        system.simulate(method=_SampledDataSolver, solver=method, warm=warm,
+                        controllers=tuple(controllers), **dynsim_kwargs)
+    finally:
+        for k in ('method', 'solver', 'warm', 'controllers'): dk.pop(k, None)
+        dk.update(previous)
@@ -11,12 +11,66 @@ for license details.
 '''
 
 from .loading import load_data
-from scipy.interpolate import InterpolatedUnivariateSpline, CubicSpline, interp1d
+from scipy.interpolate import InterpolatedUnivariateSpline, CubicSpline, interp1d, \
+    PPoly, UnivariateSpline
+from weakref import WeakValueDictionary
+from numba import njit
+from biosteam import System as _System
 import matplotlib.pyplot as plt
 import numpy as np
 
 
-__all__ = ('ExogenousDynamicVariable', )
+__all__ = ('ExogenousDynamicVariable', 'get_block_diagonal_jacobian',
+           'get_system_jacobian_sparsity', 'solve_steady_state',
+           'save_checkpoint', 'load_checkpoint')
+
+
+@njit(cache=True)
+def eval_ppoly(x, c, t, i, y, dy):
+    '''
+    Evaluate the values `y` and first derivatives `dy` of a vector-valued
+    piecewise polynomial (breakpoints `x`, coefficients `c` of shape
+    (interval, order+1, variable)) at `t`, searching for the interval from `i`
+    (i.e., the interval of the previous evaluation), returns the new interval.
+    '''
+    n = x.shape[0] - 2
+    if t < x[i] or t >= x[i+1]:
+        if t >= x[i+1] and i < n and t < x[i+2]: i += 1 # the next interval
+        else: i = min(max(np.searchsorted(x, t, 'right') - 1, 0), n)
+    dx = t - x[i]
+    k = c.shape[1]
+    for j in range(c.shape[2]):
+        v = 0.
+        d = 0.
+        for m in range(k):
+            d = d * dx + v
+            v = v * dx + c[i, m, j]
+        y[j] = v
+        dy[j] = d
+    return i
+
+class _PiecewisePolynomial:
+    '''
+    Vector-valued piecewise polynomial with breakpoints `x` and coefficients
+    `c` of shape (order+1, number of intervals, number of variables) as in
+    :class:`scipy.interpolate.PPoly`. Values and first derivatives of all variables
+    are evaluated together, the interval of the last evaluation is cached
+    as the solver mostly moves forward within the same interval.
+    '''
+    def __init__(self, x, c):
+        keep = x[1:] > x[:-1] # drop zero-length intervals (e.g., from B-splines)
+        self.x = np.append(x[:-1][keep], x[-1])
+        self.c = np.ascontiguousarray(np.moveaxis(c[:, keep], 1, 0)) # (interval, order+1, variable)
+        self._i = 0
+
+    def eval_into(self, t, y, dy):
+        '''Write the values and derivatives at `t` into `y` and `dy`.'''
+        self._i = eval_ppoly(self.x, self.c, t, self._i, y, dy)
+
+    def __call__(self, t):
+        y = np.empty((2, self.c.shape[2]))
+        self.eval_into(t, y[0], y[1])
+        return y
 
 class ExogenousDynamicVariable:
     """
@@ -68,7 +122,7 @@ class ExogenousDynamicVariable:
         self._ID = ID
         self.t_data = t
         self.y_data = y
-        self._intpl_kwargs = intpl_kwargs
+        self._intpl_kwargs = intpl_kwargs.copy()
         self.interpolator = interpolator
         self.derivative_approximator = derivative_approximator
         
@@ -190,6 +244,545 @@ class ExogenousDynamicVariable:
                     derivative_approximator=derivative_approximator,
                     intpl_kwargs=intpl_kwargs) \
                 for k, v in dct_y.items()]
+
+    def _get_ppoly(self):
+        # breakpoints and coefficients of the spline interpolant, if any
+        f = getattr(self, '_f', None)
+        if isinstance(f, PPoly): return f.x, f.c
+        if isinstance(f, UnivariateSpline):
+            pp = PPoly.from_spline(f._eval_args)
+            return pp.x, pp.c
         
     def __repr__(self):
-        return f"<{type(self).__name__}: {self._ID}>"
\ No newline at end of file
+        return f"<{type(self).__name__}: {self._ID}>"
+
+
+class _ExogenousDynamicVariableGroup:
+    '''
+    Exogenous dynamic variables evaluated together at a time. Spline variables
+    with the same breakpoints are stacked into one vector-valued piecewise
+    polynomial, values are written into the preallocated `values` array and
+    cached for the last evaluated time.
+    '''
+    def __init__(self, exovars):
+        self.exovars = exovars
+        self.values = np.zeros(len(exovars))
+        self._t = None
+        stacks = {}
+        others = []
+        for i, var in enumerate(exovars):
+            pp = var._get_ppoly()
+            if pp is None or not var._t_end: 
+                others.append((i, var))
+                continue
+            x, c = pp
+            key = (x.tobytes(), c.shape[0], var._t_end)
+            stacks.setdefault(key, []).append((i, x, c))
+        self._stacks = []
+        for (*_, t_end), pps in stacks.items():
+            idx = np.array([i for i, x, c in pps])
+            ppoly = _PiecewisePolynomial(pps[0][1], np.stack([c for i, x, c in pps], axis=-1))
+            self._stacks.append((idx, ppoly.eval_into, t_end, 
+                                 np.empty(len(idx)), np.empty(len(idx))))
+        self._others = tuple(others)
+    
+    def __call__(self, t):
+        '''Returns the values of all variables at time t.'''
+        values = self.values
+        if t != self._t:
+            for idx, eval_into, t_end, y, dy in self._stacks:
+                eval_into(t % t_end, y, dy)
+                values[idx] = y
+            for i, var in self._others: values[i] = var(t)
+            self._t = t
+        return values
+
+_exovar_groups = WeakValueDictionary()
+
+def _get_exovar_group(exovars):
+    '''Returns the group of the variables, shared for the same variables.'''
+    exovars = tuple(exovars)
+    group = _exovar_groups.get(exovars)
+    if group is None: 
+        _exovar_groups[exovars] = group = _ExogenousDynamicVariableGroup(exovars)
+    return group
+
+
+def get_block_diagonal_jacobian(system, sparse=False):
+    '''
+    Return a function of time and the system state that evaluates the
+    block-diagonal approximation of the Jacobian of the system-wide ODEs,
+    which can be passed to the solver as `jac`
+    (e.g., `system.simulate(method='BDF', jac=get_block_diagonal_jacobian(system))`).
+
+    The Jacobian is assembled from the `ODE_jacobian` of the dynamic units as
+    diagonal blocks only. The off-diagonal coupling between units through their
+    inlets is neglected and dynamic parameters (e.g., pH-dependent inhibition)
+    are treated as constants, so the Jacobian is only exact for a single unit
+    without dynamic parameters. For flowsheets, the approximation can slow down
+    the convergence of Newton iterations of implicit solvers or cause rejected
+    steps, passing only the structure (see :func:`get_system_jacobian_sparsity`)
+    as `jac_sparsity` is recommended unless the coupling is known to be weak.
+
+    Parameters
+    ----------
+    system : :class:`biosteam.System`
+        The dynamic system, all units with ODEs must have an analytical Jacobian.
+    sparse : bool, optional
+        Whether to return `scipy.sparse.csr_matrix` rather than dense arrays.
+        The default is False.
+    '''
+    units = [u for u in system.units if u.hasode]
+    missing = [u.ID for u in units if u.ODE_jacobian is None]
+    if missing:
+        raise RuntimeError(f'analytical Jacobian not available for {missing}.')
+    def jac(t, y):
+        idx = system._state_idx
+        J = np.zeros((len(y), len(y)))
+        for u in units:
+            start, stop = idx[u._ID]
+            J[start:stop, start:stop] = u.ODE_jacobian(t, u._ins_QC, y[start:stop])
+        if sparse:
+            from scipy.sparse import csr_matrix
+            return csr_matrix(J)
+        return J
+    return jac
+
+
+def _load_system_state(system):
+    '''Load the state of the system (as in `dynamic_run`) if not yet loaded.'''
+    if system._state_idx is None:
+        for u in system.units:
+            if not hasattr(u, '_state'): u._init_dynamic()
+        system.converge()
+        system._load_state()
+    return system._state
+
+def _load_state(system, _load_state=_System._load_state):
+    # `System.dynamic_run` passes the returned state as `y0` to `solve_ivp`,
+    # whose solvers keep it as their current state, while `System.DAE` writes
+    # the trial states into `system._state`; a copy keeps the two apart so that
+    # restarts (e.g., from a checkpoint) continue the same trajectory
+    y, idx, nr = _load_state(system)
+    return y.copy(), idx, nr
+_System._load_state = _load_state
+
+def _upstream_ode_units(unit, units, visited):
+    '''
+    Return the units with ODEs (among `units`) whose states enter the inlets
+    of `unit`, tracing through units without ODEs (i.e., whose outlets are
+    algebraic functions of their inlets).
+    '''
+    upstream = set()
+    for ws in unit.ins:
+        src = ws._source
+        if src is None or src in visited or src not in units: continue
+        if src.hasode: upstream.add(src)
+        else:
+            visited.add(src)
+            upstream.update(_upstream_ode_units(src, units, visited))
+    return upstream
+
+def get_system_jacobian_sparsity(system):
+    '''
+    Return the structural nonzeros of the Jacobian of the system-wide ODEs
+    derived from the flowsheet topology, which can be passed to the solver
+    as `jac_sparsity` (e.g., `system.simulate(method='BDF', jac_sparsity=get_system_jacobian_sparsity(system))`)
+    so that the finite-difference Jacobian only takes a few grouped
+    evaluations of the system's ODEs rather than one per state variable.
+
+    The diagonal blocks are given by the `jacobian_sparsity` of the
+    dynamic units (dense if not available), and the states of a unit
+    are assumed to depend on all states of the units with ODEs upstream of its
+    inlets, including those reached through units with only algebraic equations
+    (e.g., splitters and mixers). Inlets from units outside the system are
+    treated as feeds.
+
+    Parameters
+    ----------
+    system : :class:`biosteam.System`
+        The dynamic system, its state will be loaded (as in `dynamic_run`)
+        if not yet loaded.
+
+    Returns
+    -------
+    :class:`scipy.sparse.csr_matrix`
+        Boolean matrix with the same ordering as the system state.
+    '''
+    from scipy.sparse import lil_matrix
+    _load_system_state(system)
+    idx = system._state_idx
+    n = len(system._state)
+    S = lil_matrix((n, n), dtype=bool)
+    units = set(system.units)
+    for u in units:
+        if not u.hasode: continue
+        start, stop = idx[u._ID]
+        blk = getattr(u, 'jacobian_sparsity', None)
+        if blk is None: blk = np.ones((stop-start, stop-start), dtype=bool)
+        S[start:stop, start:stop] = blk
+        for v in _upstream_ode_units(u, units, {u}):
+            v_start, v_stop = idx[v._ID]
+            S[start:stop, v_start:v_stop] = True
+    return S.tocsr()
+
+
+def _group_columns(S):
+    '''
+    Greedily group the columns of the sparsity `S` (:class:`scipy.sparse.csc_matrix`)
+    so that columns in the same group do not share any rows.
+    '''
+    n_rows, n_cols = S.shape
+    groups = np.empty(n_cols, dtype=int)
+    covered = [] # rows covered by each group
+    for j in range(n_cols):
+        rows = S.indices[S.indptr[j]:S.indptr[j+1]]
+        for g, cov in enumerate(covered):
+            if not cov[rows].any(): break
+        else:
+            g = len(covered)
+            covered.append(np.zeros(n_rows, dtype=bool))
+        groups[j] = g
+        covered[g][rows] = True
+    return groups
+
+def _grouped_jacobian(f, sparsity):
+    '''
+    Return a function that evaluates the finite-difference Jacobian of `f`
+    with the given structural nonzeros (:class:`scipy.sparse.csc_matrix`),
+    perturbing the columns in groups (see :func:`_group_columns`).
+    '''
+    from scipy.sparse import csc_matrix
+    groups = _group_columns(sparsity)
+    n_groups = groups.max()+1 if len(groups) else 0
+    rows, cols = sparsity.nonzero()
+    eps = np.sqrt(np.finfo(float).eps)
+    def jac(z, fz):
+        vals = np.zeros(len(rows))
+        for g in range(n_groups):
+            in_g = groups == g
+            h = np.zeros_like(z)
+            h[in_g] = eps * np.maximum(1, np.abs(z[in_g]))
+            df = f(z + h) - fz
+            sel = in_g[cols]
+            vals[sel] = df[rows[sel]] / h[cols[sel]]
+        return csc_matrix((vals, (rows, cols)), shape=sparsity.shape)
+    return jac
+
+def solve_steady_state(system, t=0, f_tol=1e-6, maxiter=20, method='lgmres',
+                       dt0=1e-3, dt_max=1e8, ptc_maxiter=1000,
+                       nonnegative=True, print_msg=False):
+    '''
+    Solve for the steady state of a dynamic system (i.e., dy/dt = 0 of the
+    system-wide ODEs evaluated at time `t`) directly rather than integrating
+    the system for a long period of time.
+
+    A Jacobian-free Newton-Krylov method (preconditioned with a finite-difference
+    Jacobian grouped by :func:`get_system_jacobian_sparsity`) is tried first
+    from the current state of the system. If it fails (or reaches negative
+    states when `nonnegative` is True), pseudo-transient continuation
+    (i.e., implicit Euler steps with adaptively increasing step sizes)
+    will be used instead. The solution (or the state closest to steady state
+    if not converged) is written back to the states of the units and streams.
+
+    States with rates of change that are always zero (e.g., flow rates with
+    time-invariant inputs, fixed dissolved oxygen), i.e., zero at the initial
+    state and with no nonzero derivatives in the finite-difference Jacobian
+    (structured by :func:`get_system_jacobian_sparsity`) of the initial state,
+    are held constant.
+
+    .. note::
+
+        Inputs of the system (e.g., influents and exogenous dynamic variables)
+        are evaluated at `t` and should be time-invariant
+        for the steady state to exist. Dynamic trackers will only record
+        the steady state at `t`.
+
+    Parameters
+    ----------
+    system : :class:`biosteam.System`
+        The dynamic system, its state will be loaded (as in `dynamic_run`)
+        if not yet loaded, and used as the initial guess.
+    t : float, optional
+        Time at which the system's ODEs are evaluated. The default is 0.
+    f_tol : float, optional
+        Tolerance of the residuals, which are the rates of change scaled by
+        (1 + absolute values of the initial states), i.e., roughly the
+        relative rates of change [per day]. The default is 1e-6.
+    maxiter : int, optional
+        Maximum number of Newton iterations. The default is 20.
+    method : str, optional
+        Krylov method used in `scipy.optimize.newton_krylov`. The default is "lgmres".
+    dt0 : float, optional
+        Initial pseudo-time step [d] of the pseudo-transient continuation.
+        The default is 1e-3.
+    dt_max : float, optional
+        Maximum pseudo-time step [d]. The default is 1e8.
+    ptc_maxiter : int, optional
+        Maximum number of pseudo-time steps, will stop early if the residuals
+        have not been reduced in the last 200 steps. The default is 1000.
+    nonnegative : bool, optional
+        Whether the states should be nonnegative. The default is True.
+    print_msg : bool, optional
+        Whether to print the convergence message. The default is False.
+
+    Returns
+    -------
+    :class:`scipy.optimize.OptimizeResult`
+        With the solution `x`, the rates of change `fun`,
+        whether the solution converged `success`, the `method` ("newton-krylov"
+        or "pseudo-transient"), number of iterations `nit`, and `message`.
+
+    See Also
+    --------
+    `scipy.optimize.newton_krylov <https://docs.scipy.org/doc/scipy/reference/generated/scipy.optimize.newton_krylov.html>`_
+    '''
+    from scipy.optimize import newton_krylov, OptimizeResult
+    try: from scipy.optimize import NoConvergence
+    except ImportError: # only in the deprecated `nonlin` namespace for older scipy
+        from warnings import catch_warnings, simplefilter
+        with catch_warnings():
+            simplefilter('ignore', DeprecationWarning)
+            from scipy.optimize.nonlin import NoConvergence
+    from scipy.sparse import diags, identity
+    from scipy.sparse.linalg import LinearOperator, splu
+    y0 = _load_system_state(system).copy()
+    dydt = system.DAE
+    dydt(t, y0.copy()) # update the rates of change of the recycles
+    f0 = dydt(t, y0.copy()).copy()
+    sparsity = get_system_jacobian_sparsity(system).tocsc()
+    J0 = _grouped_jacobian(lambda y: dydt(t, y.copy()).copy(), sparsity)(y0, f0)
+    free = (f0 != 0) | (np.abs(J0).sum(axis=1).A1 != 0)
+    y = y0.copy()
+    def f(z):
+        y[free] = z
+        return dydt(t, y)[free]
+    z0 = y0[free]
+    s = 1 + np.abs(z0) # scales of the states and rates of change
+    norm = lambda r: np.abs(r).max() if len(r) else 0.
+    errors = (FloatingPointError, ZeroDivisionError, ValueError, RuntimeError)
+
+    # Finite-difference Jacobian with columns grouped by the flowsheet sparsity
+    jac = _grouped_jacobian(f, sparsity[free][:, free].tocsc())
+
+    nit = [0]
+    def count(u, r): nit[0] += 1
+    try:
+        J = diags(1/s) @ jac(z0, f(z0)) @ diags(s)
+        try: M = LinearOperator(J.shape, matvec=splu(J.tocsc()).solve)
+        except RuntimeError: M = None # singular
+        u = newton_krylov(lambda u: f(s*u)/s, z0/s, f_tol=f_tol, maxiter=maxiter,
+                          method=method, inner_M=M, callback=count)
+        z = s * u
+        success = bool(np.isfinite(z).all()) \
+            and (not nonnegative or (z >= -f_tol*s).all())
+    except (NoConvergence, np.linalg.LinAlgError): # not converged or singular
+        success = False
+    solver = 'newton-krylov'
+    nit = nit[0]
+
+    if not success:
+        solver = 'pseudo-transient'
+        z = z0.copy()
+        fz = f(z)
+        r = norm(fz/s)
+        z_best, r_best, nit_best = z, r, 0
+        dt = dt0
+        I = identity(len(z), format='csc')
+        for nit in range(1, ptc_maxiter+1):
+            if r <= f_tol:
+                success = True
+                break
+            try:
+                dz = splu((I/dt - jac(z, fz)).tocsc()).solve(fz)
+                z_new = z + dz
+                if nonnegative: z_new = np.maximum(z_new, 0.)
+                f_new = f(z_new)
+                r_new = norm(f_new/s)
+            except errors: r_new = np.inf
+            if not np.isfinite(r_new) or r_new > 10*r:
+                dt /= 10 # reject the step
+                continue
+            # switched evolution relaxation
+            dt = min(max(dt * r / max(r_new, 1e-300), dt0), dt_max)
+            z, fz, r = z_new, f_new, r_new
+            if r < r_best: z_best, r_best, nit_best = z, r, nit
+            elif nit - nit_best > 200: break # stalled
+        if not success: z = z_best # the closest to steady state
+
+    y[free] = z
+    fun = dydt(t, y) # also updates the states of the units
+    system._write_state()
+    if success: message = 'Steady state reached.'
+    else: message = f'Steady state not reached, maximum scaled residual is {norm(fun[free]/s):.3g}.'
+    if print_msg: print(message)
+    return OptimizeResult(x=y, fun=fun, success=success, method=solver,
+                          nit=nit, message=message)
+
+
+def _get_exovars(system):
+    exovars = {}
+    for u in system.units:
+        for var in getattr(u, '_exovars', ()): exovars[var.ID] = var
+    return exovars
+
+def _get_scopes(system):
+    scopes = {}
+    for subject in system.scope.subjects:
+        scope = subject.scope
+        scopes[f'{type(subject).__name__}_{subject.ID}'] = scope
+    return scopes
+
+def save_checkpoint(system, path, t=None):
+    '''
+    Save a snapshot of a dynamic system to a compressed binary (.npz) file,
+    including the states and rates of change of the system, units, and streams,
+    and the records of the dynamic trackers (including the records flushed
+    to file by buffered scopes), so that the simulation can be resumed
+    with :func:`load_checkpoint`.
+    Values of the exogenous dynamic variables at the snapshot time are saved
+    to check the recreated variables when loading, the variables themselves
+    (i.e., their data or functions of time) are not saved.
+
+    Parameters
+    ----------
+    system : :class:`biosteam.System`
+        The dynamic system, its state must have been loaded (e.g., after simulation).
+    path : str
+        Path of the file, ".npz" will be appended if not included.
+    t : float, optional
+        Time of the snapshot [d], will be the end time of the last simulation if not given.
+
+    Examples
+    --------
+    >>> sys.simulate(t_span=(0, 50), method='BDF') # doctest: +SKIP
+    >>> save_checkpoint(sys, 'spin_up.npz') # doctest: +SKIP
+    >>> # later (e.g., in a new session with the system recreated)
+    >>> t0 = load_checkpoint(sys, 'spin_up.npz') # doctest: +SKIP
+    >>> sys.simulate(t_span=(t0, 100), method='BDF', state_reset_hook=None) # doctest: +SKIP
+
+    See Also
+    --------
+    :func:`load_checkpoint`
+    '''
+    import os
+    if system._state is None:
+        raise RuntimeError(f'the state of {system} has not been loaded.')
+    scope = system.scope
+    if t is None:
+        if scope.sol is not None: t = scope.sol.t[-1]
+        elif scope._ts: t = scope._ts[-1]
+        else: t = 0.
+    data = {'t': np.array(t, dtype=float),
+            'system/state': system._state,
+            'system/IDs': np.array(list(system._state_idx.keys()), dtype=str),
+            'system/state_idx': np.array(list(system._state_idx.values()), dtype=int).reshape(-1, 2),
+            'system/scope/ts': np.asarray(scope._ts, dtype=float)}
+    for u in system.units:
+        for attr in ('_state', '_dstate'):
+            arr = getattr(u, attr, None)
+            if arr is not None: data[f'unit/{u.ID}/{attr[1:]}'] = arr
+    for ws in system.streams:
+        for attr in ('_state', '_dstate'):
+            arr = getattr(ws, attr, None)
+            if arr is not None: data[f'stream/{ws.ID}/{attr[1:]}'] = arr
+    for ID, var in _get_exovars(system).items():
+        data[f'exovar/{ID}'] = np.array(var(t), dtype=float)
+    for key, sp in _get_scopes(system).items():
+        buffer = getattr(sp, '_buffer', None)
+        if buffer is not None: # including the rows flushed to file
+            if buffer.path and not os.path.isfile(buffer.path):
+                raise FileNotFoundError(f'file {buffer.path!r} with the flushed records '
+                                        f'of {sp} is missing, cannot save a complete checkpoint.')
+            data[f'scope/{key}/buffer'] = buffer.data
+            continue
+        data[f'scope/{key}/ts'] = np.asarray(sp._ts, dtype=float)
+        for var, rcd in sp._record.items():
+            data[f'scope/{key}/{var}'] = np.asarray(rcd, dtype=float)
+    np.savez_compressed(path, **data)
+
+def load_checkpoint(system, path):
+    '''
+    Restore a dynamic system from a snapshot saved by :func:`save_checkpoint`,
+    the simulation can be resumed by simulating the system from the returned time.
+
+    The system must have the same units with dynamic states (in the same order
+    and sizes) as the one saved. Exogenous dynamic variables are not restored,
+    the caller must recreate them (e.g., from the same data or functions of time)
+    before loading, a warning is issued if their values at the snapshot time
+    do not match the saved ones.
+    Records of buffered scopes are restored in memory and in their files
+    (rows that do not fit in memory).
+
+    .. note::
+
+        The resumed simulation should be run with `state_reset_hook=None`,
+        otherwise the restored states will be reset (e.g., by "reset_cache").
+        A warning is issued if a `state_reset_hook` has been set
+        in the dynamic simulation keyword arguments of the system.
+
+    Parameters
+    ----------
+    system : :class:`biosteam.System`
+        The dynamic system.
+    path : str
+        Path of the file.
+
+    Returns
+    -------
+    float
+        Time of the snapshot [d].
+
+    See Also
+    --------
+    :func:`save_checkpoint`
+    '''
+    from warnings import warn
+    with np.load(path) as file:
+        data = {k: file[k] for k in file.files}
+    t = float(data['t'])
+    idx = {str(ID): (int(start), int(stop)) for ID, (start, stop) \
+           in zip(data['system/IDs'], data['system/state_idx'])}
+    if system.dynsim_kwargs.get('state_reset_hook'):
+        warn(f'`state_reset_hook` of {system} is set, pass `state_reset_hook=None` '
+             'when resuming the simulation so that the restored states are not reset.')
+    _load_system_state(system)
+    if idx != system._state_idx:
+        raise ValueError(f'dynamic states of {system} do not match those in the checkpoint, '
+                         f'expected {idx}, not {system._state_idx}.')
+    for ID, var in _get_exovars(system).items():
+        key = f'exovar/{ID}'
+        if key in data and not np.allclose(var(t), data[key]):
+            warn(f'value of {var} at t={t} does not match that in the checkpoint.')
+
+    system._state[:] = data['system/state']
+    for u in system.units:
+        for attr in ('state', 'dstate'):
+            key = f'unit/{u.ID}/{attr}'
+            if key not in data: continue
+            arr = getattr(u, f'_{attr}', None)
+            # keep the unit states as views of the system state
+            if arr is not None and arr.shape == data[key].shape: arr[:] = data[key]
+            else: setattr(u, f'_{attr}', data[key].copy())
+    for ws in system.streams:
+        for attr in ('state', 'dstate'):
+            key = f'stream/{ws.ID}/{attr}'
+            if key not in data: continue
+            arr = getattr(ws, f'_{attr}', None)
+            if arr is not None and arr.shape == data[key].shape: arr[:] = data[key]
+            else: setattr(ws, f'_{attr}', data[key].copy())
+    feeds = system.feeds
+    for ws in system.streams:
+        if ws not in feeds and getattr(ws, '_state', None) is not None: ws._state2flows()
+
+    scope = system.scope
+    scope._ts = list(data['system/scope/ts'])
+    scope.sol = None
+    for key, sp in _get_scopes(system).items():
+        buffer = getattr(sp, '_buffer', None)
+        if buffer is not None:
+            buffer.load(data.get(f'scope/{key}/buffer', ()))
+            continue
+        sp._ts = list(data.get(f'scope/{key}/ts', ()))
+        sp._record = {var: list(data.get(f'scope/{key}/{var}', ())) for var in sp._record}
+    return t
@@ -12,14 +12,17 @@ Please refer to https://github.com/QSD-Group/QSDsan/blob/main/LICENSE.txt
 for license details.
 '''
 
-import numpy as np, pandas as pd, pickle as pk
+import os, numpy as np, pandas as pd, pickle as pk
 from os import path as ospath
 path = ospath.dirname(ospath.realpath(__file__))
 qs_path = ospath.realpath(ospath.join(ospath.dirname(__file__), '../'))
 data_path = ospath.join(qs_path, 'data')
+# Writable directory for files generated and cached by qsdsan (e.g., compiled functions)
+cache_path = os.environ.get('QSDSAN_CACHE_PATH',
+                            ospath.join(ospath.expanduser('~'), '.qsdsan', 'cache'))
 
 __all__ = (
-    'ospath', 'load_data', 'data_path',
+    'ospath', 'load_data', 'data_path', 'cache_path',
     'save_pickle', 'load_pickle', 'load_pickled_cmps',
     )
 
@@ -13,13 +13,188 @@ Please refer to https://github.com/QSD-Group/QSDsan/blob/main/LICENSE.txt
 for license details.
 '''
 
+import os, json, numpy as np, pandas as pd
 from biosteam.utils import Scope
 import matplotlib.pyplot as plt
 
 
-__all__ = ('WasteStreamScope', 'SanUnitScope')
+__all__ = ('WasteStreamScope', 'SanUnitScope', 'export_scopes', 'ScopeResults')
 
-class WasteStreamScope(Scope):    
+class _RingBuffer:
+    '''
+    Preallocated buffer of tracked time points, each row holds the time
+    followed by the values of all tracked variables. Rows at or after the time
+    of a new time point are discarded when the solver steps back in time.
+    When full, the older half of the rows are appended to the binary file at
+    `path` (as float64, row by row) if given, otherwise the oldest row is overwritten.
+    Only one of every `every_n_evals` calls (i.e., evaluations of the rates of
+    change of the system, including the trial ones of the solver) is recorded.
+    '''
+    def __init__(self, size, ncol, dt=None, every_n_evals=1, path=''):
+        size = int(size)
+        if size < 2: raise ValueError(f'`size` must be at least 2, not {size}.')
+        every_n_evals = int(every_n_evals)
+        if every_n_evals < 1:
+            raise ValueError(f'`every_n_evals` must be a positive integer, not {every_n_evals}.')
+        self.rows = np.empty((size, ncol+1))
+        self.dt = dt
+        self.every_n_evals = every_n_evals
+        self.path = path
+        self.reset()
+
+    def reset(self):
+        self._head = self._n = self._count = 0
+        self._t_last = -np.inf
+        if self.path: open(self.path, 'wb').close()
+
+    def __call__(self, t, values):
+        rows = self.rows
+        size = rows.shape[0]
+        head, n = self._head, self._n
+        if t <= self._t_last: # solver stepped back
+            while n and rows[head-1, 0] >= t:
+                head = (head - 1) % size
+                n -= 1
+            self._head, self._n = head, n
+            self._t_last = rows[head-1, 0] if n else -np.inf
+        if n:
+            if self.dt and t - self._t_last < self.dt: return
+            self._count += 1
+            if self._count < self.every_n_evals: return
+        self._count = 0
+        if n == size:
+            if self.path: n -= self._flush(size//2)
+            else: n -= 1 # overwrite the oldest
+        row = rows[head]
+        row[0] = self._t_last = t
+        if len(values) == 1: row[1:] = values[0]
+        else:
+            i = 1
+            for v in values:
+                j = i + np.size(v)
+                row[i:j] = v
+                i = j
+        self._head = (head + 1) % size
+        self._n = n + 1
+
+    def _flush(self, k):
+        rows = self.rows
+        size = rows.shape[0]
+        start = (self._head - self._n) % size
+        stop = start + k
+        with open(self.path, 'ab') as file:
+            if stop <= size: rows[start:stop].tofile(file)
+            else:
+                rows[start:].tofile(file)
+                rows[:stop-size].tofile(file)
+        return k
+
+    @property
+    def flushed(self):
+        '''[numpy.memmap or NoneType] Rows flushed to the file.'''
+        path = self.path
+        if not path or not os.path.getsize(path): return None
+        return np.memmap(path, dtype=float, mode='r').reshape(-1, self.rows.shape[1])
+
+    @property
+    def in_memory(self):
+        '''[numpy.ndarray] Rows kept in memory in chronological order.'''
+        rows, n = self.rows, self._n
+        return rows[(self._head - n + np.arange(n)) % rows.shape[0]]
+
+    @property
+    def data(self):
+        '''[numpy.ndarray] All rows in chronological order, including the flushed ones.'''
+        data = self.in_memory
+        flushed = self.flushed
+        if flushed is not None: data = np.vstack([flushed, data])
+        return data
+
+    def load(self, data):
+        '''
+        Replace all rows with `data`, the older rows that do not fit in memory
+        are written to the file at `path` (if given, otherwise discarded).
+        '''
+        data = np.asarray(data, dtype=float).reshape(-1, self.rows.shape[1])
+        size = self.rows.shape[0]
+        n = min(len(data), size)
+        if self.path:
+            with open(self.path, 'wb') as file: data[:len(data)-n].tofile(file)
+        self.rows[:n] = data[len(data)-n:]
+        self._head, self._n, self._count = n % size, n, 0
+        self._t_last = self.rows[n-1, 0] if n else -np.inf
+
+
+class _BufferedScope(Scope):
+    '''
+    Records in Python lists by default as :class:`biosteam.utils.Scope`,
+    or in a preallocated ring buffer after :meth:`set_buffer` is called.
+    '''
+    _buffer = None
+
+    def set_buffer(self, size=10000, dt=None, every_n_evals=1, path=''):
+        '''
+        Record into a preallocated ring buffer instead of growing lists,
+        so that the memory use stays constant in long simulations.
+
+        Parameters
+        ----------
+        size : int or None
+            Number of time points to keep in memory,
+            None to go back to recording in lists.
+        dt : float, optional
+            Minimum interval [d] between the recorded time points.
+        every_n_evals : int
+            Record once every `every_n_evals` evaluations of the rates of change
+            of the system (that are not closer than `dt`). Note that the solver
+            evaluates the rates several times per step (including at trial states),
+            use `dt` to set the spacing of the recorded time points instead.
+        path : str, optional
+            Binary file to flush the older half of the time points to when
+            the buffer is full, with each time point saved as the time followed
+            by the values of the tracked variables (in float64).
+            If not given, only the latest `size` time points are kept.
+
+        Notes
+        -----
+        Records already made are discarded. As the scope handles the solver
+        stepping back in time on its own, :meth:`pop` does nothing with a buffer,
+        and the recorded time points can be fewer than those of the system's
+        :class:`biosteam.utils.SystemScope` when `dt` or `every_n_evals` is used.
+        '''
+        super().reset_cache()
+        if size is None: self._buffer = None
+        else:
+            ncol = len(self.header)
+            self._buffer = _RingBuffer(size, ncol, dt, every_n_evals, path)
+
+    def __call__(self, t):
+        buffer = self._buffer
+        if buffer is None: return super().__call__(t)
+        subject = self.subject
+        buffer(t, [getattr(subject, var) for var in self._record])
+
+    def pop(self):
+        if self._buffer is None: super().pop()
+
+    def reset_cache(self):
+        super().reset_cache()
+        if self._buffer is not None: self._buffer.reset()
+
+    @property
+    def record(self):
+        """[numpy.ndarray] The tracked time-series data of the variables of interest."""
+        if self._buffer is None: return super().record
+        return self._buffer.data[:, 1:]
+
+    @property
+    def time_series(self):
+        """[numpy.1darray] The tracked time points."""
+        if self._buffer is None: return super().time_series
+        return self._buffer.data[:, 0]
+
+
+class WasteStreamScope(_BufferedScope):
     """
     A tracker of the dynamic component concentrations and volumetric flowrates
     of a :class:`WasteStream`.
@@ -33,6 +208,8 @@ class WasteStreamScope(Scope):
     See Also
     --------
     :class:`biosteam.utils.Scope`
+
+    :meth:`set_buffer`
     
     `WasteStream <https://qsdsan.readthedocs.io/en/latest/streams.html>`_
     """
@@ -67,7 +244,7 @@ class WasteStreamScope(Scope):
         ax.set(xlabel='Time [d]', ylabel=ylabel)
         return fig, ax
         
-class SanUnitScope(Scope):
+class SanUnitScope(_BufferedScope):
     """
     A tracker of the dynamic state variables of a :class:`SanUnit`.
 
@@ -80,6 +257,8 @@ class SanUnitScope(Scope):
     See Also
     --------
     :class:`biosteam.utils.Scope`
+
+    :meth:`set_buffer`
     
     `SanUnit <https://qsdsan.readthedocs.io/en/latest/api/SanUnit.html>`_
     """    
@@ -111,4 +290,296 @@ class SanUnitScope(Scope):
             ax.plot(t, ys[i], '-o', label=label)
         ax.legend(loc='best')
         ax.set(xlabel='Time [d]', ylabel='State Variable')
-        return fig, ax
\ No newline at end of file
+        return fig, ax
+
+
+# %%
+
+# =============================================================================
+# Chunked export of the tracked time-series data
+# =============================================================================
+
+_formats = ('npy', 'parquet', 'feather', 'hdf5')
+
+def _import_optional(name, format):
+    try: return __import__(name, fromlist=['_'])
+    except ImportError:
+        pkg = name.split('.')[0]
+        raise ImportError(f'`{pkg}` is needed for the "{format}" format, '
+                          f'it can be installed by `pip install {pkg}`.')
+
+def _n_rows(scope):
+    buffer = getattr(scope, '_buffer', None)
+    if buffer is None: return len(scope._ts)
+    flushed = buffer.flushed
+    return buffer._n + (0 if flushed is None else flushed.shape[0])
+
+def _iter_chunks(scope, chunk_size):
+    # rows of time followed by the values of the tracked variables,
+    # converted from the lists (or copied from the buffer) a chunk at a time
+    buffer = getattr(scope, '_buffer', None)
+    if buffer is not None:
+        for rows in (buffer.flushed, buffer.in_memory):
+            if rows is None: continue
+            for i in range(0, rows.shape[0], chunk_size):
+                yield np.asarray(rows[i:i+chunk_size])
+        return
+    ts, rcds = scope._ts, list(scope._record.values())
+    for i in range(0, len(ts), chunk_size):
+        t = np.asarray(ts[i:i+chunk_size], dtype=float)
+        yield np.column_stack([t, *(np.asarray(r[i:i+chunk_size], dtype=float).reshape(len(t), -1)
+                                    for r in rcds)])
+
+def _get_meta(subject):
+    scope = subject.scope
+    header = scope.header
+    if header is None: columns = [f'{var}_{i}' for var, n in zip(scope._record, scope._n_cols())
+                                  for i in range(n)]
+    else: columns = [str(h[1]) for h in header]
+    meta = {'type': type(subject).__name__, 'columns': ['t [d]', *columns]}
+    cmps = getattr(subject, 'components', None)
+    if cmps is not None:
+        meta['components'] = list(cmps.IDs)
+        meta['i_COD'] = [float(i) for i in cmps.i_COD]
+        meta['i_N'] = [float(i) for i in cmps.i_N]
+        meta['i_P'] = [float(i) for i in cmps.i_P]
+    return meta
+
+
+def export_scopes(system, path, subjects=None, format=None, chunk_size=50000):
+    """
+    Export the tracked time-series data of the units and streams to columnar
+    files, streaming the data in chunks of time points without putting
+    together the whole dataset in memory, the exported data can be read lazily
+    with :class:`ScopeResults`.
+
+    Parameters
+    ----------
+    system : :class:`biosteam.System`
+        The system with the dynamic tracker.
+    path : str
+        Path of the directory for the "npy", "parquet", and "feather" formats
+        (one file per subject), or of the file for the "hdf5" format (one dataset per subject).
+    subjects : Iterable, optional
+        Units and streams to export, defaults to the subjects of the system's scope.
+    format : str, optional
+        Can be "npy" (NumPy binary files, no additional dependency is needed),
+        "parquet" or "feather" (need `pyarrow`), or "hdf5" (needs `h5py`).
+        Defaults to "hdf5" if `path` ends with ".h5" or ".hdf5", otherwise "npy".
+    chunk_size : int
+        Number of time points converted and written at a time.
+
+    Notes
+    -----
+    For each subject, the time [d] is saved as the first column, followed by
+    the tracked variables (names given by the scope's header), component
+    IDs and their COD, N, and P contents are saved as metadata for streams.
+    Unlike :meth:`biosteam.utils.SystemScope.export`, records are exported at
+    the time points tracked by each subject's scope without interpolation.
+
+    Examples
+    --------
+    >>> sys.simulate(t_span=(0, 365), method='BDF') # doctest: +SKIP
+    >>> export_scopes(sys, 'bsm2.h5') # doctest: +SKIP
+    >>> results = ScopeResults('bsm2.h5') # doctest: +SKIP
+    >>> results.load('Effluent', t_span=(300, 365), variables=('S_NH', 'Q')) # doctest: +SKIP
+
+    See Also
+    --------
+    :class:`ScopeResults`
+
+    :meth:`WasteStreamScope.set_buffer`
+    """
+    subjects = system.scope.subjects if subjects is None else subjects
+    if format is None:
+        format = 'hdf5' if path.lower().endswith(('.h5', '.hdf5')) else 'npy'
+    if format not in _formats:
+        raise ValueError(f'`format` can only be in {_formats}, not {format}.')
+    chunk_size = int(chunk_size)
+    metas = {}
+    for s in subjects:
+        if s.ID in metas: raise ValueError(f'more than one subject has the ID "{s.ID}".')
+        metas[s.ID] = _get_meta(s)
+
+    if format == 'hdf5':
+        h5py = _import_optional('h5py', format)
+        with h5py.File(path, 'w') as file:
+            file.attrs['qsdsan'] = json.dumps({'format': format, 'subjects': metas})
+            for s in subjects:
+                n, ncol = _n_rows(s.scope), len(metas[s.ID]['columns'])
+                group = file.create_group(s.ID)
+                # time is saved separately so that time windows can be located
+                # without reading the values
+                t = group.create_dataset('t', shape=(n,), dtype=float)
+                values = group.create_dataset('values', shape=(n, ncol-1), dtype=float,
+                                              chunks=(max(1, min(n, chunk_size)), ncol-1))
+                i = 0
+                for rows in _iter_chunks(s.scope, chunk_size):
+                    j = i + rows.shape[0]
+                    t[i:j] = rows[:, 0]
+                    values[i:j] = rows[:, 1:]
+                    i = j
+        return
+
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'qsdsan.json'), 'w') as file:
+        json.dump({'format': format, 'subjects': metas}, file)
+    if format == 'npy':
+        from numpy.lib.format import open_memmap
+        for s in subjects:
+            n, ncol = _n_rows(s.scope), len(metas[s.ID]['columns'])
+            # column-major so that each variable is contiguous on disk
+            arr = open_memmap(os.path.join(path, f'{s.ID}.npy'), mode='w+', dtype=float,
+                              shape=(n, ncol), fortran_order=True)
+            i = 0
+            for rows in _iter_chunks(s.scope, chunk_size):
+                arr[i:i+rows.shape[0]] = rows
+                i += rows.shape[0]
+            arr.flush()
+            del arr
+        return
+
+    pa = _import_optional('pyarrow', format)
+    for s in subjects:
+        meta = metas[s.ID]
+        schema = pa.schema([(c, pa.float64()) for c in meta['columns']],
+                           metadata={'qsdsan': json.dumps(meta)})
+        file = os.path.join(path, f'{s.ID}.{format}')
+        if format == 'parquet':
+            pq = _import_optional('pyarrow.parquet', format)
+            writer = pq.ParquetWriter(file, schema)
+            write = lambda batch: writer.write_batch(batch, row_group_size=chunk_size)
+        else:
+            writer = pa.ipc.new_file(file, schema)
+            write = writer.write_batch
+        with writer:
+            for rows in _iter_chunks(s.scope, chunk_size):
+                write(pa.RecordBatch.from_arrays(list(rows.T), schema=schema))
+
+
+class ScopeResults:
+    """
+    Lazy reader of the time-series data exported by :func:`export_scopes`,
+    data are only read from the files upon request, for a time window and/or
+    a subset of the variables.
+
+    Parameters
+    ----------
+    path : str
+        Path of the exported directory or HDF5 file.
+
+    Examples
+    --------
+    >>> results = ScopeResults('bsm2.h5') # doctest: +SKIP
+    >>> results.IDs # doctest: +SKIP
+    ('A1', 'C1', 'Effluent')
+    >>> results.load('Effluent', t_span=(300, 365), variables=('S_NH', 'Q')) # doctest: +SKIP
+
+    See Also
+    --------
+    :func:`export_scopes`
+    """
+    def __init__(self, path):
+        self.path = path
+        if os.path.isdir(path):
+            with open(os.path.join(path, 'qsdsan.json')) as file:
+                info = json.load(file)
+        else:
+            h5py = _import_optional('h5py', 'hdf5')
+            with h5py.File(path, 'r') as file:
+                info = json.loads(file.attrs['qsdsan'])
+        self._format = info['format']
+        self._meta = info['subjects']
+
+    def __repr__(self):
+        return f'<ScopeResults: {self.path}>'
+
+    @property
+    def format(self):
+        """[str] Format of the exported data."""
+        return self._format
+
+    @property
+    def IDs(self):
+        """[tuple] IDs of the exported units and streams."""
+        return tuple(self._meta)
+
+    def metadata(self, ID):
+        """
+        Return the metadata of the subject with the given ID, including its type,
+        names of the columns, and for streams, IDs of the components and their
+        COD, N, and P contents.
+        """
+        return self._meta[ID]
+
+    def _column_indices(self, ID, variables):
+        columns = self._meta[ID]['columns']
+        if variables is None: return list(range(1, len(columns)))
+        variables = [variables] if isinstance(variables, str) else variables
+        names = [c.split(' ')[0] for c in columns]
+        idx = []
+        for var in variables:
+            if var in columns: idx.append(columns.index(var))
+            elif var in names[1:]: idx.append(names.index(var, 1))
+            else: raise ValueError(f'"{var}" is not a variable of {ID}, '
+                                   f'should be one of {columns[1:]}.')
+        return idx
+
+    def load(self, ID, t_span=None, variables=None):
+        """
+        Load the time-series data of a subject.
+
+        Parameters
+        ----------
+        ID : str
+            ID of the unit or stream.
+        t_span : 2-tuple(float), optional
+            Start and end time [d] of the data to load (both inclusive),
+            all time points will be loaded if not given.
+        variables : str or Iterable[str], optional
+            Variables to load, given as the names of the columns (e.g., "S_NH [mg/L]")
+            or only their first parts (e.g., "S_NH" or "Q"),
+            all variables will be loaded if not given.
+
+        Returns
+        -------
+        :class:`pandas.DataFrame`
+            Loaded data, indexed by time.
+        """
+        if ID not in self._meta:
+            raise ValueError(f'no data of "{ID}" in {self.path}.')
+        idx = self._column_indices(ID, variables)
+        columns = self._meta[ID]['columns']
+        t0, t1 = (-np.inf, np.inf) if t_span is None else t_span
+        format = self._format
+        if format == 'hdf5':
+            h5py = _import_optional('h5py', format)
+            with h5py.File(self.path, 'r') as file:
+                t = file[ID]['t'][:]
+                start, stop = np.searchsorted(t, t0, 'left'), np.searchsorted(t, t1, 'right')
+                t = t[start:stop]
+                data = file[ID]['values'][start:stop][:, [i-1 for i in idx]]
+        elif format == 'parquet':
+            pq = _import_optional('pyarrow.parquet', format)
+            names = [columns[0], *(columns[i] for i in idx)]
+            filters = None if t_span is None else [(columns[0], '>=', t0), (columns[0], '<=', t1)]
+            table = pq.read_table(os.path.join(self.path, f'{ID}.parquet'),
+                                  columns=names, filters=filters)
+            data = np.column_stack([table.column(c).to_numpy() for c in names]) \
+                if table.num_rows else np.empty((0, len(names)))
+            t, data = data[:, 0], data[:, 1:]
+        else:
+            if format == 'npy':
+                arr = np.load(os.path.join(self.path, f'{ID}.npy'), mmap_mode='r')
+                get = lambda i, start, stop: arr[start:stop, i]
+            else:
+                pa = _import_optional('pyarrow', format)
+                table = pa.ipc.open_file(pa.memory_map(os.path.join(self.path, f'{ID}.feather'))).read_all()
+                get = lambda i, start, stop: table.column(i).slice(start, stop-start).to_numpy()
+            t = get(0, None, None) if format == 'npy' else table.column(0).to_numpy()
+            start, stop = np.searchsorted(t, t0, 'left'), np.searchsorted(t, t1, 'right')
+            t = np.array(t[start:stop])
+            data = np.column_stack([get(i, start, stop) for i in idx]) if idx \
+                else np.empty((stop-start, 0))
+        return pd.DataFrame(data, index=pd.Index(t, name=columns[0]),
+                            columns=[columns[i] for i in idx])
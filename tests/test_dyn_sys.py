@@ -14,22 +14,57 @@ Please refer to https://github.com/QSD-Group/QSDsan/blob/main/LICENSE.txt
 for license details.
 '''
 
-__all__ = ('test_dyn_sys',)
+import os, tempfile, warnings
+import numpy as np
+from numpy.testing import assert_allclose
 
-def test_dyn_sys():
-    from qsdsan import processes as pc, sanunits as su, set_thermo, System
-    import numpy as np
-    from numpy.testing import assert_allclose
+__all__ = ('test_dyn_sys', 'test_dynamic_influent', 'test_exo_dynamic_vars',
+           'test_scope_buffer', 'test_export_scopes', 'test_checkpoint',
+           'test_pfr', 'test_jacobian_sparsity', 'test_unit_jacobian',
+           'test_steady_state',
+           'test_clarifier_sparsity', 'test_sbr', 'test_controllers',
+           'test_junction_trajectory', 'test_adm1_diagnostics')
+
+t = 1
+t_step = 0.05
+cstr_kwargs = dict(method='BDF', rtol=1e-8, atol=1e-8)
 
+def _create_influent_sys():
+    from qsdsan import processes as pc, sanunits as su, System
     cmps = pc.create_asm1_cmps()
     DI = su.DynamicInfluent('Dyn_Inf')
     S1 = su.Splitter('Split', ins=DI-0, split=0.3, init_with='WasteStream')
     M1 = su.Mixer('Mix', ins=(S1-0, S1-1), outs=('Dyn_Eff'))
     sys = System('test_sys', path=(DI, S1, M1))
     sys.set_dynamic_tracker(DI.outs[0], M1.outs[0])
+    return cmps, sys
+
+def _create_asm1_influent():
+    from qsdsan import processes as pc, WasteStream
+    cmps = pc.create_asm1_cmps()
+    asm1 = pc.ASM1()
+    inf = WasteStream('inf', H2O=1e5, units='kg/hr')
+    inf.set_flow_by_concentration(18446, {'S_S':69.5, 'X_S':202.32, 'X_BH':28.17,
+                                          'S_NH':31.56, 'S_ALK':84}, units=('m3/d', 'mg/L'))
+    return cmps, asm1, inf
+
+init_conc = dict(S_I=30, S_S=5, X_I=1500, X_S=100, X_BH=2500, X_BA=150, X_P=450,
+                 S_O=0.5, S_NO=8, S_NH=2, S_ND=1, X_ND=5, S_ALK=84)
+Vs, DOs = [1000, 1333, 1333], [None, 2.0, None]
+
+def _create_cstrs():
+    from qsdsan import sanunits as su, System
+    cmps, asm1, inf = _create_asm1_influent()
+    tanks = []
+    for i, (V, DO) in enumerate(zip(Vs, DOs)):
+        tanks.append(su.CSTR(f'T{i}', ins=inf.copy() if i == 0 else tanks[-1]-0,
+                             V_max=V, aeration=DO, DO_ID='S_O', suspended_growth_model=asm1))
+        tanks[-1].set_init_conc(**init_conc)
+    return asm1, inf, tanks, System('cstrs', path=tanks)
 
-    t = 1
-    t_step = 0.05
+
+def test_dyn_sys():
+    cmps, sys = _create_influent_sys()
     sys.simulate(t_span=(0,t),
                  t_eval=np.arange(0, t+t_step, t_step))
     dinf = sys.units[0].outs[0]
@@ -37,5 +72,339 @@ def test_dyn_sys():
     assert_allclose(deff.scope.record, dinf.scope.record, rtol=1e-12)
 
 
+def test_dynamic_influent():
+    from qsdsan import sanunits as su
+    cmps, sys = _create_influent_sys()
+    DI = sys.units[0]
+    # Influent values and derivatives are from one vector-valued spline
+    from scipy.interpolate import CubicSpline
+    i_SS = cmps.index('S_S')
+    cs = CubicSpline(DI._data.t, DI._data.S_S, bc_type='periodic')
+    for ti in (0.3, 5.55, 0.31, 13.99, 20.1):
+        assert_allclose(DI.interpolant(ti)[i_SS], cs(ti % DI._t_end), rtol=1e-12)
+        assert_allclose(DI.derivative(ti)[i_SS], cs(ti % DI._t_end, 1), rtol=1e-10)
+
+    # Memory-mapped influent data are interpolated in windows
+    with tempfile.TemporaryDirectory() as tmp:
+        path = su.DynamicInfluent.to_npy(su._dynamic_influent.dynamic_inf_path,
+                                         os.path.join(tmp, 'inf.npy'))
+        DM = su.DynamicInfluent('Mmap_Inf', data_file=path, window_size=100)
+        for ti in (5.55, 0.31, 13.5, 7.0, 2.2):
+            assert_allclose(DM.interpolant(ti), DI.interpolant(ti), rtol=1e-10, atol=1e-10)
+            assert_allclose(DM.derivative(ti), DI.derivative(ti), rtol=1e-8, atol=1e-8)
+        assert len(DM._windows) == DM._N_windows
+        del DM
+
+
+def test_exo_dynamic_vars():
+    # Exogenous dynamic variables are evaluated together and shared by units
+    from qsdsan.utils import ExogenousDynamicVariable as EDV
+    cmps, sys = _create_influent_sys()
+    DI, S1, M1 = sys.units
+    t_data = np.linspace(0, 1, 25)
+    exovars = (EDV('T', t_data, 293+5*np.sin(2*np.pi*t_data)),
+               EDV('pH', t_data, 7+0.1*np.cos(2*np.pi*t_data), interpolator=3),
+               EDV('f', function=lambda t: 2*t))
+    S1.exo_dynamic_vars = M1.exo_dynamic_vars = exovars
+    assert S1._get_exo_group() is M1._get_exo_group()
+    for ti in (0.1, 0.77, 3.33):
+        assert_allclose(M1.eval_exo_dynamic_vars(ti), [v(ti) for v in exovars], rtol=1e-14)
+
+
+def test_scope_buffer():
+    # Records in a ring buffer with the older ones flushed to file should be the same
+    cmps, sys = _create_influent_sys()
+    dinf, deff = sys.units[0].outs[0], sys.units[-1].outs[0]
+    with tempfile.TemporaryDirectory() as tmp:
+        deff.scope.set_buffer(size=8, path=os.path.join(tmp, 'eff.bin'))
+        sys.simulate(t_span=(0,t), t_eval=np.arange(0, t+t_step, t_step))
+        assert_allclose(deff.scope.time_series, dinf.scope.time_series)
+        assert_allclose(deff.scope.record, dinf.scope.record, rtol=1e-12)
+        deff.scope.set_buffer(size=8, dt=0.1)
+        sys.simulate(t_span=(0,t), state_reset_hook='reset_cache')
+        assert len(deff.scope.time_series) <= 8
+        assert (np.diff(deff.scope.time_series) >= 0.1).all()
+        # Recording one of every few evaluations of the rates of change
+        deff.scope.set_buffer(size=1000)
+        sys.simulate(t_span=(0,t), state_reset_hook='reset_cache')
+        n_all = len(deff.scope.time_series)
+        deff.scope.set_buffer(size=1000, every_n_evals=3)
+        sys.simulate(t_span=(0,t), state_reset_hook='reset_cache')
+        assert 0 < len(deff.scope.time_series) < n_all
+
+
+def test_export_scopes():
+    # Exported data can be partially loaded
+    from qsdsan.utils import export_scopes, ScopeResults
+    cmps, sys = _create_influent_sys()
+    dinf, deff = sys.units[0].outs[0], sys.units[-1].outs[0]
+    sys.simulate(t_span=(0,t), t_eval=np.arange(0, t+t_step, t_step))
+    with tempfile.TemporaryDirectory() as tmp:
+        export_scopes(sys, os.path.join(tmp, 'results'), chunk_size=5)
+        results = ScopeResults(os.path.join(tmp, 'results'))
+        assert set(results.IDs) == {dinf.ID, deff.ID}
+        df = results.load(dinf.ID, t_span=(0.2, 0.5), variables=('S_S', 'Q'))
+        ts, record = dinf.scope.time_series, dinf.scope.record
+        mask = (ts >= 0.2) & (ts <= 0.5)
+        assert_allclose(df.index, ts[mask])
+        assert_allclose(df.values, record[mask][:, [cmps.index('S_S'), -1]])
+
+
+def test_checkpoint():
+    from qsdsan.utils import save_checkpoint, load_checkpoint
+    # Checkpoints include the flushed records and keep the reset hook
+    cmps, sys = _create_influent_sys()
+    deff = sys.units[-1].outs[0]
+    with tempfile.TemporaryDirectory() as tmp:
+        deff.scope.set_buffer(size=8, path=os.path.join(tmp, 'eff.bin'))
+        sys.simulate(t_span=(0,t), t_eval=np.arange(0, t+t_step, t_step))
+        record = deff.scope.record.copy()
+        save_checkpoint(sys, os.path.join(tmp, 'sys.npz'))
+        os.remove(os.path.join(tmp, 'eff.bin'))
+        sys.dynsim_kwargs['state_reset_hook'] = 'reset_cache'
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            load_checkpoint(sys, os.path.join(tmp, 'sys.npz'))
+        assert any('state_reset_hook' in str(i.message) for i in w)
+        assert sys.dynsim_kwargs['state_reset_hook'] == 'reset_cache'
+        assert_allclose(deff.scope.record, record)
+
+    # Restarting from a checkpoint should continue the uninterrupted trajectory
+    asm1, inf, tanks, cstrs = _create_cstrs()
+    cstrs.simulate(t_span=(0, 0.1), state_reset_hook='reset_cache', **cstr_kwargs)
+    y_full = cstrs._state.copy()
+    cstrs.simulate(t_span=(0, 0.05), state_reset_hook='reset_cache', **cstr_kwargs)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'cstrs.npz')
+        save_checkpoint(cstrs, path)
+        cstrs.simulate(t_span=(0.05, 0.1), state_reset_hook=None, **cstr_kwargs)
+        y_resumed = cstrs._state.copy()
+        cstrs.simulate(t_span=(0, 0.1), state_reset_hook='reset_cache', **cstr_kwargs)
+        assert load_checkpoint(cstrs, path) == 0.05
+        cstrs.simulate(t_span=(0.05, 0.1), state_reset_hook=None, **cstr_kwargs)
+    assert_allclose(cstrs._state, y_resumed, rtol=1e-10)
+    # within the tolerance of the solver, which is restarted without its history
+    assert_allclose(y_resumed, y_full, rtol=1e-6, atol=1e-6)
+
+
+def test_pfr():
+    # Tanks in series should match a chain of CSTRs
+    from qsdsan import sanunits as su, System
+    asm1, inf, tanks, cstrs = _create_cstrs()
+    PFR = su.PFR('PFR', ins=inf.copy(), N_tanks_in_series=3, V_tanks=Vs,
+                 aeration=DOs, DO_ID='S_O', suspended_growth_model=asm1)
+    PFR.set_init_conc(**init_conc)
+    cstrs.simulate(t_span=(0, 0.05), **cstr_kwargs)
+    System('pfr', path=(PFR,)).simulate(t_span=(0, 0.05), **cstr_kwargs)
+    assert_allclose(PFR._state[:-1], np.concatenate([T._state[:-1] for T in tanks]),
+                    rtol=1e-4, atol=1e-8)
+
+
+def test_jacobian_sparsity():
+    # Sparsity from the flowsheet should cover the finite-difference Jacobian
+    from qsdsan.utils import get_system_jacobian_sparsity
+    asm1, inf, tanks, cstrs = _create_cstrs()
+    cstrs.simulate(t_span=(0, 0.05), **cstr_kwargs)
+    S = get_system_jacobian_sparsity(cstrs).toarray()
+    y = cstrs._state.copy()
+    f0 = cstrs.DAE(0.05, y).copy()
+    J = np.zeros((len(y), len(y)))
+    for j in range(len(y)):
+        dy = 1e-7 * max(1, abs(y[j]))
+        y[j] += dy
+        J[:, j] = (cstrs.DAE(0.05, y) - f0) / dy
+        y[j] -= dy
+    assert not (np.abs(J) > 1e-8 * np.abs(J).max())[~S].any()
+    idx = cstrs._state_idx
+    assert not S[slice(*idx['T2']), slice(*idx['T0'])].any()
+
+
+def test_unit_jacobian():
+    # The analytical Jacobian is only passed by default without dynamic parameters
+    from qsdsan import sanunits as su
+    cmps, asm1, inf = _create_asm1_influent()
+    A = su.CSTR('A', ins=inf, V_max=1000, aeration=2.0, DO_ID='S_O',
+                suspended_growth_model=asm1)
+    A.set_init_conc(**init_conc)
+    sys = A._mock_dyn_sys
+    passed = {}
+    def reset_cache(): # records the keyword arguments before they are reset
+        passed.clear()
+        passed.update(sys.dynsim_kwargs)
+        sys.reset_cache()
+    A.simulate(t_span=(0, 0.05), state_reset_hook=reset_cache, **cstr_kwargs)
+    assert callable(passed.get('jac'))
+    y = A._state.copy()
+    asm1.dynamic_parameter(lambda state_arr: asm1.parameters['Y_H'], symbol='Y_H')
+    A._ODE = A._ODE_jac = None
+    A.simulate(t_span=(0, 0.05), state_reset_hook=reset_cache, **cstr_kwargs)
+    assert 'jac' not in passed and passed.get('jac_sparsity') is not None
+    assert_allclose(A._state, y, rtol=1e-5, atol=1e-8)
+
+
+def test_steady_state():
+    # Steady state should have no rates of change and be written back to the units
+    from qsdsan.utils import solve_steady_state
+    asm1, inf, tanks, cstrs = _create_cstrs()
+    cstrs.simulate(t_span=(0, 0.05), **cstr_kwargs)
+    res = solve_steady_state(cstrs)
+    assert res.success
+    assert_allclose(res.fun/(1+np.abs(res.x)), 0, atol=1e-6)
+    assert_allclose(tanks[-1]._state, res.x[slice(*cstrs._state_idx['T2'])])
+
+
+def test_clarifier_sparsity():
+    # Layers of the clarifier are only coupled with the adjacent ones
+    from qsdsan import sanunits as su
+    asm1, inf, tanks, cstrs = _create_cstrs()
+    cstrs.simulate(t_span=(0, 0.05), **cstr_kwargs)
+    C1 = su.FlatBottomCircularClarifier('C1', ins=tanks[-1]-0, underflow=18446,
+                                        wastage=385, feed_layer=5)
+    C1.N_layer = 6
+    C1.simulate(t_span=(0, 0.05), method='BDF')
+    QC_ins, dQC_ins = C1._ins_QC.copy(), np.zeros_like(C1._ins_QC)
+    y = C1._state.copy()
+    C1.ODE(0, QC_ins, y, dQC_ins)
+    f0 = C1._dstate.copy()
+    J = np.zeros((len(y), len(y)))
+    for j in range(len(y)):
+        dy = 1e-6 * max(1, abs(y[j]))
+        y[j] += dy
+        C1.ODE(0, QC_ins, y, dQC_ins)
+        J[:, j] = (C1._dstate - f0) / dy
+        y[j] -= dy
+    assert not (np.abs(J) > 1e-9)[~C1.jacobian_sparsity.toarray()].any()
+
+
+def test_sbr():
+    # Rate functions of the SBR are compiled once and filling stops when full
+    from qsdsan import sanunits as su
+    cmps, asm1, inf = _create_asm1_influent()
+    SBR = su.SBR('SBR', ins=inf.copy(), DO_ID='S_O', suspended_growth_model=asm1,
+                 surface_area=300, aeration=(None, None, 2.0, 2.0),
+                 operation_cycle=(0.5, 1.5, 2.0, 1.0, 1.0, 0.5, 0.1),
+                 pumped_flow=20000, underflow=400)
+    SBR.simulate()
+    n_funcs = len(SBR._dC_dt_cache)
+    SBR.simulate()
+    assert len(SBR._dC_dt_cache) == n_funcs
+    assert all(key[0] is asm1 for key in SBR._dC_dt_cache)
+    V_total = SBR._init_Vas + (0.5*20000 + 0.1*400)/24
+    assert_allclose(V_total, 0.75*300*4)
+    assert SBR.outs[0].iconc['S_S'] < SBR.ins[0].iconc['S_S']
+
+    # Parameters of the growth model set between runs should be used with the
+    # cached rate functions of stages aerated by a process
+    import qsdsan.processes as pc
+    aer = pc.DiffusedAeration('aer', 'S_O', KLa=240, DOsat=8.0, V=1200)
+    kwargs = dict(DO_ID='S_O', suspended_growth_model=asm1, surface_area=300,
+                  aeration=(None, None, aer, 2.0), cache_state=False,
+                  operation_cycle=(0.5, 1.5, 2.0, 1.0, 1.0, 0.5, 0.1),
+                  pumped_flow=20000, underflow=400)
+    SBR = su.SBR('SBR', ins=inf.copy(), **kwargs)
+    SBR.simulate()
+    eff = SBR.outs[0].conc.copy()
+    asm1.set_parameters(mu_H=0.5)
+    SBR.simulate()
+    assert not np.allclose(SBR.outs[0].conc, eff)
+    fresh = su.SBR('fresh', ins=inf.copy(), **kwargs)
+    fresh.simulate()
+    assert_allclose(SBR.outs[0].conc, fresh.outs[0].conc, rtol=1e-6)
+
+
+def test_controllers():
+    # Controllers act at sampling instants and located crossings
+    from qsdsan.utils import DiscreteController, EventController, simulate_with_controllers
+    cmps, sys = _create_influent_sys()
+    DI, S1, M1 = sys.units
+    i_SS = cmps.index('S_S')
+    S_S_max = max(DI.interpolant(ti)[i_SS] for ti in np.linspace(0, 1, 101))
+    threshold = (DI.interpolant(0)[i_SS] + S_S_max) / 2
+    split = DiscreteController('split', S1, 'split', sample_time=0.25,
+                               law=lambda t: 0.3 if t < 0.5 else 0.6)
+    event = EventController('event', S1, 'split', (DI-0, 'S_S'), threshold, 0.5, direction=1)
+    simulate_with_controllers(sys, [split, event], t_span=(0, 1), max_step=0.01,
+                              state_reset_hook='reset_cache')
+    assert [t for t, v in split.history] == [0, 0.25, 0.5, 0.75]
+    assert_allclose(S1.outs[0].state[-1], 0.6*DI.outs[0].state[-1])
+    t_e = event.history[0][0]
+    assert_allclose(DI.interpolant(t_e)[i_SS], threshold, rtol=1e-8)
+    # solvers with a fixed bound (LSODA) are restarted at each sampling instant
+    simulate_with_controllers(sys, [split], t_span=(0, 1), method='LSODA',
+                              state_reset_hook='reset_cache')
+    assert [t for t, v in split.history] == [0, 0.25, 0.5, 0.75]
+    assert_allclose(S1.outs[0].state[-1], 0.6*DI.outs[0].state[-1])
+
+    # Continuing the solver at the sampling instants follows the restarted trajectory
+    from qsdsan import processes as pc, sanunits as su, System
+    from qsdsan.utils import PIController
+    cmps, asm1, inf = _create_asm1_influent()
+    results = []
+    for warm in (True, False):
+        aer = pc.DiffusedAeration('aer', 'S_O', KLa=84, DOsat=8.0, V=1333)
+        R1 = su.CSTR('R1', ins=inf, V_max=1333, aeration=aer, DO_ID='S_O',
+                     suspended_growth_model=asm1)
+        R1.set_init_conc(**init_conc)
+        DO_ctrl = PIController('DO', aer, 'KLa', measured=(R1-0, 'S_O'), setpoint=2,
+                               Kp=20, Ti=0.01, sample_time=0.005, bounds=(0, 360))
+        simulate_with_controllers(System('sys_R', path=(R1,)), [DO_ctrl], t_span=(0, 0.05),
+                                  warm=warm, state_reset_hook='reset_cache', **cstr_kwargs)
+        results.append((R1._state.copy(), np.array(DO_ctrl.history)))
+    (y_warm, h_warm), (y_restart, h_restart) = results
+    assert_allclose(h_warm, h_restart, rtol=1e-5, atol=1e-6)
+    assert_allclose(y_warm, y_restart, rtol=1e-5, atol=1e-6)
+
+
+def test_junction_trajectory():
+    # ADM-to-ASM conversions of a trajectory match those at each time point,
+    # with warnings counted and reported once after the simulation
+    from qsdsan import processes as pc, sanunits as su, set_thermo, get_thermo, WasteStream
+    pc.create_asm1_cmps()
+    thermo_asm = get_thermo()
+    pc.create_adm1_cmps()
+    adm1 = pc.ADM1()
+    adm = WasteStream('adm', T=308.15)
+    adm.set_flow_by_concentration(178, {'S_su':12, 'S_aa':5, 'S_ac':200, 'S_ch4':55,
+                                        'S_IC':1100, 'S_IN':1300, 'S_I':130, 'X_c':300,
+                                        'X_pr':26, 'X_ac':760, 'X_I':25600}, units=('m3/d', 'mg/L'))
+    set_thermo(thermo_asm)
+    J = su.ADMtoASM('J', upstream=adm, downstream=WasteStream('asm'),
+                    thermo=thermo_asm, adm1_model=adm1)
+    X = adm.conc.value * np.linspace(0.5, 1.5, 5).reshape(-1, 1)
+    Y = J.convert_trajectory(np.column_stack((X, np.ones(5))))
+    assert_allclose(Y[:, :-1], [J.reactions(x) for x in X], rtol=1e-14)
+    assert J.warning_counts['Ignored dissolved H2 or CH4.'] == 10
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter('always')
+        J.simulate()
+    assert sum('Ignored dissolved H2 or CH4.' in str(i.message) for i in w) == 1
+    assert not any(J.warning_counts.values())
+
+
+
+def test_adm1_diagnostics():
+    # Diagnostics are recomputed at the accepted solver steps,
+    # not recorded at the trial states evaluated by the solver
+    from qsdsan import processes as pc, sanunits as su, WasteStream
+    pc.create_adm1_cmps()
+    adm1 = pc.ADM1()
+    inf = WasteStream('ad_inf', T=308.15)
+    inf.set_flow_by_concentration(178, {'S_su':12, 'S_aa':5, 'S_ac':200, 'S_IC':1100,
+                                        'S_IN':1300, 'S_I':130, 'X_c':300, 'X_pr':26,
+                                        'X_ac':760, 'X_I':25600}, units=('m3/d', 'mg/L'))
+    AD = su.AnaerobicCSTR('AD', ins=inf, outs=('biogas', 'ad_eff'), model=adm1)
+    adm1.enable_diagnostics()
+    AD.simulate(t_span=(0, 1), method='BDF')
+    diagnostics = adm1.diagnostics.copy()
+    sol = AD.system.scope.sol
+    assert_allclose(diagnostics['t'], sol.t)
+    root = adm1.rate_function.params['root']
+    pHs = []
+    for y in sol.y.T:
+        adm1.rate_function(np.append(y, AD.T))
+        pHs.append(root.data['pH'])
+    assert_allclose(diagnostics['pH'], pHs, rtol=1e-12)
+    adm1.disable_diagnostics()
+
 if __name__ == '__main__':
-    test_dyn_sys()
\ No newline at end of file
+    for name in __all__: globals()[name]()
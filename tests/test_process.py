@@ -10,17 +10,27 @@ Please refer to https://github.com/QSD-Group/QSDsan/blob/main/LICENSE.txt
 for license details.
 '''
 
+import os, warnings
+import numpy as np
+from numpy.testing import assert_allclose
+from math import isclose
 
+__all__ = ('test_process', 'test_parsed_processes_cache', 'test_fused_rate_function',
+           'test_sparse_stoichiometry', 'test_numba_backend', 'test_batch_eval',
+           'test_jacobian', 'test_compiled_processes_cache', 'test_cstr_rhs',
+           'test_adm1_kinetics', 'test_adm1_diagnostics')
 
-__all__ = ('test_process',)
-
-def test_process():
-    import pytest, os, qsdsan.processes as pc
-    from sympy import symbols, Eq
-    from sympy.parsing.sympy_parser import parse_expr
-    from math import isclose
-    from qsdsan import set_thermo, Components, Process, Processes, CompiledProcesses
+asm2d_params = ('f_SI', 'Y_H', 'f_XI', 'Y_PO4', 'Y_PHA', 'Y_A',
+                'K_h', 'eta_NO3', 'eta_fe', 'K_O2', 'K_NO3', 'K_X',
+                'mu_H', 'q_fe', 'eta_NO3_deni', 'b_H', 'K_F', 'K_fe', 'K_A',
+                'K_NH4', 'K_P', 'K_ALK', 'q_PHA', 'q_PP', 'mu_PAO', 'b_PAO',
+                'b_PP', 'b_PHA', 'K_PS', 'K_PP', 'K_MAX', 'K_IPP', 'K_PHA',
+                'mu_AUT', 'b_AUT', 'K_O2_AUT', 'K_NH4_AUT', 'K_ALK_2',
+                'k_PRE', 'k_RED')
+asm2d_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'ASM2d_original.tsv')
 
+def _create_asm2d_cmps():
+    from qsdsan import set_thermo, Components
     cmps = Components.load_default()
 
     S_A = cmps.S_Ac.copy('S_A')
@@ -59,6 +69,16 @@ def test_process():
 
     cmps_asm2d.compile()
     set_thermo(cmps_asm2d)
+    return cmps_asm2d
+
+
+
+def test_process():
+    import pytest, qsdsan.processes as pc
+    from sympy import symbols, Eq
+    from sympy.parsing.sympy_parser import parse_expr
+    from qsdsan import Process, Processes, CompiledProcesses
+    _create_asm2d_cmps()
 
     p1 = Process('aero_hydrolysis',
                  'X_S -> [1-f_SI]S_F + [f_SI]S_I + [?]S_NH4 + [?]S_PO4 + [?]S_ALK',
@@ -91,20 +111,12 @@ def test_process():
                  conserved_for=('COD', 'N', 'P', 'NOD', 'charge'))
 
     PAO_anox_processes = Processes([p12, p14])
-    assert PAO_anox_processes.PAO_anox_growth.ref_component == X_PAO.ID
+    assert PAO_anox_processes.PAO_anox_growth.ref_component == 'X_PAO'
     with pytest.raises(AttributeError):
         print(PAO_anox_processes.production_rates)
 
-    params = ('f_SI', 'Y_H', 'f_XI', 'Y_PO4', 'Y_PHA', 'Y_A',
-              'K_h', 'eta_NO3', 'eta_fe', 'K_O2', 'K_NO3', 'K_X',
-              'mu_H', 'q_fe', 'eta_NO3_deni', 'b_H', 'K_F', 'K_fe', 'K_A',
-              'K_NH4', 'K_P', 'K_ALK', 'q_PHA', 'q_PP', 'mu_PAO', 'b_PAO',
-              'b_PP', 'b_PHA', 'K_PS', 'K_PP', 'K_MAX', 'K_IPP', 'K_PHA',
-              'mu_AUT', 'b_AUT', 'K_O2_AUT', 'K_NH4_AUT', 'K_ALK_2',
-              'k_PRE', 'k_RED')
-
-    path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'ASM2d_original.tsv')
-    asm2d = Processes.load_from_file(path,
+    params = asm2d_params
+    asm2d = Processes.load_from_file(asm2d_path,
                                      conserved_for=('COD', 'N', 'P', 'charge'),
                                      parameters=params,
                                      compile=False)
@@ -117,7 +129,227 @@ def test_process():
     pc.create_adm1_cmps()
     pc.create_asm1_cmps()
     pc.create_asm2d_cmps()
-        
+
+
+def _asm1_state(seed=0):
+    import qsdsan.processes as pc
+    pc.create_asm1_cmps()
+    asm1 = pc.ASM1()
+    state_arr = np.random.default_rng(seed).uniform(0.5, 50, len(asm1._components)+1)
+    return asm1, state_arr
+
+def _asm1_cstr(asm1, aeration, ID='A'):
+    from qsdsan import sanunits as su, WasteStream
+    inf = WasteStream('inf', H2O=1e5, units='kg/hr')
+    inf.set_flow_by_concentration(1e4, {'S_S':50, 'X_S':200, 'X_BH':30, 'S_NH':25, 'S_ALK':84},
+                                  units=('m3/d', 'mg/L'))
+    A = su.CSTR(ID, ins=inf, V_max=1000, aeration=aeration,
+                DO_ID='S_O', suspended_growth_model=asm1)
+    A._run()
+    A._init_state()
+    QC_ins = np.atleast_2d(np.append(inf.conc, 1e4))
+    return A, QC_ins
+
+def _adm1_state():
+    import qsdsan.processes as pc
+    cmps_adm1 = pc.create_adm1_cmps()
+    adm1 = pc.ADM1()
+    state_arr = np.append(np.full(len(cmps_adm1), 0.1), [1e-5, 0.5, 0.5, 100, 308.15])
+    return adm1, state_arr
+
+
+def test_parsed_processes_cache():
+    import pytest, tempfile, qsdsan._process as _process
+    from qsdsan import Processes
+    _create_asm2d_cmps()
+    kwargs = dict(conserved_for=('COD', 'N', 'P', 'charge'),
+                  parameters=asm2d_params, compile=False)
+    # cache into a temporary directory to leave the user cache untouched
+    cache_path = _process.cache_path
+    with tempfile.TemporaryDirectory() as tmp:
+        _process.cache_path = tmp
+        try:
+            asm2d = Processes.load_from_file(asm2d_path, **kwargs)
+            # Loading again should reuse the cached stoichiometry and rate equations
+            data = _process.load_data(path=asm2d_path, index_col=None, na_values=0)
+            key = _process._parsed_processes_key(data, _process._load_components(None),
+                                                 kwargs['conserved_for'], asm2d_params)
+            cache_file = os.path.join(tmp, 'processes', f'{key}.pckl')
+            assert os.path.isfile(cache_file)
+            cached = Processes.load_from_file(asm2d_path, **kwargs)
+            for p, p_cached in zip(asm2d, cached):
+                assert p.ID == p_cached.ID
+                assert list(p._stoichiometry) == list(p_cached._stoichiometry)
+                assert p._rate_equation == p_cached._rate_equation
+            # A corrupted cache should be discarded with a warning and parsed again
+            with open(cache_file, 'wb') as file: file.write(b'not a pickle')
+            with pytest.warns(UserWarning, match='corrupted'):
+                reparsed = Processes.load_from_file(asm2d_path, **kwargs)
+            assert [p._rate_equation for p in reparsed] == [p._rate_equation for p in asm2d]
+            assert os.path.isfile(cache_file) # cached again
+        finally:
+            _process.cache_path = cache_path
+
+
+def test_fused_rate_function():
+    import pytest, qsdsan.processes as pc
+    # Fused rate function should agree with the rate functions of individual processes
+    asm1, state_arr = _asm1_state()
+    rhos = [p.rate_function.function(state_arr, p.rate_function.params) for p in asm1]
+    assert_allclose(asm1.rate_function(state_arr), rhos, rtol=1e-10)
+    asm1.set_parameters(mu_H=2.0)
+    rhos = [p.rate_function.function(state_arr, p.rate_function.params) for p in asm1]
+    assert_allclose(asm1.rate_function(state_arr), rhos, rtol=1e-10)
+    # parameters set through an individual process should also be reflected
+    asm1.tuple[0].set_parameters(mu_H=3.0, Y_H=0.6)
+    rhos = [p.rate_function.function(state_arr, p.rate_function.params) for p in asm1]
+    assert_allclose(asm1.rate_function(state_arr), rhos, rtol=1e-10)
+    M = asm1.stoichio_eval()
+    assert isclose(M[0, asm1._components.index('S_S')], -1/0.6)
+    # parameters given to the fused function should override the indexed values
+    p0 = asm1.tuple[0]
+    rho0 = p0.rate_function.function(state_arr, {**p0.rate_function.params, 'mu_H': 5.0})
+    assert isclose(asm1.rate_function.function(state_arr, {'mu_H': 5.0})[0], rho0)
+    asm1.rate_function.set_params(mu_H=5.0)
+    assert isclose(asm1.rate_function(state_arr)[0], rho0)
+    asm1.rate_function.params.clear()
+    with pytest.raises(TypeError):
+        asm1.rate_function.function(state_arr, {'not_a_param': 1.0})
+
+    # Fused functions should be dropped once the kinetics of a process is replaced
+    asm1 = pc.ASM1()
+    asm1.set_backend('numba')
+    asm1.rate_function(state_arr)
+    asm1.tuple[0].rate_function = lambda state_arr: 1.0
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        assert asm1.backend == 'numpy'
+    assert asm1.rate_function(state_arr)[0] == 1.0
+
+
+def test_sparse_stoichiometry():
+    # Sparse stoichiometry should only hold the nonzero coefficients
+    asm1, state_arr = _asm1_state()
+    M = asm1.stoichio_csr
+    stoichio = asm1.stoichiometry.to_numpy(dtype=float)
+    assert M.nnz == np.count_nonzero(stoichio)
+    assert_allclose(M.toarray(), stoichio)
+    # while the stoichiometry is still evaluated as a dense array
+    assert isinstance(asm1.stoichio_eval(), np.ndarray)
+    assert_allclose(asm1.stoichio_eval(), stoichio)
+
+
+def test_numba_backend():
+    # Numba-compiled production rates should agree with the numpy backend
+    asm1, state_arr = _asm1_state()
+    rs = asm1.production_rates_eval(state_arr).copy()
+    asm1.set_backend('numba')
+    assert asm1.backend == 'numba'
+    assert_allclose(asm1.production_rates_eval(state_arr), rs, rtol=1e-10)
+    asm1.set_backend('numpy')
+
+
+def test_batch_eval():
+    # Batched evaluation should agree with evaluation of individual states
+    asm1, state_arr = _asm1_state()
+    state_mat = np.random.default_rng(1).uniform(0.5, 50, (5, len(state_arr)))
+    assert_allclose(asm1.production_rates_batch_eval(state_mat),
+                    [asm1.production_rates_eval(y) for y in state_mat], rtol=1e-10)
+
+
+def test_jacobian():
+    # Analytical Jacobian should agree with finite differences
+    asm1, state_arr = _asm1_state()
+    rs = asm1.production_rates_eval(state_arr).copy()
+    J = asm1.production_rates_jacobian_eval(state_arr)
+    assert_allclose(asm1.production_rates_jacobian_eval(state_arr, sparse=True).toarray(), J)
+    k = asm1._components.index('S_S')
+    dx = 1e-6 * state_arr[k]
+    perturbed = state_arr.copy()
+    perturbed[k] += dx
+    dr = (asm1.production_rates_eval(perturbed) - rs) / dx
+    assert_allclose(J[:, k], dr, rtol=1e-4, atol=1e-8)
+
+
+def test_compiled_processes_cache():
+    import qsdsan.processes as pc
+    from qsdsan import CompiledProcesses
+    # Compiled processes should be reused from the bounded cache
+    asm1, state_arr = _asm1_state()
+    CompiledProcesses.clear_cache()
+    aer = pc.DiffusedAeration('aer', 'S_O', KLa=240, DOsat=8.0, V=1333)
+    combined = CompiledProcesses((*asm1.tuple, aer))
+    assert CompiledProcesses((*asm1.tuple, aer)) is combined
+    info = CompiledProcesses.cache_info()
+    assert (info['hits'], info['misses'], info['size']) == (1, 1, 1)
+    CompiledProcesses.set_cache_size(0)
+    assert CompiledProcesses.cache_info()['evictions'] == 1
+    assert CompiledProcesses((*asm1.tuple, aer)) is combined # still alive
+    CompiledProcesses.set_cache_size(32)
+    CompiledProcesses.clear_cache()
+    assert CompiledProcesses.cache_info()['alive'] == 0
+
+    # Parameters of the growth model set between compilations should be used
+    A, QC_ins = _asm1_cstr(asm1, aer)
+    dstates = []
+    for mu_H in (3.0, 1.0):
+        asm1.set_parameters(mu_H=mu_H)
+        A._compile_ODE()
+        A.ODE(0, QC_ins, state_arr.copy(), np.zeros_like(QC_ins))
+        dstates.append(A._dstate.copy())
+    assert CompiledProcesses((*asm1.tuple, aer))._parameters['mu_H'] == 1.0
+    assert not np.allclose(*dstates)
+
+
+def test_cstr_rhs():
+    import qsdsan.processes as pc
+    # A CSTR should compile its whole right-hand side with the numba backend
+    asm1, state_arr = _asm1_state()
+    aer = pc.DiffusedAeration('aer', 'S_O', KLa=240, DOsat=8.0, V=1333)
+    dstates = []
+    for backend in ('numpy', 'numba'):
+        asm1.set_backend(backend)
+        for aeration in (aer, 2.0):
+            A, QC_ins = _asm1_cstr(asm1, aeration)
+            A.ODE(0, QC_ins, state_arr.copy(), np.zeros_like(QC_ins))
+            dstates.append(A._dstate.copy())
+    asm1.set_backend('numpy')
+    assert_allclose(dstates[2:], dstates[:2], rtol=1e-10)
+
+
+def test_adm1_kinetics():
+    # Compiled ADM1 kinetics should solve the charge balance for pH
+    from qsdsan.processes._adm1 import acid_base_rxn, solve_h_ion
+    weak_acids = np.array([0.04, 0.02, 0.13, 0.15, 3e-3, 2e-4, 1.5e-4, 1e-4])
+    Kas = 10**(-np.array([14, 9.25, 6.35, 4.76, 4.88, 4.82, 4.86]))
+    for h_guess in (1e-7, 1e-2, 1e-13):
+        h = solve_h_ion(weak_acids, Kas, h_guess)
+        assert abs(acid_base_rxn(h, weak_acids, Kas)) < 1e-12
+    adm1, state_arr = _adm1_state()
+    rhos = adm1.rate_function(state_arr)
+    assert np.isfinite(rhos).all() and rhos[:19].min() >= 0
+    # in-place setters should take effect after the parameters were packed
+    packed = adm1.rate_function.params.packed
+    for k, arr in adm1.rate_function.params.items():
+        if isinstance(arr, np.ndarray): assert any(arr is i for i in packed)
+    rhos = rhos.copy()
+    adm1.set_pH_inhibit_bounds(10, lower=13, upper=14)
+    assert adm1.rate_function(state_arr)[10] < rhos[10]
+
+
+def test_adm1_diagnostics():
+    # Diagnostics are off by default, and recorded at increasing time points when enabled
+    adm1, state_arr = _adm1_state()
+    assert adm1.diagnostics is None
+    root = adm1.rate_function.params['root']
+    adm1.enable_diagnostics(size=3)
+    for t in (0, 1, 2, 1.5, 3, 4):
+        adm1.rate_function(state_arr)
+        root(t)
+    assert_allclose(adm1.diagnostics['t'], [1.5, 3, 4])
+    assert isclose(adm1.diagnostics['pH'][-1], root.data['pH'])
+    adm1.disable_diagnostics()
+
 
 if __name__ == '__main__':
-    test_process()
\ No newline at end of file
+    for name in __all__: globals()[name]()
@@ -13,7 +13,7 @@ Please refer to https://github.com/QSD-Group/QSDsan/blob/master/LICENSE.txt
 for license details.
 '''
 
-__all__ = ('test_waste_stream',)
+__all__ = ('test_waste_stream', 'test_inlet_state')
 
 def test_waste_stream():
     import pytest, numpy as np
@@ -57,5 +57,50 @@ def test_waste_stream():
     assert_allclose(np.max(np.abs(diff)), 0, atol=1e-2)
 
 
+def test_inlet_state():
+    import numpy as np
+    from numpy.testing import assert_allclose
+    from qsdsan import set_thermo, Components, WasteStream, sanunits as su
+
+    components = Components.load_default()
+    set_thermo(components)
+
+    # Dynamic state of an inlet is a view into the inlet array of its sink
+    ws8, ws9 = WasteStream('ws8', H2O=1000), WasteStream('ws9', H2O=1000)
+    M1 = su.Mixer('M1', ins=(ws8, ws9))
+    M1._init_dynamic()
+    ws9.state = np.arange(len(components)+1.)
+    assert np.shares_memory(ws9.state, M1._ins_QC)
+    assert_allclose(M1._ins_QC[1], ws9.state)
+    M1.ins[:] = (ws9, ws8)
+    ws9.state = 1.
+    assert (M1._ins_QC[0] == 1).all()
+    M1._init_dynamic()
+    assert np.shares_memory(ws9.dstate, M1._ins_dQC)
+
+    # Disconnected and reconnected streams write into the arrays of the new inlet
+    ws10 = WasteStream('ws10', H2O=1000)
+    M2 = su.Mixer('M2', ins=(ws10, WasteStream('ws11', H2O=1000)))
+    M2._init_dynamic()
+    ws9.state = 2.
+    M1.ins[0] = WasteStream('ws12', H2O=1000)
+    assert ws9.sink is None
+    M2.ins[1] = ws9
+    ws9.state = 3.
+    assert (M2._ins_QC[1] == 3).all()
+    assert (M1._ins_QC[0] == 2).all()
+    M2.ins[1] = None
+    M1.ins[0] = ws9
+    ws9.dstate = 4.
+    assert (M1._ins_dQC[0] == 4).all()
+    assert not (M2._ins_dQC[1] == 4).any()
+    # the stream moved to another inlet of the same sink
+    M1.ins[:] = (ws8, ws9)
+    ws9._init_state()
+    assert_allclose(M1._ins_QC[1], ws9.state)
+    assert_allclose(M1._ins_QC[1, -1], ws9.get_total_flow('m3/d'))
+
+
 if __name__ == '__main__':
-    test_waste_stream()
\ No newline at end of file
+    test_waste_stream()
+    test_inlet_state()